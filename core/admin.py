@@ -53,8 +53,8 @@ class ConversationAdmin(admin.ModelAdmin):
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ('sender', 'conversation', 'content', 'created_at', 'is_read')
-    list_filter = ('created_at', 'is_read')
+    list_display = ('sender', 'conversation', 'content', 'created_at')
+    list_filter = ('created_at',)
 
 
 # ==================== GROUP ADMIN ====================
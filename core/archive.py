@@ -0,0 +1,446 @@
+"""
+Monthly partitions and archives for messages and notifications.
+
+Both tables only grow, so their rows are grouped by calendar month (UTC)
+of ``created_at``:
+
+* Postgres: ``partition_tables()`` (``archive_partitions partition``, run
+  once by hand, in a maintenance window: it rewrites both tables) turns
+  them into tables range-partitioned by month, ``core_message_p202501`` and
+  so on, plus a ``_default`` partition so inserts never fail if maintenance
+  lapses. The primary key becomes ``(id, created_at)``, as Postgres requires
+  the partition column in it; ids still come from one sequence, so ``id``
+  stays unique, and no foreign key may point at these tables.
+  ``unpartition_tables()`` turns them back. ``ensure_partitions()`` creates
+  upcoming months ahead of time, and gives any month found in the default
+  partition its own partition, moving those rows into it. Archiving a
+  month drops a whole partition instead of deleting rows. Until the tables
+  are partitioned, archiving deletes rows as on SQLite.
+* SQLite has no partitioning; ``rotate()`` moves rows older than
+  ``HOT_MONTHS`` into ``core_message_archive`` / ``core_notification_archive``
+  so the tables the app queries stay small. Rotated rows are no longer
+  shown anywhere until restored.
+
+Unread counts (notification badge, inbox recounts) only look at the hot
+window, ``created_at >= hot_since()``, so Postgres prunes the older
+partitions for those scans. History is not bounded: conversations page
+back by message id as far as the rows go.
+
+``archive_month()`` writes one month of a table to a gzipped JSONL file under
+``ARCHIVE_DIR`` and removes it from the database; ``restore_month()`` loads
+those files back. Archived messages keep their attachments (the stored
+files stay referenced), so a restored message is complete.
+"""
+import glob
+import gzip
+import json
+import os
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction, models
+
+from . import notifications
+from .models import Message, Notification
+
+
+MODELS = {'message': Message, 'notification': Notification}
+HOT_MONTHS = getattr(settings, 'ARCHIVE_HOT_MONTHS', 12)
+ARCHIVE_DIR = getattr(settings, 'ARCHIVE_DIR', os.path.join(settings.BASE_DIR, 'archives'))
+MONTHS_AHEAD = 3
+BATCH_SIZE = 1000
+
+
+def month_start(year, month):
+    return datetime(year, month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(moment, months):
+    index = moment.year * 12 + moment.month - 1 + months
+    return month_start(index // 12, index % 12 + 1)
+
+
+def parse_month(value):
+    """'2025-01' -> first instant of that month (UTC)"""
+    try:
+        year, month = value.split('-')
+        return month_start(int(year), int(month))
+    except ValueError:
+        raise ValueError(f'Expected a month as YYYY-MM, got {value!r}')
+
+
+def partition_name(table, start):
+    return f'{table}_p{start:%Y%m}'
+
+
+def archive_table(table):
+    return f'{table}_archive'
+
+
+def _db_datetime(value):
+    return connection.ops.adapt_datetimefield_value(value)
+
+
+def _columns(model):
+    return [field.column for field in model._meta.concrete_fields]
+
+
+def _add_missing_columns(cursor, model):
+    """SQLite: give the archive table any column added to the model since it was created"""
+    table = archive_table(model._meta.db_table)
+    present = {column.name for column in connection.introspection.get_table_description(cursor, table)}
+    for column in _columns(model):
+        if column not in present:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column}')
+
+
+def hot_since(now=None):
+    """Start of the window the app reads: the first of the month HOT_MONTHS ago (UTC)"""
+    return add_months(now or datetime.now(dt_timezone.utc), -HOT_MONTHS)
+
+
+def _partition_exists(cursor, name):
+    cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [name])
+    return cursor.fetchone()[0]
+
+
+def is_partitioned(cursor, table):
+    cursor.execute('SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))', [table])
+    return cursor.fetchone()[0]
+
+
+def _create_partition(cursor, table, start):
+    """
+    Add the partition for the month starting at `start`. Rows of that month
+    already in the default partition (which would make a plain
+    ``PARTITION OF`` fail) are moved into the new table before it is attached.
+    """
+    name = partition_name(table, start)
+    bounds = [start, add_months(start, 1)]
+    cursor.execute(f'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM {table}_default WHERE created_at >= %s AND created_at < %s RETURNING *) '
+        f'INSERT INTO {name} SELECT * FROM moved',
+        bounds
+    )
+    cursor.execute(f'ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)', bounds)
+    return name
+
+
+# ==================== PARTITIONING (POSTGRES) ====================
+
+def _rebuild(cursor, table, partitioned):
+    """
+    Recreate `table` range-partitioned by month of created_at (or back as a
+    plain table) with the same columns, indexes and foreign keys, and copy
+    its rows over.
+
+    The partitioned table takes its ids from a sequence default rather than
+    an identity column, which Postgres only allows on partitioned tables
+    from version 17; the plain table gets an identity column again, as
+    Django creates them.
+    """
+    legacy = f'{table}_unpartitioned' if partitioned else f'{table}_partitioned'
+    cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')  # A table with pending foreign key checks can't be altered
+    cursor.execute(
+        "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s",
+        [table]
+    )
+    indexes = cursor.fetchall()
+    cursor.execute(
+        "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype IN ('p', 'f')",
+        [table]
+    )
+    constraints = cursor.fetchall()
+    cursor.execute(f'SELECT MIN(created_at) FROM {table}')
+    oldest = cursor.fetchone()[0]
+
+    primary_key = next(name for name, kind, _ in constraints if kind == 'p')
+    foreign_keys = [(name, definition) for name, kind, definition in constraints if kind == 'f']
+
+    cursor.execute(f'ALTER TABLE {table} RENAME TO {legacy}')
+    for name, _ in foreign_keys:
+        cursor.execute(f'ALTER TABLE {legacy} DROP CONSTRAINT {name}')
+    cursor.execute(f'ALTER TABLE {legacy} DROP CONSTRAINT {primary_key}')
+    for name, _ in indexes:
+        if name != primary_key:
+            cursor.execute(f'DROP INDEX {name}')
+
+    if partitioned:
+        sequence = f'{table}_partitioned_id_seq'
+        cursor.execute(f'CREATE TABLE {table} (LIKE {legacy} INCLUDING CONSTRAINTS) PARTITION BY RANGE (created_at)')
+        cursor.execute(f'CREATE SEQUENCE {sequence} OWNED BY {table}.id')
+        cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+        cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, created_at)')
+        current = add_months(datetime.now(dt_timezone.utc), 0)
+        start = add_months(oldest, 0) if oldest else current
+        while start <= add_months(current, MONTHS_AHEAD):
+            cursor.execute(
+                f'CREATE TABLE {partition_name(table, start)} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)',
+                [start, add_months(start, 1)]
+            )
+            start = add_months(start, 1)
+        cursor.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+    else:
+        cursor.execute(f'CREATE TABLE {table} (LIKE {legacy} INCLUDING CONSTRAINTS)')
+        cursor.execute(f'ALTER TABLE {table} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+        cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id)')
+
+    cursor.execute(f'INSERT INTO {table} SELECT * FROM {legacy}')
+    cursor.execute(
+        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {table}"
+    )
+    for name, definition in indexes:
+        if name != primary_key:
+            cursor.execute(definition)  # Index definitions name the table, which is `table` again
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} {definition}')
+    cursor.execute(f'DROP TABLE {legacy}')  # Takes the old id sequence with it
+
+
+def _referenced_by(cursor, table):
+    cursor.execute(
+        "SELECT conrelid::regclass::text FROM pg_constraint WHERE confrelid = %s::regclass AND contype = 'f'",
+        [table]
+    )
+    return [name for name, in cursor.fetchall()]
+
+
+def partition_tables():
+    """Postgres: rebuild the tables not yet partitioned as monthly partitions; returns the tables rebuilt"""
+    if connection.vendor != 'postgresql':
+        raise ValueError('Only Postgres tables can be partitioned; SQLite rotates old rows instead')
+    rebuilt = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model in MODELS.values():
+            table = model._meta.db_table
+            if is_partitioned(cursor, table):
+                continue
+            referencing = _referenced_by(cursor, table)
+            if referencing:
+                # Their keys would have to include created_at
+                raise ValueError(f'{table} is referenced by a foreign key from {", ".join(referencing)}')
+            _rebuild(cursor, table, partitioned=True)
+            rebuilt.append(table)
+    return rebuilt
+
+
+def unpartition_tables():
+    """Postgres: turn partitioned tables back into plain ones; returns the tables rebuilt"""
+    if connection.vendor != 'postgresql':
+        return []
+    rebuilt = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model in MODELS.values():
+            table = model._meta.db_table
+            if is_partitioned(cursor, table):
+                _rebuild(cursor, table, partitioned=False)
+                rebuilt.append(table)
+    return rebuilt
+
+
+# ==================== PARTITION MAINTENANCE ====================
+
+def ensure_partitions(now=None, months_ahead=MONTHS_AHEAD):
+    """
+    Postgres: create this month's partition and the next few, plus one for
+    every month with rows in the default partition; returns the names created
+    """
+    if connection.vendor != 'postgresql':
+        return []
+    current = add_months(now or datetime.now(dt_timezone.utc), 0)
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model in MODELS.values():
+            table = model._meta.db_table
+            if not is_partitioned(cursor, table):
+                continue
+            cursor.execute(
+                f"SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC') FROM {table}_default"
+            )
+            stray = {month_start(value.year, value.month) for value, in cursor.fetchall()}
+            upcoming = {add_months(current, offset) for offset in range(months_ahead + 1)}
+            for start in sorted(stray | upcoming):
+                if not _partition_exists(cursor, partition_name(table, start)):
+                    created.append(_create_partition(cursor, table, start))
+    return created
+
+
+def rotate(hot_months=HOT_MONTHS, now=None):
+    """SQLite: move rows older than `hot_months` months into the archive tables; returns rows moved per kind"""
+    if connection.vendor != 'sqlite':
+        return {}
+    cutoff = add_months(now or datetime.now(dt_timezone.utc), -hot_months)
+    moved = {}
+    for kind, model in MODELS.items():
+        table = model._meta.db_table
+        columns = ', '.join(_columns(model))
+        with transaction.atomic(), connection.cursor() as cursor:
+            _add_missing_columns(cursor, model)
+            if model is Notification:
+                notifications.invalidate_unread_for(Notification.objects.filter(created_at__lt=cutoff))
+            cursor.execute(
+                f'INSERT INTO {archive_table(table)} ({columns}) SELECT {columns} FROM {table} WHERE created_at < %s',
+                [_db_datetime(cutoff)]
+            )
+            cursor.execute(f'DELETE FROM {table} WHERE created_at < %s', [_db_datetime(cutoff)])
+            moved[kind] = cursor.rowcount
+    return moved
+
+
+# ==================== ARCHIVE / RESTORE ====================
+
+def _archive_path(table, start, part=0):
+    suffix = f'.{part}' if part else ''
+    return os.path.join(ARCHIVE_DIR, table, f'{start:%Y-%m}{suffix}.jsonl.gz')
+
+
+def archived_files(table, start):
+    return sorted(glob.glob(os.path.join(ARCHIVE_DIR, table, f'{start:%Y-%m}*.jsonl.gz')))
+
+
+def _sources(table):
+    if connection.vendor == 'sqlite':
+        return [table, archive_table(table)]
+    return [table]
+
+
+def oldest_month(kind):
+    """First month with rows of this kind in the database (including SQLite archive tables), or None"""
+    table = MODELS[kind]._meta.db_table
+    oldest = None
+    with connection.cursor() as cursor:
+        for source in _sources(table):
+            cursor.execute(f'SELECT MIN(created_at) FROM {source}')
+            value = cursor.fetchone()[0]
+            if value is not None:
+                value = models.DateTimeField().to_python(value)
+                if value.tzinfo is None:
+                    value = value.replace(tzinfo=dt_timezone.utc)
+                oldest = value if oldest is None else min(oldest, value)
+    return add_months(oldest, 0) if oldest else None
+
+
+def _to_json(field, value):
+    if value is None:
+        return None
+    if isinstance(field, models.JSONField) and isinstance(value, str):
+        return json.loads(value)
+    if isinstance(field, models.DateTimeField):
+        value = field.to_python(value)
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=dt_timezone.utc)  # Stored as UTC
+    return value
+
+
+def archive_month(kind, start):
+    """Write one month of rows to a gzipped JSONL file and delete them; returns the row count"""
+    model = MODELS[kind]
+    table = model._meta.db_table
+    fields = model._meta.concrete_fields
+    columns = ', '.join(_columns(model))
+    end = add_months(start, 1)
+    bounds = [_db_datetime(start), _db_datetime(end)]
+
+    path = _archive_path(table, start)
+    part = 0
+    while os.path.exists(path):  # Never overwrite an earlier archive of the same month
+        part += 1
+        path = _archive_path(table, start, part)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    count = 0
+    with transaction.atomic():
+        with gzip.open(f'{path}.tmp', 'wt', encoding='utf-8') as f, connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                _add_missing_columns(cursor, model)
+            for source in _sources(table):
+                cursor.execute(
+                    f'SELECT {columns} FROM {source} WHERE created_at >= %s AND created_at < %s ORDER BY id',
+                    bounds
+                )
+                while True:
+                    rows = cursor.fetchmany(BATCH_SIZE)
+                    if not rows:
+                        break
+                    for row in rows:
+                        record = {field.column: _to_json(field, value) for field, value in zip(fields, row)}
+                        f.write(json.dumps(record, cls=DjangoJSONEncoder) + '\n')
+                    count += len(rows)
+
+        if not count:
+            os.remove(f'{path}.tmp')
+        else:
+            os.replace(f'{path}.tmp', path)
+
+        if model is Notification:
+            notifications.invalidate_unread_for(Notification.objects.filter(created_at__gte=start, created_at__lt=end))
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql' and _partition_exists(cursor, partition_name(table, start)):
+                name = partition_name(table, start)
+                cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {name}')
+                cursor.execute(f'DROP TABLE {name}')
+            for source in _sources(table):
+                cursor.execute(f'DELETE FROM {source} WHERE created_at >= %s AND created_at < %s', bounds)
+    return count
+
+
+def _existing_keys(model, records):
+    """For each foreign key, the referenced ids that still exist"""
+    existing = {}
+    for field in model._meta.concrete_fields:
+        if field.is_relation:
+            ids = {record[field.column] for record in records if record[field.column] is not None}
+            existing[field.column] = set(
+                field.related_model._base_manager.filter(pk__in=ids).values_list('pk', flat=True)
+            )
+    return existing
+
+
+def _insert(model, records):
+    """Insert archived rows that still fit (their users, conversations... exist); returns (inserted, skipped)"""
+    table = model._meta.db_table
+    fields = model._meta.concrete_fields
+    existing = _existing_keys(model, records)
+    rows = []
+    for record in records:
+        if any(record[column] is not None and record[column] not in ids for column, ids in existing.items()):
+            continue  # Refers to something deleted since it was archived
+        rows.append([field.get_db_prep_value(field.to_python(record[field.column]), connection) for field in fields])
+    if rows:
+        placeholders = ', '.join(['%s'] * len(fields))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {table} ({", ".join(_columns(model))}) VALUES ({placeholders}) ON CONFLICT DO NOTHING',
+                rows
+            )
+    return len(rows), len(records) - len(rows)
+
+
+def restore_month(kind, start):
+    """Load a month's archive files back into the table; returns (rows restored, rows skipped)"""
+    model = MODELS[kind]
+    table = model._meta.db_table
+    restored = skipped = 0
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                if is_partitioned(cursor, table) and not _partition_exists(cursor, partition_name(table, start)):
+                    _create_partition(cursor, table, start)
+        for path in archived_files(table, start):
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                batch = []
+                for line in f:
+                    batch.append(json.loads(line))
+                    if len(batch) >= BATCH_SIZE:
+                        inserted, missing = _insert(model, batch)
+                        restored, skipped, batch = restored + inserted, skipped + missing, []
+                inserted, missing = _insert(model, batch)
+                restored, skipped = restored + inserted, skipped + missing
+        if model is Notification:
+            notifications.invalidate_unread_for(Notification.objects.filter(
+                created_at__gte=start, created_at__lt=add_months(start, 1)
+            ))
+    return restored, skipped
@@ -0,0 +1,215 @@
+"""
+People typeahead for the navbar search box.
+
+Each worker process keeps an in-memory prefix index: a sorted list of
+``(lowercased name, user_id)`` pairs for usernames, first names and last
+names, searched with bisect. It is built from the database once, on first
+use. After that it is kept current from a change log in the shared cache:
+``user_changed()`` bumps ``autocomplete:version`` and records the user id
+under that version (``user_removed()`` records a deleted account the same
+way). Before each lookup a process applies the entries it has not seen yet,
+reloading changed users and dropping removed ones, falling back to a full
+rebuild if the log has expired. A keystroke therefore costs one cache
+read and no queries in the common case.
+
+Results rank the viewer's friends first, then people with mutual friends
+(from the precomputed ``FriendSuggestion`` rows, cached per viewer), then
+everyone else. Blocked users never appear.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.core.cache import cache
+
+from . import graph
+
+
+MAX_RESULTS = 8
+SCAN_LIMIT = 200  # Index entries examined per lookup beyond friends and mutuals
+LOG_TTL = 60 * 60
+MAX_LOG = 1000  # Further behind than this, rebuilding is cheaper than replaying
+MUTUALS_TTL = 60 * 10
+
+_VERSION_KEY = 'autocomplete:version'
+
+_lock = threading.Lock()
+_entries = []  # sorted (name, user_id)
+_users = {}  # user_id -> {'username', 'name', 'avatar', 'keys'}
+_version = None  # change-log version this process has applied; None until built
+
+
+def _change_key(version):
+    return f'autocomplete:change:{version}'
+
+
+def _mutuals_key(user_id):
+    return f'autocomplete:mutuals:{user_id}'
+
+
+def _user_record(user_id, username, first_name, last_name, profile_photo):
+    from .models import User
+
+    avatar = User(profile_photo=profile_photo).get_profile_photo_url()
+    keys = {name.lower() for name in (username, first_name, last_name) if name}
+    return {
+        'username': username,
+        'name': f'{first_name} {last_name}'.strip(),
+        'avatar': avatar,
+        'keys': keys,
+    }
+
+
+def _load(user_ids=None):
+    from .models import User
+
+    users = User.objects.filter(is_active=True)
+    if user_ids is not None:
+        users = users.filter(id__in=user_ids)
+    rows = users.values_list('id', 'username', 'first_name', 'last_name', 'profile_photo')
+    return {row[0]: _user_record(*row) for row in rows.iterator(chunk_size=10000)}
+
+
+def _remove(user_id):
+    record = _users.pop(user_id, None)
+    if record:
+        for key in record['keys']:
+            i = bisect_left(_entries, (key, user_id))
+            if i < len(_entries) and _entries[i] == (key, user_id):
+                del _entries[i]
+
+
+def _add(user_id, record):
+    _users[user_id] = record
+    for key in record['keys']:
+        insort(_entries, (key, user_id))
+
+
+def _rebuild(version):
+    global _entries, _users, _version
+
+    users = _load()
+    entries = sorted((key, user_id) for user_id, record in users.items() for key in record['keys'])
+    _entries, _users, _version = entries, users, version
+
+
+def _current_version():
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        # (Re)created: start from a value no process has applied yet, so all of them rebuild
+        cache.add(_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(_VERSION_KEY)
+    return version
+
+
+def _sync():
+    """Bring this process's index up to date with the shared change log"""
+    global _version
+
+    current = _current_version()
+    if current == _version:
+        return
+
+    with _lock:
+        if _version is None or current < _version or current - _version > MAX_LOG:
+            _rebuild(current)
+            return
+        if current == _version:
+            return
+        changes = cache.get_many([_change_key(v) for v in range(_version + 1, current + 1)])
+        if len(changes) < current - _version:
+            _rebuild(current)  # Part of the log expired
+            return
+        removed_ids = {user_id for user_id, removed in changes.values() if removed}
+        changed_ids = {user_id for user_id, removed in changes.values() if not removed} - removed_ids
+        fresh = _load(changed_ids)
+        for user_id in removed_ids:
+            _remove(user_id)
+        for user_id in changed_ids:
+            _remove(user_id)
+            if user_id in fresh:
+                _add(user_id, fresh[user_id])
+        _version = current
+
+
+def _log(user_id, removed):
+    try:
+        version = cache.incr(_VERSION_KEY)
+    except ValueError:
+        _current_version()  # The log is gone; a fresh version makes every process rebuild
+        return
+    cache.set(_change_key(version), (user_id, removed), LOG_TTL)
+
+
+def user_changed(user_id):
+    """Record that a user signed up or changed their name or photo"""
+    _log(user_id, removed=False)
+
+
+def user_removed(user_id):
+    """Record that a user was deleted"""
+    _log(user_id, removed=True)
+
+
+def _mutual_counts(user_id):
+    from .models import FriendSuggestion
+
+    key = _mutuals_key(user_id)
+    mutuals = cache.get(key)
+    if mutuals is None:
+        mutuals = dict(FriendSuggestion.objects.filter(user_id=user_id).values_list('candidate_id', 'mutual_count'))
+        cache.set(key, mutuals, MUTUALS_TTL)
+    return mutuals
+
+
+def _matches(user_id, prefix):
+    record = _users.get(user_id)
+    return record is not None and any(key.startswith(prefix) for key in record['keys'])
+
+
+def complete(viewer, query, limit=MAX_RESULTS):
+    """Up to `limit` people whose username or name starts with `query`"""
+    prefix = query.strip().lower()
+    if not prefix:
+        return []
+    _sync()
+
+    user_graph = graph.get_graph(viewer.id)
+    skip = user_graph.blocked_ids
+    skip.add(viewer.id)
+    mutuals = _mutual_counts(viewer.id)
+
+    ranked = {}  # user_id -> sort key
+    results = []
+    with _lock:
+        for user_id in user_graph.friends:
+            if user_id not in skip and _matches(user_id, prefix):
+                ranked[user_id] = (0, 0)
+        for user_id, count in mutuals.items():
+            if user_id not in skip and user_id not in ranked and _matches(user_id, prefix):
+                ranked[user_id] = (1, -count)
+
+        entries = _entries
+        i = bisect_left(entries, (prefix,))
+        end = min(len(entries), i + SCAN_LIMIT)
+        others = 0
+        while i < end and others < limit:
+            key, user_id = entries[i]
+            if not key.startswith(prefix):
+                break
+            if user_id not in skip and user_id not in ranked:
+                ranked[user_id] = (2, 0)
+                others += 1
+            i += 1
+
+        for user_id in sorted(ranked, key=lambda uid: (ranked[uid], _users[uid]['username'].lower()))[:limit]:
+            record = _users[user_id]
+            results.append({
+                'id': user_id,
+                'username': record['username'],
+                'name': record['name'],
+                'avatar': record['avatar'],
+                'is_friend': ranked[user_id][0] == 0,
+                'mutual_count': mutuals.get(user_id, 0),
+            })
+    return results
@@ -0,0 +1,43 @@
+"""
+Rebuild the denormalized counters: engagement on Post and GroupPost, and
+approved members on Group.
+
+The views keep the counters current with atomic F() updates; this module
+recomputes them from the source tables to repair drift (for example after
+cascading deletes of users, which bypass the views).
+"""
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import (
+    Post, Like, Comment, SharedPost, GroupPost, GroupLike, GroupComment, Group, GroupMembership
+)
+
+
+# (model, counter field, related model, foreign key on the related model, filter on the related rows)
+COUNTERS = [
+    (Post, 'like_count', Like, 'post', {}),
+    (Post, 'comment_count', Comment, 'post', {}),
+    (Post, 'share_count', SharedPost, 'original_post', {}),
+    (GroupPost, 'like_count', GroupLike, 'post', {}),
+    (GroupPost, 'comment_count', GroupComment, 'post', {}),
+    (Group, 'approved_member_count', GroupMembership, 'group', {'status': 'approved'}),
+]
+
+
+def counter_subquery(related_model, fk, filters=None):
+    counts = related_model.objects.filter(
+        **{fk: OuterRef('pk')}, **(filters or {})
+    ).order_by().values(fk).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts), 0)
+
+
+def rebuild_counters(queryset_filter=None):
+    """Recompute every counter with one UPDATE per field; returns rows touched per field"""
+    results = {}
+    for model, field, related_model, fk, filters in COUNTERS:
+        queryset = model.objects.all()
+        if queryset_filter:
+            queryset = queryset.filter(**queryset_filter)
+        results[f'{model.__name__}.{field}'] = queryset.update(**{field: counter_subquery(related_model, fk, filters)})
+    return results
@@ -0,0 +1,78 @@
+"""
+Find Friends directory: prefix search over usernames and names.
+
+``User`` has expression indexes on ``LOWER(username)``, ``LOWER(first_name)``
+and ``LOWER(last_name)``. A prefix is matched as a range on the lowered
+column (``>= 'ali' AND < 'alj'``) rather than with ``LIKE``/``ILIKE``, so
+every backend can answer it from those indexes whatever the collation.
+Pages are keyset-paginated on ``(LOWER(username), id)``.
+"""
+import base64
+
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .models import User
+
+
+PAGE_SIZE = getattr(settings, 'DIRECTORY_PAGE_SIZE', 24)
+
+
+def encode_cursor(name, pk):
+    raw = f'{name}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (lowered username, pk) or None if the cursor is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        name, pk = base64.urlsafe_b64decode(padded.encode()).decode().rsplit('|', 1)
+        return name, int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _prefix(field, prefix):
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': upper})
+
+
+def search_users(viewer, query='', cursor=None, page_size=PAGE_SIZE, exclude_ids=()):
+    """
+    Return (users, next_cursor) for one directory page.
+
+    `query` matches the start of the username, first name or last name;
+    "first last" matches both names. `next_cursor` is None on the last page.
+    """
+    users = User.objects.annotate(
+        username_lower=Lower('username'),
+        first_name_lower=Lower('first_name'),
+        last_name_lower=Lower('last_name')
+    ).exclude(id=viewer.id)
+    if exclude_ids:
+        users = users.exclude(id__in=exclude_ids)
+
+    terms = query.strip().lower().split()
+    if len(terms) == 1:
+        term = terms[0]
+        users = users.filter(
+            _prefix('username_lower', term) | _prefix('first_name_lower', term) | _prefix('last_name_lower', term)
+        )
+    elif terms:
+        users = users.filter(_prefix('first_name_lower', terms[0]) & _prefix('last_name_lower', terms[-1]))
+
+    after = decode_cursor(cursor)
+    if after:
+        name, pk = after
+        users = users.filter(Q(username_lower__gt=name) | Q(username_lower=name, id__gt=pk))
+
+    page = list(users.order_by('username_lower', 'id')[:page_size + 1])
+    next_cursor = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        next_cursor = encode_cursor(page[-1].username_lower, page[-1].pk)
+    return page, next_cursor
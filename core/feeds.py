@@ -0,0 +1,55 @@
+"""
+Feed hydration: resolve per-viewer state for a whole page of posts at once.
+
+Templates used to ask ``user in post.likes.all`` for every post, which loads
+every like row of every post. Instead, each helper here runs one query per
+relation for the page and attaches plain booleans to the post objects:
+
+    post.viewer_liked, post.viewer_shared, post.viewer_commented
+"""
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .models import Like, Comment, SharedPost, GroupLike, GroupComment
+
+
+def _ids_for(queryset, field, post_ids):
+    return set(queryset.filter(**{f'{field}__in': post_ids}).values_list(field, flat=True).distinct())
+
+
+def hydrate_posts(posts, viewer, with_comments=False):
+    """Attach viewer state to a page of Post objects (and optionally their comments)"""
+    post_ids = [post.id for post in posts]
+    if not post_ids:
+        return posts
+    
+    liked = _ids_for(Like.objects.filter(user=viewer), 'post_id', post_ids)
+    shared = _ids_for(SharedPost.objects.filter(user=viewer), 'original_post_id', post_ids)
+    commented = _ids_for(Comment.objects.filter(user=viewer), 'post_id', post_ids)
+    
+    for post in posts:
+        post.viewer_liked = post.id in liked
+        post.viewer_shared = post.id in shared
+        post.viewer_commented = post.id in commented
+    
+    if with_comments:
+        prefetch_related_objects(posts, Prefetch('comments', queryset=Comment.objects.select_related('user')))
+    return posts
+
+
+def hydrate_group_posts(posts, viewer, with_comments=False):
+    """Attach viewer state to a page of GroupPost objects (group posts cannot be shared)"""
+    post_ids = [post.id for post in posts]
+    if not post_ids:
+        return posts
+    
+    liked = _ids_for(GroupLike.objects.filter(user=viewer), 'post_id', post_ids)
+    commented = _ids_for(GroupComment.objects.filter(user=viewer), 'post_id', post_ids)
+    
+    for post in posts:
+        post.viewer_liked = post.id in liked
+        post.viewer_shared = False
+        post.viewer_commented = post.id in commented
+    
+    if with_comments:
+        prefetch_related_objects(posts, Prefetch('comments', queryset=GroupComment.objects.select_related('user')))
+    return posts
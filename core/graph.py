@@ -0,0 +1,124 @@
+"""
+Per-user social graph cache.
+
+Friend ids, blocks (both directions) and pending friend requests (both
+directions) are loaded together, stored in the cache as sorted integer
+arrays, and answered from there by membership tests (bisect) and set
+views. Building one costs three queries; after that a page load needs
+none. Model signals (core/signals.py) call ``invalidate()`` for both users
+whenever one of these relations is saved or deleted, including by the
+admin or a cascade.
+
+Pages read blocks from here; the write paths (sending a message, a friend
+request, sharing) check ``Block`` in the database instead, so a process
+whose cache is not shared with the others (no Redis) can show a stale
+graph for up to ``GRAPH_TTL`` but never lets a blocked user through.
+"""
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+
+GRAPH_TTL = getattr(settings, 'SOCIAL_GRAPH_TTL', 60 * 60)
+
+
+def _graph_key(user_id):
+    return f'graph:{user_id}'
+
+
+def _sorted_ids(ids):
+    return array('q', sorted(set(ids)))
+
+
+def _contains(ids, user_id):
+    i = bisect_left(ids, user_id)
+    return i < len(ids) and ids[i] == user_id
+
+
+class SocialGraph:
+    """One user's friends, blocks and pending requests as sorted id arrays"""
+
+    __slots__ = ('friends', 'blocking', 'blocked_by', 'incoming', 'outgoing')
+
+    def __init__(self, friends=(), blocking=(), blocked_by=(), incoming=(), outgoing=()):
+        self.friends = _sorted_ids(friends)
+        self.blocking = _sorted_ids(blocking)      # users this user blocked
+        self.blocked_by = _sorted_ids(blocked_by)  # users who blocked this user
+        self.incoming = _sorted_ids(incoming)      # senders of requests to this user
+        self.outgoing = _sorted_ids(outgoing)      # recipients of this user's requests
+
+    @property
+    def blocked_ids(self):
+        """Users blocked in either direction"""
+        return set(self.blocking) | set(self.blocked_by)
+
+    def is_friend(self, user_id):
+        return _contains(self.friends, user_id)
+
+    def is_blocked(self, user_id):
+        return _contains(self.blocking, user_id) or _contains(self.blocked_by, user_id)
+
+    def has_blocked(self, user_id):
+        return _contains(self.blocking, user_id)
+
+    def is_blocked_by(self, user_id):
+        return _contains(self.blocked_by, user_id)
+
+    def has_incoming_request(self, user_id):
+        return _contains(self.incoming, user_id)
+
+    def has_outgoing_request(self, user_id):
+        return _contains(self.outgoing, user_id)
+
+    def excluded_from_suggestions(self):
+        """Ids that should never be suggested as new friends"""
+        return set(self.friends) | set(self.incoming) | self.blocked_ids
+
+
+def build_graph(user_id):
+    """Load a user's graph from the database (three queries)"""
+    from .models import Friendship, FriendRequest, Block
+
+    blocking, blocked_by = [], []
+    for blocker_id, blocked_id in Block.objects.filter(
+        Q(blocker_id=user_id) | Q(blocked_id=user_id)
+    ).values_list('blocker_id', 'blocked_id'):
+        if blocker_id == user_id:
+            blocking.append(blocked_id)
+        else:
+            blocked_by.append(blocker_id)
+
+    incoming, outgoing = [], []
+    for from_id, to_id in FriendRequest.objects.filter(
+        Q(from_user_id=user_id) | Q(to_user_id=user_id)
+    ).values_list('from_user_id', 'to_user_id'):
+        if from_id == user_id:
+            outgoing.append(to_id)
+        else:
+            incoming.append(from_id)
+
+    return SocialGraph(
+        friends=Friendship.objects.filter(user_id=user_id).values_list('friend_id', flat=True),
+        blocking=blocking,
+        blocked_by=blocked_by,
+        incoming=incoming,
+        outgoing=outgoing
+    )
+
+
+def get_graph(user_id):
+    """A user's social graph, from the cache when possible"""
+    key = _graph_key(user_id)
+    graph = cache.get(key)
+    if graph is None:
+        graph = build_graph(user_id)
+        cache.set(key, graph, GRAPH_TTL)
+    return graph
+
+
+def invalidate(*user_ids):
+    """Drop cached graphs after friendships, requests or blocks change"""
+    cache.delete_many([_graph_key(user_id) for user_id in user_ids])
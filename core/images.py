@@ -0,0 +1,147 @@
+"""
+Resized copies of uploaded images.
+
+Originals are stored untouched. After an upload, a background job writes
+fixed-size derivatives next to them, in WebP (or JPEG where Pillow was
+built without WebP):
+
+* ``avatar``: 40, 80 and 160 px squares, for profile photos
+* ``feed``: 640 and 1280 px wide, for post images and cover photos
+
+A derivative's name is computed from the original's name
+(``derivatives/posts/cat_640.webp``), so URLs are built without a lookup
+and never change for a given upload. The helpers fall back to the
+original until the derivative exists. Which sizes of an image exist is
+cached per image and preset, for ``SIZES_TTL`` once all are there and
+``MISSING_TTL`` while some are not, so rendering a page never stats the
+storage for each ``<img>``.
+"""
+import logging
+import os
+from io import BytesIO
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from . import jobs
+
+
+logger = logging.getLogger(__name__)
+
+PRESETS = {
+    'avatar': (40, 80, 160),
+    'feed': (640, 1280),
+}
+
+# Which preset each image field uses
+IMAGE_FIELDS = {
+    'core.User': {'profile_photo': 'avatar', 'cover_photo': 'feed'},
+    'core.Post': {'image': 'feed'},
+    'core.GroupPost': {'image': 'feed'},
+    'core.Group': {'cover_photo': 'feed'},
+}
+
+FORMAT, EXTENSION = ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+QUALITY = 80
+DERIVATIVE_PREFIX = 'derivatives/'
+SIZES_TTL = 60 * 60 * 24
+MISSING_TTL = 60 * 5  # Generation sets the key itself; this only bounds a missed update
+
+
+def derivative_name(name, size):
+    base, _ = os.path.splitext(name)
+    return f'{DERIVATIVE_PREFIX}{base}_{size}.{EXTENSION}'
+
+
+def _sizes_key(name, preset):
+    return f'images:sizes:{preset}:{name}'
+
+
+def _cache_sizes(name, preset, sizes):
+    sizes = tuple(sizes)
+    cache.set(_sizes_key(name, preset), sizes, SIZES_TTL if sizes == PRESETS[preset] else MISSING_TTL)
+    return sizes
+
+
+def generated_sizes(field_file, preset):
+    """Sizes of `preset` whose derivative of this image exists, from the cache when possible"""
+    sizes = cache.get(_sizes_key(field_file.name, preset))
+    if sizes is None:
+        storage = field_file.storage
+        sizes = _cache_sizes(field_file.name, preset, [
+            size for size in PRESETS[preset] if storage.exists(derivative_name(field_file.name, size))
+        ])
+    return sizes
+
+
+def forget(name):
+    """Drop the cached sizes of an image whose files were deleted"""
+    cache.delete_many([_sizes_key(name, preset) for preset in PRESETS])
+
+
+def _nearest(preset, size):
+    """Smallest size of the preset that is at least `size`, else the largest"""
+    sizes = PRESETS[preset]
+    return next((s for s in sizes if s >= size), sizes[-1])
+
+
+def derivative_url(field_file, preset, size):
+    """URL of the derivative closest to `size` px, or of the original until it has been generated"""
+    if not field_file:
+        return None
+    size = _nearest(preset, size)
+    if size not in generated_sizes(field_file, preset):
+        return field_file.url
+    return field_file.storage.url(derivative_name(field_file.name, size))
+
+
+def _resize(image, preset, size):
+    if preset == 'avatar':
+        return ImageOps.fit(image, (size, size), Image.LANCZOS)
+    resized = image.copy()
+    resized.thumbnail((size, size * 4), Image.LANCZOS)  # Bound the width; never upscales
+    return resized
+
+
+def generate_derivatives(field_file, preset):
+    """Write every size of `preset` for one stored image"""
+    storage = field_file.storage
+    with field_file.open('rb') as f:
+        image = Image.open(f)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha and FORMAT == 'WEBP' else 'RGB')
+
+    for size in PRESETS[preset]:
+        name = derivative_name(field_file.name, size)
+        buffer = BytesIO()
+        _resize(image, preset, size).save(buffer, FORMAT, quality=QUALITY)
+        if storage.exists(name):
+            storage.delete(name)
+        storage.save(name, ContentFile(buffer.getvalue()))
+    _cache_sizes(field_file.name, preset, PRESETS[preset])
+
+
+def generate_for(label, pk, field_names=None):
+    """Generate derivatives for the image fields of one object"""
+    instance = apps.get_model(label).objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    for field_name, preset in IMAGE_FIELDS[label].items():
+        if field_names and field_name not in field_names:
+            continue
+        field_file = getattr(instance, field_name)
+        if not field_file:
+            continue
+        try:
+            generate_derivatives(field_file, preset)
+        except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+            logger.exception('Could not generate derivatives for %s', field_file.name)
+
+
+def process_uploads(instance, *field_names):
+    """Queue derivative generation after new files were saved on `instance`"""
+    jobs.enqueue(generate_for, instance._meta.label, instance.pk, field_names)
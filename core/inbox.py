@@ -0,0 +1,82 @@
+"""
+Per-user inbox rows for the messages list.
+
+Each participant of a conversation has an ``InboxEntry`` holding the other
+participant, a snippet of the last message, when it was sent and how many
+messages they haven't read yet, so ``messages_view`` renders the whole
+list from one indexed query instead of loading the participants and last
+message of every conversation. ``record_message()`` updates both rows of
+a conversation in one statement when a message is sent, and ``refresh()``
+recomputes a conversation's rows from its messages (after a delete, or
+from ``rebuild_inbox``).
+
+Read state is a cursor per participant, ``last_read_message_id``: everything
+up to it is read, and the unread count is the other participant's messages
+after it. ``mark_read()`` moves the cursor forward with a single-row update
+that matches nothing (so writes nothing) when the cursor is already there.
+Unread counts only look at messages in the hot window (``archive.hot_since()``),
+so recounting never scans older months.
+"""
+from django.db.models import Case, Count, F, OuterRef, Subquery, When
+from django.db.models.functions import Coalesce
+
+from .archive import hot_since
+from .models import InboxEntry, Message
+
+
+SNIPPET_LENGTH = 100
+
+
+def snippet(message):
+    if message.content:
+        return message.content[:SNIPPET_LENGTH]
+    return '📎 Attachment' if message.attachment else ''
+
+
+def record_message(message):
+    """Show a new message at the top of both participants' inboxes"""
+    InboxEntry.objects.filter(conversation_id=message.conversation_id).update(
+        last_message=snippet(message),
+        last_sender_id=message.sender_id,
+        last_message_at=message.created_at,
+        updated_at=message.created_at,
+        unread_count=Case(
+            When(user_id=message.sender_id, then=F('unread_count')),
+            default=F('unread_count') + 1
+        )
+    )
+
+
+def mark_read(user_id, conversation_id, message_id):
+    """Move a user's read cursor forward to `message_id` and recount what is still unread after it"""
+    if not message_id:
+        return
+    still_unread = Message.objects.filter(
+        conversation_id=OuterRef('conversation_id'), id__gt=message_id, created_at__gte=hot_since()
+    ).exclude(sender_id=user_id).order_by().values('conversation_id').annotate(total=Count('id')).values('total')
+    InboxEntry.objects.filter(
+        user_id=user_id, conversation_id=conversation_id, last_read_message_id__lt=message_id
+    ).update(last_read_message_id=message_id, unread_count=Coalesce(Subquery(still_unread), 0))
+
+
+def refresh(conversation):
+    """Recompute every inbox row of a conversation from its participants and messages"""
+    participant_ids = list(conversation.participants.values_list('id', flat=True))
+    cursors = dict(conversation.inbox_entries.values_list('user_id', 'last_read_message_id'))
+    last = conversation.messages.order_by('-id').first()
+    recent = conversation.messages.filter(created_at__gte=hot_since())
+    for user_id in participant_ids:
+        InboxEntry.objects.update_or_create(
+            user_id=user_id,
+            conversation=conversation,
+            defaults={
+                'other_user_id': next((pid for pid in participant_ids if pid != user_id), user_id),
+                'last_message': snippet(last) if last else '',
+                'last_sender_id': last.sender_id if last else None,
+                'last_message_at': last.created_at if last else None,
+                'unread_count': recent.filter(
+                    id__gt=cursors.get(user_id, 0)
+                ).exclude(sender_id=user_id).count(),
+                'updated_at': conversation.updated_at,
+            }
+        )
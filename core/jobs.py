@@ -0,0 +1,42 @@
+"""
+Minimal in-process background job queue.
+
+``enqueue()`` schedules a function to run on a small thread pool once the
+current transaction commits, so slow side effects (notification fan-out,
+cache warming, batch deletes) happen outside the request/response cycle.
+Jobs are not persisted: anything still queued when a worker exits is lost,
+so only enqueue work that is safe to drop or that a periodic command can
+redo. Set ``JOBS_ALWAYS_EAGER = True`` to run jobs inline (useful in tests
+and management commands).
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'JOBS_WORKERS', 2),
+    thread_name_prefix='jobs'
+)
+
+
+def _run(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception('Background job %s failed', getattr(func, '__name__', func))
+    finally:
+        if not getattr(settings, 'JOBS_ALWAYS_EAGER', False):
+            connection.close()  # Each pool thread has its own connection
+
+
+def enqueue(func, *args, **kwargs):
+    """Run func(*args, **kwargs) in the background after the current transaction commits"""
+    if getattr(settings, 'JOBS_ALWAYS_EAGER', False):
+        transaction.on_commit(lambda: _run(func, args, kwargs))
+    else:
+        transaction.on_commit(lambda: _executor.submit(_run, func, args, kwargs))
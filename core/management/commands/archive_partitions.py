@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core import archive
+
+
+class Command(BaseCommand):
+    help = 'Maintain the monthly message/notification partitions, archive old months to .jsonl.gz, or restore them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['partition', 'unpartition', 'maintain', 'archive', 'restore'],
+                            help='partition/unpartition: rebuild the Postgres tables (once, in a maintenance window); '
+                                 'maintain: create upcoming partitions (Postgres) or rotate old rows (SQLite); '
+                                 'archive: move old months to ARCHIVE_DIR; restore: load a month back')
+        parser.add_argument('month', nargs='?', help='YYYY-MM to restore')
+        parser.add_argument('--before', help='archive: every month before this YYYY-MM '
+                                             f'(default: older than {archive.HOT_MONTHS} months)')
+        parser.add_argument('--table', choices=sorted(archive.MODELS), action='append',
+                            help='Only this table (repeatable; default both)')
+
+    def handle(self, *args, **options):
+        kinds = options['table'] or sorted(archive.MODELS)
+        try:
+            getattr(self, options['action'])(kinds, options)
+        except ValueError as e:
+            raise CommandError(e)
+
+    def partition(self, kinds, options):
+        rebuilt = archive.partition_tables()
+        for table in rebuilt:
+            self.stdout.write(self.style.SUCCESS(f'Partitioned {table} by month'))
+        if not rebuilt:
+            self.stdout.write('Already partitioned')
+
+    def unpartition(self, kinds, options):
+        for table in archive.unpartition_tables():
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {table} as a plain table'))
+
+    def maintain(self, kinds, options):
+        if connection.vendor == 'postgresql':
+            created = archive.ensure_partitions()
+            self.stdout.write(self.style.SUCCESS(f'Created {len(created)} partition(s)'))
+            for name in created:
+                self.stdout.write(f'  {name}')
+        else:
+            for kind, moved in archive.rotate().items():
+                self.stdout.write(self.style.SUCCESS(f'Rotated {moved} {kind} row(s) into the archive table'))
+
+    def archive(self, kinds, options):
+        if options['before']:
+            before = archive.parse_month(options['before'])
+        else:
+            before = archive.add_months(datetime.now(timezone.utc), -archive.HOT_MONTHS)
+        for kind in kinds:
+            start = archive.oldest_month(kind)
+            total = 0
+            while start is not None and start < before:
+                count = archive.archive_month(kind, start)
+                if count:
+                    self.stdout.write(f'  {kind} {start:%Y-%m}: {count} row(s)')
+                total += count
+                start = archive.add_months(start, 1)
+            self.stdout.write(self.style.SUCCESS(f'Archived {total} {kind} row(s) from before {before:%Y-%m}'))
+
+    def restore(self, kinds, options):
+        if not options['month']:
+            raise CommandError('restore needs the month to load, as YYYY-MM')
+        start = archive.parse_month(options['month'])
+        for kind in kinds:
+            if not archive.archived_files(archive.MODELS[kind]._meta.db_table, start):
+                self.stdout.write(f'No {kind} archive for {start:%Y-%m}')
+                continue
+            restored, skipped = archive.restore_month(kind, start)
+            self.stdout.write(self.style.SUCCESS(f'Restored {restored} {kind} row(s) for {start:%Y-%m}'))
+            if skipped:
+                self.stdout.write(self.style.WARNING(
+                    f'Skipped {skipped} row(s) whose user, conversation or post no longer exists'
+                ))
@@ -0,0 +1,60 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core import inbox, messaging
+from core.models import User, Conversation, Message, Notification
+
+
+def legacy_send(sender, conversation, content):
+    """The sequence conversation_view ran before messaging.send_message (plus the inbox update both need)"""
+    other_user = conversation.participants.exclude(id=sender.id).first()
+    message = Message.objects.create(conversation=conversation, sender=sender, content=content)
+    sender.last_active = timezone.now()
+    sender.save(update_fields=['last_active'])
+    conversation.updated_at = timezone.now()
+    conversation.save()
+    inbox.record_message(message)
+    Notification.create_notification(
+        recipient=other_user,
+        sender=sender,
+        notification_type='message',
+        title=f'New message from {sender.username}',
+        message=content[:100] + '...' if len(content) > 100 else content,
+        link=f'/conversation/{conversation.id}/'
+    )
+    return message
+
+
+class Command(BaseCommand):
+    help = 'Measure messages/sec of the send path in one worker, before and after messaging.send_message'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500, help='Messages sent per variant (default 500)')
+
+    def handle(self, *args, **options):
+        count = options['messages']
+        suffix = uuid.uuid4().hex[:8]
+        sender = User.objects.create_user(username=f'bench_sender_{suffix}')
+        recipient = User.objects.create_user(username=f'bench_recipient_{suffix}')
+        conversation = Conversation.get_or_create_direct(sender, recipient)
+        
+        try:
+            for label, send in (('before', legacy_send), ('after', messaging.send_message)):
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    for i in range(count):
+                        send(sender, conversation, f'Benchmark message {i}')
+                    elapsed = time.perf_counter() - start
+                statements = sum(1 for query in queries if query['sql'] not in ('BEGIN', 'COMMIT'))
+                self.stdout.write(
+                    f'{label:>6}: {count / elapsed:8.0f} messages/sec, {statements / count:.1f} statements/message'
+                )
+        finally:
+            # Cascades to the conversation, messages and notifications
+            sender.delete()
+            recipient.delete()
@@ -0,0 +1,50 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import signals, storage, uploads
+from core.models import StoredBlob
+
+
+class Command(BaseCommand):
+    help = 'Delete media files that nothing references any more, and abandoned partial uploads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recount', action='store_true',
+                            help='Recompute reference counts from every file field before collecting')
+        parser.add_argument('--grace', type=int, default=60,
+                            help='Minutes a new file may stay unreferenced during --recount (default 60)')
+
+    def handle(self, *args, **options):
+        purged = uploads.purge_expired()
+        if purged:
+            self.stdout.write(f'Discarded {purged} abandoned upload(s)')
+
+        if options['recount']:
+            self.recount(timezone.now() - timedelta(minutes=options['grace']))
+
+        collected = 0
+        for name in StoredBlob.objects.filter(ref_count=0).values_list('name', flat=True).iterator():
+            collected += storage.collect(name)
+        self.stdout.write(self.style.SUCCESS(f'Collected {collected} unreferenced file(s)'))
+
+    def recount(self, cutoff):
+        counts = Counter()
+        for model in apps.get_app_config('core').get_models():
+            for field_name in signals.file_fields(model):
+                names = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                counts.update(names.values_list(field_name, flat=True).iterator())
+
+        changed = []
+        for blob in StoredBlob.objects.iterator():
+            count = counts.get(blob.name, 0)
+            if count == 0 and blob.created_at > cutoff:
+                continue  # Possibly an upload whose row isn't committed yet
+            if blob.ref_count != count:
+                blob.ref_count = count
+                changed.append(blob)
+        StoredBlob.objects.bulk_update(changed, ['ref_count'], batch_size=1000)
+        self.stdout.write(f'Corrected {len(changed)} reference count(s)')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.suggestions import compute_suggestions, SUGGESTIONS_PER_USER
+
+
+class Command(BaseCommand):
+    help = 'Recompute "People you may know" suggestions from mutual friends (run periodically)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=SUGGESTIONS_PER_USER,
+                            help='Suggestions to keep per user')
+
+    def handle(self, *args, **options):
+        users, rows = compute_suggestions(top_k=options['top'])
+        self.stdout.write(self.style.SUCCESS(f'Stored {rows} suggestion(s) for {users} user(s)'))
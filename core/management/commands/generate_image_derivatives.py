@@ -0,0 +1,23 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from core import images
+
+
+class Command(BaseCommand):
+    help = 'Generate resized/WebP derivatives for images uploaded before the pipeline existed'
+
+    def handle(self, *args, **options):
+        for label, fields in images.IMAGE_FIELDS.items():
+            model = apps.get_model(label)
+            query = None
+            for field_name in fields:
+                has_file = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                query = has_file if query is None else query | has_file
+            
+            count = 0
+            for pk in query.values_list('pk', flat=True).iterator():
+                images.generate_for(label, pk)
+                count += 1
+            self.stdout.write(f'{label}: {count} object(s) processed')
+        self.stdout.write(self.style.SUCCESS('Image derivatives generated'))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import retention
+
+
+class Command(BaseCommand):
+    help = 'Delete notifications past their type\'s TTL or beyond the per-user maximum, in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=retention.BATCH_SIZE,
+                            help=f'Rows deleted per transaction (default {retention.BATCH_SIZE})')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        deleted = retention.prune(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        actors = retention.prune_actors(batch_size=options['batch_size'])
+
+        total = sum(deleted.values())
+        self.stdout.write(f'Expired: {deleted["expired"]}, over the per-user limit: {deleted["over_limit"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {total} notification(s) in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f} rows/sec)'
+        ))
+        self.stdout.write(f'Dropped {actors} actor row(s) of notifications past the coalescing window')
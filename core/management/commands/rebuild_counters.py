@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from core.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute like/comment/share counters on posts and group posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only posts created on or after this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        queryset_filter = None
+        if options['since']:
+            queryset_filter = {'created_at__date__gte': options['since']}
+        
+        for counter, rows in rebuild_counters(queryset_filter).items():
+            self.stdout.write(f'{counter}: {rows} row(s) updated')
+        self.stdout.write(self.style.SUCCESS('Counters rebuilt'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Conversation
+from core import inbox
+
+
+class Command(BaseCommand):
+    help = 'Recompute inbox rows (last message, unread counts) from conversations and messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help="Only rebuild these users' conversations (default: all)")
+
+    def handle(self, *args, **options):
+        conversations = Conversation.objects.all()
+        if options['usernames']:
+            conversations = conversations.filter(participants__username__in=options['usernames']).distinct()
+        
+        count = 0
+        for conversation in conversations.iterator():
+            inbox.refresh(conversation)
+            count += 1
+        
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt inbox rows for {count} conversation(s)'))
@@ -0,0 +1,197 @@
+"""
+Serving files from ``MEDIA_ROOT``.
+
+Every media URL goes through ``serve()`` (message attachments through the
+participant-checked ``message_attachment`` view instead), which adds:
+
+* a strong ``ETag`` and ``Last-Modified``, answering conditional requests
+  with 304;
+* ``Cache-Control: immutable`` for a year on content-addressed uploads and
+  their derivatives, whose bytes never change under a given name;
+* single ``Range`` requests (206/416), for video seeking and resumed
+  downloads.
+
+With ``MEDIA_ACCEL = 'nginx'`` the response carries ``X-Accel-Redirect``
+to ``MEDIA_ACCEL_PREFIX`` (an ``internal`` nginx location aliased to the
+media root) and no body; with ``'sendfile'`` it carries ``X-Sendfile``
+(Apache mod_xsendfile, lighttpd). The proxy then sends the bytes and
+handles ranges itself, so Python only checks access and sets headers.
+
+Without a proxy the body is streamed in ``BLOCK_SIZE`` reads. Under ASGI
+that is an async iterator with each read done in a worker thread: Django
+4.2 collects a sync iterator into a list before sending it, which would
+hold the whole file in memory.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date
+from django.views.decorators.http import require_safe
+
+
+ACCEL = getattr(settings, 'MEDIA_ACCEL', None)  # None, 'nginx' or 'sendfile'
+ACCEL_PREFIX = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+PRIVATE_PREFIXES = ('message_attachments/', 'derivatives/message_attachments/')
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+MUTABLE_MAX_AGE = 60 * 60
+BLOCK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+_DIGEST_RE = re.compile(r'([0-9a-f]{64})(?:_\d+)?\.\w+$')
+
+
+def _normalize(path):
+    """Media-relative name for a URL path, or None for anything hidden or escaping the root"""
+    name = posixpath.normpath(path).lstrip('/')
+    if name.startswith('..') or any(part.startswith('.') for part in name.split('/')):
+        return None
+    return name
+
+
+def _etag(name, stat):
+    digest = _DIGEST_RE.search(name)
+    if digest:
+        return f'"{digest.group(0)}"'  # The name is a content hash (plus derivative size)
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def _cache_control(name, private):
+    scope = 'private' if private else 'public'
+    if _DIGEST_RE.search(name):
+        return f'{scope}, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return f'{scope}, max-age={MUTABLE_MAX_AGE}'
+
+
+def _byte_range(header, size):
+    """(start, end) inclusive for a single-range header; None to send everything; False if unsatisfiable"""
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None  # Malformed or multi-range: a full response is allowed
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            return None  # Invalid, so ignored (RFC 9110 14.2)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        if int(last) == 0:
+            return False
+        start, end = max(size - int(last), 0), size - 1
+    if start >= size:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(BLOCK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def _in_thread(func, *args):
+    return sync_to_async(func, thread_sensitive=False)(*args)
+
+
+async def _read_range_async(path, start, length):
+    f = await _in_thread(open, path, 'rb')
+    try:
+        await _in_thread(f.seek, start)
+        while length > 0:
+            data = await _in_thread(f.read, min(BLOCK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        await _in_thread(f.close)
+
+
+def _body(request, path, start, length):
+    if request.method == 'HEAD':
+        return []
+    if isinstance(request, ASGIRequest):
+        return _read_range_async(path, start, length)
+    return _read_range(path, start, length)
+
+
+def serve_file(request, name, private=False, download_name=None):
+    """Response for one media file; `private` keeps shared caches from storing it"""
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        raise Http404
+    if not os.path.isfile(path):
+        raise Http404
+
+    etag = _etag(name, stat)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': _cache_control(name, private),
+        'Accept-Ranges': 'bytes',
+        'X-Content-Type-Options': 'nosniff',
+    }
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        for header in ('Cache-Control', 'Accept-Ranges'):
+            not_modified[header] = headers[header]
+        return not_modified
+
+    content_type, _ = mimetypes.guess_type(name)
+    content_type = content_type or 'application/octet-stream'
+    if download_name:
+        headers['Content-Disposition'] = content_disposition_header(
+            not content_type.startswith(('image/', 'video/')), download_name
+        )
+
+    if ACCEL == 'nginx':
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response['X-Accel-Redirect'] = ACCEL_PREFIX + quote(name)
+        return response
+    if ACCEL == 'sendfile':
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response['X-Sendfile'] = path
+        return response
+
+    size = stat.st_size
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if range_header and request.headers.get('If-Range', etag) == etag:
+        byte_range = _byte_range(range_header, size)
+    if byte_range is False:
+        headers['Content-Range'] = f'bytes */{size}'
+        return HttpResponse(status=416, headers=headers)
+    if byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        headers['Content-Length'] = str(length)
+        body = _body(request, path, start, length)
+        return StreamingHttpResponse(body, status=206, content_type=content_type, headers=headers)
+
+    headers['Content-Length'] = str(size)
+    return StreamingHttpResponse(_body(request, path, 0, size), content_type=content_type, headers=headers)
+
+
+@require_safe
+def serve(request, path):
+    """Public media URL; message attachments are only served by their own view"""
+    name = _normalize(path)
+    if name is None or name.startswith(PRIVATE_PREFIXES):
+        raise Http404
+    return serve_file(request, name)
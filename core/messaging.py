@@ -0,0 +1,120 @@
+"""
+The write path for new messages.
+
+``send_message()`` is used by the message form and by finished chunked
+uploads. An attachment is stored before the transaction, so the message
+row is inserted once with it already set. The transaction then runs four
+statements:
+
+1. INSERT the message
+2. UPDATE the conversation's ``updated_at`` (``update_fields``, not the full row)
+3. UPDATE both inbox rows
+4. INSERT the recipient's notification
+
+The recipient comes from the conversation's pair key, or for older
+conversations from a cached participant list, so no participant query is
+needed. The heartbeat only touches the cache (``presence.touch``).
+Realtime events and the notification badge count go out after commit.
+
+Reading: a conversation opens on its newest ``PAGE_SIZE`` messages and
+``history()`` pages back from there by message id, so old history is only
+loaded when someone scrolls to it.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from . import inbox, notifications, presence, realtime, storage
+from .models import Conversation, Message, Notification
+
+
+PARTICIPANTS_TTL = 60 * 60 * 24  # Participants of a conversation never change
+PAGE_SIZE = getattr(settings, 'MESSAGE_PAGE_SIZE', 50)
+
+
+def _participants_key(conversation_id):
+    return f'conversation:participants:{conversation_id}'
+
+
+def participant_ids(conversation_id):
+    """Ids of a conversation's participants, from the cache when possible"""
+    key = _participants_key(conversation_id)
+    ids = cache.get(key)
+    if ids is None:
+        ids = list(Conversation.participants.through.objects.filter(
+            conversation_id=conversation_id
+        ).values_list('user_id', flat=True))
+        cache.set(key, ids, PARTICIPANTS_TTL)
+    return ids
+
+
+def other_participant_id(conversation, user_id):
+    """The other side of a direct conversation, or None if `user_id` is alone in it"""
+    if conversation.user_low_id:
+        other_id = conversation.user_high_id if conversation.user_low_id == user_id else conversation.user_low_id
+        return other_id if other_id != user_id else None
+    return next((pid for pid in participant_ids(conversation.id) if pid != user_id), None)
+
+
+def history(conversation, before=None, page_size=PAGE_SIZE):
+    """
+    One page of a conversation, oldest first: its newest `page_size` messages,
+    or the ones just before message id `before`. Returns (messages, has_older).
+    """
+    queryset = conversation.messages.select_related('sender').order_by('-id')
+    if before is not None:
+        queryset = queryset.filter(id__lt=before)
+    page = list(queryset[:page_size + 1])
+    return page[:page_size][::-1], len(page) > page_size
+
+
+def send_message(sender, conversation, content='', attachment=None, attachment_name=''):
+    """Store a message, update the conversation and inboxes, and notify the recipient"""
+    recipient_id = other_participant_id(conversation, sender.id)
+    message = Message(conversation=conversation, sender=sender, content=content, created_at=timezone.now())
+    if attachment is not None:
+        message.attachment.save(attachment_name, attachment, save=False)
+        message.attachment_name = attachment_name
+
+    try:
+        with transaction.atomic():
+            message.save(force_insert=True)
+            conversation.updated_at = message.created_at
+            conversation.save(update_fields=['updated_at'])
+            inbox.record_message(message)
+            if recipient_id:
+                _notify(sender, recipient_id, conversation, message)
+    except Exception:
+        if message.attachment:
+            storage.release(message.attachment.name)  # Drop the reference the unsaved row would have held
+        raise
+
+    presence.touch(sender.id)
+    if recipient_id:
+        realtime.publish(recipient_id, 'message', {'conversation_id': conversation.id, 'message_id': message.id})
+        realtime.publish(recipient_id, 'presence', {
+            'user_id': sender.id,
+            'is_online': True,
+            'status': presence.display(timezone.now())
+        })
+    return message
+
+
+def _notify(sender, recipient_id, conversation, message):
+    content = message.content
+    notification = Notification.objects.create(
+        recipient_id=recipient_id,
+        sender=sender,
+        notification_type='message',
+        title=f'New message from {sender.username}',
+        message=content[:100] + '...' if len(content) > 100 else content,
+        link=f'/conversation/{conversation.id}/'
+    )
+    notifications.adjust_unread(recipient_id, 1)
+    realtime.publish(recipient_id, 'notification', {
+        'id': notification.id,
+        'type': 'message',
+        'title': notification.title,
+        'link': notification.link
+    })
@@ -0,0 +1,34 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from . import presence
+
+
+class PresenceMiddleware:
+    """Record a presence heartbeat for every authenticated request"""
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self.touch(request)
+        return response
+    
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        # request.user loads lazily from the session and the heartbeat writes the cache, both sync
+        await sync_to_async(self.touch)(request)
+        return response
+    
+    @staticmethod
+    def touch(request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            presence.touch(user.id)
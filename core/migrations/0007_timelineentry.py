@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_timelines(apps, schema_editor):
+    User = apps.get_model('core', 'User')
+    Post = apps.get_model('core', 'Post')
+    Friendship = apps.get_model('core', 'Friendship')
+    TimelineEntry = apps.get_model('core', 'TimelineEntry')
+    
+    for user_id in User.objects.values_list('id', flat=True).iterator():
+        author_ids = [user_id]
+        author_ids.extend(Friendship.objects.filter(user_id=user_id).values_list('friend_id', flat=True))
+        entries = [
+            TimelineEntry(owner_id=user_id, post_id=post_id, author_id=author_id, created_at=created_at)
+            for post_id, author_id, created_at in Post.objects.filter(
+                user_id__in=author_ids
+            ).values_list('id', 'user_id', 'created_at').iterator()
+        ]
+        TimelineEntry.objects.bulk_create(entries, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_alter_notification_notification_type_sharedpost_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to=settings.AUTH_USER_MODEL)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='core.post')),
+            ],
+            options={
+                'ordering': ['-created_at', '-post'],
+                'indexes': [models.Index(fields=['owner', '-created_at', '-post'], name='core_timeline_feed_idx'), models.Index(fields=['owner', 'author'], name='core_timeline_author_idx')],
+                'unique_together': {('owner', 'post')},
+            },
+        ),
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
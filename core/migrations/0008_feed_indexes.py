@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='grouppost',
+            index=models.Index(fields=['group', '-created_at', '-id'], name='core_grouppost_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='core_post_user_feed_idx'),
+        ),
+    ]
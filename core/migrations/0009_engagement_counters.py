@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:06
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    counters = [
+        ('Post', 'like_count', 'Like', 'post'),
+        ('Post', 'comment_count', 'Comment', 'post'),
+        ('Post', 'share_count', 'SharedPost', 'original_post'),
+        ('GroupPost', 'like_count', 'GroupLike', 'post'),
+        ('GroupPost', 'comment_count', 'GroupComment', 'post'),
+    ]
+    for model_name, field, related_name, fk in counters:
+        related = apps.get_model('core', related_name)
+        counts = related.objects.filter(
+            **{fk: OuterRef('pk')}
+        ).order_by().values(fk).annotate(total=Count('pk')).values('total')
+        apps.get_model('core', model_name).objects.update(**{field: Coalesce(Subquery(counts), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='grouppost',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='grouppost',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='share_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
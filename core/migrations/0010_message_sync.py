@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_engagement_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'id'], name='core_message_sync_idx'),
+        ),
+        migrations.AddField(
+            model_name='messagetombstone',
+            name='conversation',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tombstones', to='core.conversation'),
+        ),
+        migrations.AddIndex(
+            model_name='messagetombstone',
+            index=models.Index(fields=['conversation', 'id'], name='core_tombstone_sync_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:19
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_notification_coalescing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FriendSuggestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mutual_count', models.PositiveIntegerField()),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friend_suggestions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-mutual_count', 'candidate'],
+                'indexes': [models.Index(fields=['user', '-mutual_count'], name='core_suggestion_rank_idx')],
+                'unique_together': {('user', 'candidate')},
+            },
+        ),
+    ]
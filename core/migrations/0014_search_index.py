@@ -0,0 +1,102 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE core_searchdocument_fts USING fts5(
+        text, content='core_searchdocument', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER core_searchdocument_ai AFTER INSERT ON core_searchdocument BEGIN
+        INSERT INTO core_searchdocument_fts(rowid, text) VALUES (new.id, new.text);
+    END""",
+    """CREATE TRIGGER core_searchdocument_ad AFTER DELETE ON core_searchdocument BEGIN
+        INSERT INTO core_searchdocument_fts(core_searchdocument_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END""",
+    """CREATE TRIGGER core_searchdocument_au AFTER UPDATE OF text ON core_searchdocument BEGIN
+        INSERT INTO core_searchdocument_fts(core_searchdocument_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO core_searchdocument_fts(rowid, text) VALUES (new.id, new.text);
+    END""",
+]
+
+SQLITE_REVERSE = [
+    'DROP TRIGGER IF EXISTS core_searchdocument_au',
+    'DROP TRIGGER IF EXISTS core_searchdocument_ad',
+    'DROP TRIGGER IF EXISTS core_searchdocument_ai',
+    'DROP TABLE IF EXISTS core_searchdocument_fts',
+]
+
+POSTGRES_FORWARD = [
+    "CREATE INDEX core_searchdocument_tsv_idx ON core_searchdocument USING GIN (to_tsvector('english', text))",
+]
+
+POSTGRES_REVERSE = [
+    'DROP INDEX IF EXISTS core_searchdocument_tsv_idx',
+]
+
+
+def _run(schema_editor, statements):
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def create_fulltext_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD})
+
+
+def drop_fulltext_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE})
+
+
+def backfill_documents(apps, schema_editor):
+    SearchDocument = apps.get_model('core', 'SearchDocument')
+    sources = [
+        ('Post', 'post', lambda obj: (obj.content, obj.user_id, None)),
+        ('GroupPost', 'group_post', lambda obj: (obj.content, obj.user_id, obj.group_id)),
+        ('Comment', 'comment', lambda obj: (obj.content, obj.user_id, None)),
+        ('Group', 'group', lambda obj: (f'{obj.name}\n{obj.description}'.strip(), obj.creator_id, obj.id)),
+    ]
+    for model_name, field, describe in sources:
+        documents = []
+        for obj in apps.get_model('core', model_name).objects.iterator(chunk_size=1000):
+            text, author_id, scope_group_id = describe(obj)
+            documents.append(SearchDocument(
+                **{f'{field}_id': obj.id},
+                text=text,
+                author_id=author_id,
+                scope_group_id=scope_group_id,
+                created_at=obj.created_at
+            ))
+            if len(documents) >= 1000:
+                SearchDocument.objects.bulk_create(documents)
+                documents = []
+        SearchDocument.objects.bulk_create(documents)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_user_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('author', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('comment', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='core.comment')),
+                ('group', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='core.group')),
+                ('group_post', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='core.grouppost')),
+                ('post', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='core.post')),
+                ('scope_group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.group')),
+            ],
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(backfill_documents, migrations.RunPython.noop),
+    ]
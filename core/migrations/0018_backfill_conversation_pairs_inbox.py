@@ -0,0 +1,51 @@
+from django.db import migrations
+
+
+def backfill(apps, schema_editor):
+    Conversation = apps.get_model('core', 'Conversation')
+    Message = apps.get_model('core', 'Message')
+    InboxEntry = apps.get_model('core', 'InboxEntry')
+    Participants = Conversation.participants.through
+
+    participants = {}
+    for conversation_id, user_id in Participants.objects.values_list('conversation_id', 'user_id').iterator():
+        participants.setdefault(conversation_id, []).append(user_id)
+
+    # Oldest conversation of each pair gets the key; later duplicates keep working unkeyed
+    pairs = set()
+    entries = []
+    for conversation in Conversation.objects.order_by('id').iterator():
+        user_ids = sorted(set(participants.get(conversation.id, [])))
+        if len(user_ids) == 2 and tuple(user_ids) not in pairs:
+            pairs.add(tuple(user_ids))
+            Conversation.objects.filter(pk=conversation.pk).update(user_low_id=user_ids[0], user_high_id=user_ids[1])
+
+        last = Message.objects.filter(conversation_id=conversation.id).order_by('-id').first()
+        for user_id in user_ids:
+            entries.append(InboxEntry(
+                user_id=user_id,
+                conversation_id=conversation.id,
+                other_user_id=next((uid for uid in user_ids if uid != user_id), user_id),
+                last_message=(last.content[:100] or ('📎 Attachment' if last.attachment else '')) if last else '',
+                last_sender_id=last.sender_id if last else None,
+                last_message_at=last.created_at if last else None,
+                unread_count=Message.objects.filter(
+                    conversation_id=conversation.id, is_read=False
+                ).exclude(sender_id=user_id).count(),
+                updated_at=conversation.updated_at
+            ))
+        if len(entries) >= 1000:
+            InboxEntry.objects.bulk_create(entries, ignore_conflicts=True)
+            entries = []
+    InboxEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_conversation_pairs_inbox'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:43
+
+from django.db import migrations, models
+from django.db.models import Max, Min
+
+
+def backfill_cursors(apps, schema_editor):
+    """Place each cursor just before the reader's first unread message, or at the last message"""
+    InboxEntry = apps.get_model('core', 'InboxEntry')
+    Message = apps.get_model('core', 'Message')
+    for entry in InboxEntry.objects.iterator():
+        messages = Message.objects.filter(conversation_id=entry.conversation_id)
+        first_unread = messages.filter(is_read=False).exclude(sender_id=entry.user_id).aggregate(id=Min('id'))['id']
+        cursor = first_unread - 1 if first_unread else (messages.aggregate(id=Max('id'))['id'] or 0)
+        InboxEntry.objects.filter(pk=entry.pk).update(last_read_message_id=cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_backfill_conversation_pairs_inbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inboxentry',
+            name='last_read_message_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_cursors, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+    ]
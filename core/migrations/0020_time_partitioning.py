@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+TABLES = ['core_message', 'core_notification']
+
+
+def partition(apps, schema_editor):
+    # Postgres tables are partitioned by hand, with `archive_partitions partition`: it
+    # rewrites both tables and changes their primary key, so it is not run on every deploy
+    if schema_editor.connection.vendor == 'sqlite':
+        # No partitioning; old rows are rotated into a twin table (see core/archive.py)
+        for table in TABLES:
+            schema_editor.execute(f'CREATE TABLE {table}_archive AS SELECT * FROM {table} WHERE 0')
+            schema_editor.execute(f'CREATE INDEX {table}_archive_id ON {table}_archive (id)')
+            schema_editor.execute(f'CREATE INDEX {table}_archive_created ON {table}_archive (created_at)')
+
+
+def unpartition(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for table in TABLES:
+            schema_editor.execute(f'DROP TABLE IF EXISTS {table}_archive')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_inbox_read_cursor'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
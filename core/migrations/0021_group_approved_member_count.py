@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:13
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill(apps, schema_editor):
+    Group = apps.get_model('core', 'Group')
+    GroupMembership = apps.get_model('core', 'GroupMembership')
+    counts = GroupMembership.objects.filter(
+        group=OuterRef('pk'), status='approved'
+    ).order_by().values('group').annotate(total=Count('pk')).values('total')
+    Group.objects.update(approved_member_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_time_partitioning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='approved_member_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
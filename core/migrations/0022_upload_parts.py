@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill(apps, schema_editor):
+    UploadSession = apps.get_model('core', 'UploadSession')
+    UploadPart = apps.get_model('core', 'UploadPart')
+    for session_id, received in UploadSession.objects.values_list('id', 'received_parts'):
+        UploadPart.objects.bulk_create(
+            [UploadPart(session_id=session_id, index=index) for index in set(received or [])],
+            ignore_conflicts=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_group_approved_member_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadPart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parts', to='core.uploadsession')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='uploadpart',
+            constraint=models.UniqueConstraint(fields=('session', 'index'), name='core_uploadpart_uniq'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='uploadsession',
+            name='received_parts',
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:20
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill(apps, schema_editor):
+    # Only the last few actors were kept; older ones are not recoverable
+    Notification = apps.get_model('core', 'Notification')
+    Notification.objects.update(actor_ids=F('recent_actor_ids'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_upload_parts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='actor_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:39
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def backfill(apps, schema_editor):
+    # Only notifications that can still absorb events need their actors
+    Notification = apps.get_model('core', 'Notification')
+    NotificationActor = apps.get_model('core', 'NotificationActor')
+    since = timezone.now() - timedelta(hours=getattr(settings, 'NOTIFICATION_AGGREGATE_HOURS', 24))
+    batch = []
+    for notification_id, actor_ids in Notification.objects.filter(created_at__gte=since).exclude(
+        actor_ids=[]
+    ).values_list('id', 'actor_ids').iterator(chunk_size=1000):
+        batch.extend(NotificationActor(notification_id=notification_id, actor_id=actor_id) for actor_id in actor_ids)
+        if len(batch) >= 1000:
+            NotificationActor.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    NotificationActor.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_notification_actor_ids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationActor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notification_id', models.BigIntegerField()),
+                ('actor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='notificationactor',
+            constraint=models.UniqueConstraint(fields=('notification_id', 'actor'), name='core_notificationactor_uniq'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='notification',
+            name='actor_ids',
+        ),
+    ]
@@ -1,7 +1,15 @@
-from django.db import models
+import os
+import uuid
+
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
+from django.db.models.functions import Lower
 from django.contrib.auth.models import AbstractUser
+from django.urls import reverse
 from django.utils import timezone
 
+from . import realtime, notifications, presence, images
+
 
 class User(AbstractUser):
     bio = models.TextField(blank=True)
@@ -14,54 +22,72 @@ class User(AbstractUser):
     relationship_status = models.CharField(max_length=10, choices=[('single', 'Single'), ('married', 'Married')], blank=True)
     last_active = models.DateTimeField(default=timezone.now)
     
-    def get_profile_photo_url(self):
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Prefix search in the Find Friends directory (core/directory.py)
+            models.Index(Lower('username'), name='core_user_username_lower_idx'),
+            models.Index(Lower('first_name'), name='core_user_first_lower_idx'),
+            models.Index(Lower('last_name'), name='core_user_last_lower_idx'),
+        ]
+    
+    def get_profile_photo_url(self, size=None):
         if self.profile_photo:
+            if size:
+                return images.derivative_url(self.profile_photo, 'avatar', size)
             return self.profile_photo.url
         return '/media/defaults/default-avatar.jpg'
     
-    def get_cover_photo_url(self):
+    def get_cover_photo_url(self, size=None):
         if self.cover_photo:
+            if size:
+                return images.derivative_url(self.cover_photo, 'feed', size)
             return self.cover_photo.url
         return '/media/defaults/default-cover.jpg'
     
     def is_online(self):
-        if not self.last_active:
-            return False
-        return timezone.now() - self.last_active < timezone.timedelta(minutes=2)
+        return presence.is_online(presence.last_seen(self.id, self.last_active))
     
     def get_last_active_display(self):
-        if self.is_online():
-            return 'Active now'
-        
-        if not self.last_active:
-            return 'Offline'
-        
-        diff = timezone.now() - self.last_active
-        
-        if diff.days > 0:
-            return f'Active {diff.days}d ago'
-        elif diff.seconds >= 3600:
-            hours = diff.seconds // 3600
-            return f'Active {hours}h ago'
-        elif diff.seconds >= 60:
-            minutes = diff.seconds // 60
-            return f'Active {minutes}m ago'
-        else:
-            return 'Active just now'
-
-
-class Post(models.Model):
+        return presence.display(presence.last_seen(self.id, self.last_active))
+
+
+class CounterMixin:
+    """Atomic updates for denormalized counter fields"""
+    
+    def adjust_count(self, field, delta):
+        queryset = type(self).objects.filter(pk=self.pk)
+        if delta < 0:
+            queryset = queryset.filter(**{f'{field}__gte': -delta})  # Never go below zero
+        queryset.update(**{field: F(field) + delta})
+        self.refresh_from_db(fields=[field])
+        return getattr(self, field)
+
+
+class Post(CounterMixin, models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
     content = models.TextField()
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Denormalized engagement counters (see rebuild_counters command)
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    share_count = models.PositiveIntegerField(default=0)
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='core_post_user_feed_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.created_at}"
+    
+    def get_image_url(self, size=None):
+        if size:
+            return images.derivative_url(self.image, 'feed', size)
+        return self.image.url if self.image else None
 
 
 class Comment(models.Model):
@@ -115,11 +141,39 @@ class FriendRequest(models.Model):
 
 class Conversation(models.Model):
     participants = models.ManyToManyField(User, related_name='conversations')
+    # Direct conversations are keyed by their two participants, smaller id first
+    user_low = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    user_high = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='core_conversation_pair_uniq'),
+        ]
+    
     def __str__(self):
         return f"Conversation {self.id}"
+    
+    @classmethod
+    def get_or_create_direct(cls, user, other_user):
+        """The one conversation between two users, created (with inbox entries) if needed"""
+        low, high = sorted((user.id, other_user.id))
+        conversation = cls.objects.filter(user_low_id=low, user_high_id=high).first()
+        if conversation:
+            return conversation
+        try:
+            with transaction.atomic():
+                conversation = cls.objects.create(user_low_id=low, user_high_id=high)
+                conversation.participants.add(low, high)
+                InboxEntry.objects.bulk_create([
+                    InboxEntry(user=user, conversation=conversation, other_user=other_user),
+                    InboxEntry(user=other_user, conversation=conversation, other_user=user),
+                ], ignore_conflicts=True)
+        except IntegrityError:
+            # Created by a concurrent request
+            conversation = cls.objects.get(user_low_id=low, user_high_id=high)
+        return conversation
 
 
 class Message(models.Model):
@@ -127,20 +181,28 @@ class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     content = models.TextField(blank=True)
     attachment = models.FileField(upload_to='message_attachments/', blank=True, null=True)
+    attachment_name = models.CharField(max_length=255, blank=True)  # Original filename; stored names are content hashes
     created_at = models.DateTimeField(default=timezone.now)
-    is_read = models.BooleanField(default=False)
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['conversation', 'id'], name='core_message_sync_idx'),
+        ]
     
     def __str__(self):
         return f"{self.sender.username} in {self.conversation}"
     
     def get_attachment_url(self):
         if self.attachment:
-            return self.attachment.url
+            return reverse('message_attachment', args=[self.id])  # Checks the viewer is a participant
         return None
     
+    def get_attachment_name(self):
+        if self.attachment:
+            return self.attachment_name or os.path.basename(self.attachment.name)
+        return ''
+    
     def is_image(self):
         if self.attachment:
             ext = self.attachment.name.lower().split('.')[-1]
@@ -148,9 +210,88 @@ class Message(models.Model):
         return False
 
 
+class MessageTombstone(models.Model):
+    """Record of a deleted message so polling clients can drop it incrementally"""
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='tombstones')
+    message_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversation', 'id'], name='core_tombstone_sync_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Deleted message {self.message_id} in {self.conversation}"
+
+
+class InboxEntry(models.Model):
+    """One conversation in one user's inbox, with what the messages list shows (see core/inbox.py)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='inbox')
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='inbox_entries')
+    other_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    last_message = models.CharField(max_length=255, blank=True)
+    last_sender = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_read_message_id = models.BigIntegerField(default=0)  # Read cursor: messages up to this id are read
+    unread_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'conversation'], name='core_inbox_user_conversation_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-updated_at'], name='core_inbox_user_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username}'s conversation with {self.other_user.username}"
+
+
+class UploadSession(models.Model):
+    """A message attachment being uploaded in parts (see core/uploads.py)"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    content_type = models.CharField(max_length=100, blank=True)  # Detected from the first part's magic bytes
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"Upload of {self.filename} by {self.user.username}"
+    
+    @property
+    def part_count(self):
+        return -(-self.size // self.chunk_size)
+    
+    def part_size(self, index):
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+    
+    @property
+    def received_parts(self):
+        return sorted(self.parts.values_list('index', flat=True))
+    
+    def is_complete(self):
+        return self.parts.count() == self.part_count
+
+
+class UploadPart(models.Model):
+    """One received part of an upload; a row per part, so concurrent parts never overwrite each other"""
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='parts')
+    index = models.PositiveIntegerField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'index'], name='core_uploadpart_uniq'),
+        ]
+
+
 # ==================== GROUP MODELS ====================
 
-class Group(models.Model):
+class Group(CounterMixin, models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     cover_photo = models.ImageField(upload_to='group_covers/', blank=True, null=True)
@@ -159,19 +300,24 @@ class Group(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_private = models.BooleanField(default=False)
     
+    # Denormalized (see rebuild_counters); also decides per-member vs pull-based group post notifications
+    approved_member_count = models.PositiveIntegerField(default=0)
+    
     class Meta:
         ordering = ['-created_at']
     
     def __str__(self):
         return self.name
     
-    def get_cover_photo_url(self):
+    def get_cover_photo_url(self, size=None):
         if self.cover_photo:
+            if size:
+                return images.derivative_url(self.cover_photo, 'feed', size)
             return self.cover_photo.url
         return '/media/defaults/default-group-cover.jpg'
     
     def member_count(self):
-        return self.memberships.filter(status='approved').count()
+        return self.approved_member_count
     
     def is_member(self, user):
         return self.memberships.filter(user=user, status='approved').exists()
@@ -226,7 +372,7 @@ class GroupMembership(models.Model):
         return f"{self.user.username} in {self.group.name} ({self.role})"
 
 
-class GroupPost(models.Model):
+class GroupPost(CounterMixin, models.Model):
     group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='posts')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='group_posts')
     content = models.TextField()
@@ -235,11 +381,23 @@ class GroupPost(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_pinned = models.BooleanField(default=False)
     
+    # Denormalized engagement counters (see rebuild_counters command)
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    
     class Meta:
         ordering = ['-is_pinned', '-created_at']
+        indexes = [
+            models.Index(fields=['group', '-created_at', '-id'], name='core_grouppost_feed_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} in {self.group.name} - {self.created_at}"
+    
+    def get_image_url(self, size=None):
+        if size:
+            return images.derivative_url(self.image, 'feed', size)
+        return self.image.url if self.image else None
 
 
 class GroupComment(models.Model):
@@ -303,8 +461,15 @@ class Notification(models.Model):
     related_group = models.ForeignKey(Group, on_delete=models.CASCADE, null=True, blank=True)
     related_group_post = models.ForeignKey(GroupPost, on_delete=models.CASCADE, null=True, blank=True)
     
+    # Coalesced notifications: how many people acted (see NotificationActor), most recent first
+    actor_count = models.PositiveIntegerField(default=1)
+    recent_actor_ids = models.JSONField(default=list, blank=True)
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['recipient', 'notification_type', '-created_at'], name='core_notif_aggregate_idx'),
+        ]
     
     def __str__(self):
         return f"{self.notification_type} for {self.recipient.username}"
@@ -313,7 +478,7 @@ class Notification(models.Model):
     def create_notification(cls, recipient, sender, notification_type, title, message='', link='', **kwargs):
         """Helper method to create notifications"""
         if recipient != sender:  # Don't notify users about their own actions
-            return cls.objects.create(
+            notification = cls.objects.create(
                 recipient=recipient,
                 sender=sender,
                 notification_type=notification_type,
@@ -322,7 +487,88 @@ class Notification(models.Model):
                 link=link,
                 **kwargs
             )
+            notifications.adjust_unread(recipient.id, 1)
+            realtime.publish(recipient.id, 'notification', {
+                'id': notification.id,
+                'type': notification_type,
+                'title': title,
+                'link': link
+            })
+            return notification
         return None
+    
+    @classmethod
+    def create_aggregated_notification(cls, recipient, sender, notification_type, verb, message='', link='', **kwargs):
+        """Fold repeated events on the same post into one rolling notification"""
+        if recipient == sender:
+            return None
+        
+        since = timezone.now() - notifications.AGGREGATE_WINDOW
+        with transaction.atomic():
+            notification = cls.objects.select_for_update().filter(
+                recipient=recipient,
+                notification_type=notification_type,
+                related_post=kwargs.get('related_post'),
+                related_group_post=kwargs.get('related_group_post'),
+                created_at__gte=since
+            ).first()
+            
+            if notification is None:
+                notification = cls.create_notification(
+                    recipient=recipient,
+                    sender=sender,
+                    notification_type=notification_type,
+                    title=notifications.aggregate_title(sender.username, 1, verb),
+                    message=message,
+                    link=link,
+                    recent_actor_ids=[sender.id],
+                    **kwargs
+                )
+                NotificationActor.objects.create(notification_id=notification.id, actor=sender)
+                return notification
+            
+            # Someone acting again (e.g. re-liking after an unlike) moves to the front but is counted once
+            actor = NotificationActor.objects.filter(notification_id=notification.id, actor=sender)
+            if not actor.exists():
+                NotificationActor.objects.bulk_create(
+                    [NotificationActor(notification_id=notification.id, actor=sender)], ignore_conflicts=True
+                )
+                notification.actor_count += 1
+            recent = notification.recent_actor_ids or []
+            notification.recent_actor_ids = ([sender.id] + [i for i in recent if i != sender.id])[:notifications.RECENT_ACTORS]
+            was_read = notification.is_read
+            
+            notification.sender = sender
+            notification.title = notifications.aggregate_title(sender.username, notification.actor_count, verb)
+            notification.message = message
+            notification.link = link
+            notification.is_read = False
+            notification.created_at = timezone.now()
+            notification.save(update_fields=[
+                'sender', 'title', 'message', 'link', 'is_read', 'created_at',
+                'actor_count', 'recent_actor_ids'
+            ])
+        
+        if was_read:
+            notifications.adjust_unread(recipient.id, 1)
+        realtime.publish(recipient.id, 'notification', {
+            'id': notification.id,
+            'type': notification_type,
+            'title': notification.title,
+            'link': link
+        })
+        return notification
+
+
+class NotificationActor(models.Model):
+    """One person who acted on a coalesced notification, so each is counted once"""
+    notification_id = models.BigIntegerField()  # Not a foreign key: notifications may be partitioned (core/archive.py)
+    actor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['notification_id', 'actor'], name='core_notificationactor_uniq'),
+        ]
 
 
 # ==================== SHARE MODEL ====================
@@ -371,3 +617,89 @@ class Block(models.Model):
         blocked_by_ids = set(cls.objects.filter(blocked=user).values_list('blocker_id', flat=True))
         return blocked_ids | blocked_by_ids
 
+
+
+# ==================== TIMELINE MODEL ====================
+
+class TimelineEntry(models.Model):
+    """Materialized home feed row: one per (feed owner, post) pair"""
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()  # Copied from the post so the feed is one index range
+    
+    class Meta:
+        unique_together = ('owner', 'post')
+        ordering = ['-created_at', '-post']
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-post'], name='core_timeline_feed_idx'),
+            models.Index(fields=['owner', 'author'], name='core_timeline_author_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.post} in {self.owner.username}'s timeline"
+
+
+# ==================== FRIEND SUGGESTION MODEL ====================
+
+class FriendSuggestion(models.Model):
+    """Precomputed "People you may know" candidate, ranked by mutual friends"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='friend_suggestions')
+    candidate = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    mutual_count = models.PositiveIntegerField()
+    computed_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        unique_together = ('user', 'candidate')
+        ordering = ['-mutual_count', 'candidate']
+        indexes = [
+            models.Index(fields=['user', '-mutual_count'], name='core_suggestion_rank_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.candidate.username} for {self.user.username} ({self.mutual_count} mutual)"
+
+
+# ==================== SEARCH MODEL ====================
+
+class SearchDocument(models.Model):
+    """
+    Searchable text of one post, group post, comment or group (see core/search.py).
+    
+    The full-text index itself (FTS5 table and triggers on SQLite, GIN index on
+    Postgres) is created by migration 0014, not by Django's schema editor.
+    """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, null=True, blank=True, related_name='search_document')
+    group_post = models.OneToOneField(GroupPost, on_delete=models.CASCADE, null=True, blank=True, related_name='search_document')
+    comment = models.OneToOneField(Comment, on_delete=models.CASCADE, null=True, blank=True, related_name='search_document')
+    group = models.OneToOneField(Group, on_delete=models.CASCADE, null=True, blank=True, related_name='search_document')
+    scope_group = models.ForeignKey(Group, on_delete=models.CASCADE, null=True, blank=True, related_name='+')  # Group whose privacy applies
+    author = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    text = models.TextField()
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.kind}: {self.text[:50]}"
+    
+    @property
+    def kind(self):
+        if self.post_id:
+            return 'post'
+        if self.group_post_id:
+            return 'group_post'
+        if self.comment_id:
+            return 'comment'
+        return 'group'
+
+
+# ==================== MEDIA STORAGE MODEL ====================
+
+class StoredBlob(models.Model):
+    """One content-addressed media file and how many file fields reference it (see core/storage.py)"""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
@@ -0,0 +1,197 @@
+"""
+Notification plumbing shared by the views.
+
+Unread counter: the badge on every page polls the unread count, so instead
+of running ``COUNT(*) ... WHERE is_read = false`` each time, the count is
+cached and adjusted in place whenever notifications are created, read or
+deleted. A missing key is recomputed from the database on the next read,
+so any update that cannot be applied incrementally simply deletes the key.
+Adjustments are applied when the surrounding transaction commits: a write
+that rolls back never moves the count, and a recount racing the write sees
+the same rows the adjustment is about.
+
+Clearing: "clear all" deletes in the background (``retention.clear_all``);
+meanwhile a cached cursor hides everything up to the newest cleared id, so
+lists go through ``visible()`` rather than ``user.notifications``.
+
+Group post fan-out: notifying every member of a group is done by a
+background job with chunked bulk inserts. Groups larger than
+``GROUP_FANOUT_LIMIT`` get no per-member rows at all; members see their
+posts through the pull-based ``get_group_activity()`` instead.
+
+Coalescing: likes, comments and shares on the same post are folded into one
+rolling notification per recipient (``Notification.create_aggregated_notification``)
+as long as the previous one is younger than ``AGGREGATE_WINDOW``. The row keeps
+an actor count and the last few actor ids and is re-titled on every event;
+who has already been counted is one ``NotificationActor`` row per person, so
+an event costs a unique-index lookup however many people acted before.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import realtime
+
+
+UNREAD_TTL = getattr(settings, 'NOTIFICATION_UNREAD_TTL', 60 * 60 * 24)
+
+
+def _unread_key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def get_unread_count(user):
+    """Unread notification count for a user, from the cache when possible"""
+    key = _unread_key(user.id)
+    count = cache.get(key)
+    if count is None:
+        count = unread(user).count()
+        cache.add(key, count, UNREAD_TTL)  # add(), so a concurrent incr() is not overwritten
+    return count
+
+
+def adjust_unread(user_id, delta):
+    """Apply an increment/decrement to a cached count once the current transaction commits"""
+    transaction.on_commit(lambda: _adjust_unread(user_id, delta))
+
+
+def _adjust_unread(user_id, delta):
+    """No-op when the count is not cached"""
+    key = _unread_key(user_id)
+    try:
+        if cache.incr(key, delta) < 0:
+            cache.delete(key)
+    except ValueError:
+        pass  # Not cached: the next read recounts
+
+
+def reset_unread(user_id):
+    """All of the user's notifications were just read or deleted"""
+    cache.set(_unread_key(user_id), 0, UNREAD_TTL)
+
+
+def invalidate_unread(user_ids):
+    """Drop cached counts that can't be adjusted cheaply (e.g. after bulk inserts)"""
+    cache.delete_many([_unread_key(user_id) for user_id in user_ids])
+
+
+def invalidate_unread_for(queryset):
+    """Invalidate counts of everyone with an unread notification in `queryset` (call before a cascade delete)"""
+    invalidate_unread(queryset.filter(is_read=False).values_list('recipient_id', flat=True).distinct())
+
+
+# ==================== CLEARING ====================
+
+HIDDEN_TTL = 60 * 60  # Far longer than a background clear takes
+
+
+def _hidden_key(user_id):
+    return f'notifications:hidden:{user_id}'
+
+
+def hidden_through(user_id):
+    """Newest id of a "clear all" that may still be deleting, or 0"""
+    return cache.get(_hidden_key(user_id), 0)
+
+
+def hide_through(user_id, notification_id):
+    cache.set(_hidden_key(user_id), notification_id, HIDDEN_TTL)
+
+
+def unhide(user_id, notification_id):
+    """The clear up to `notification_id` has finished (unless a newer one is running)"""
+    if hidden_through(user_id) == notification_id:
+        cache.delete(_hidden_key(user_id))
+
+
+def visible(user):
+    """The user's notifications, minus any being cleared"""
+    return user.notifications.filter(id__gt=hidden_through(user.id))
+
+
+def unread(user):
+    """What the unread badge counts: visible unread notifications in the hot window (see core/archive.py)"""
+    from .archive import hot_since
+    
+    return visible(user).filter(is_read=False, created_at__gte=hot_since())
+
+
+def counts_as_unread(notification):
+    """Whether `notification` is part of its recipient's unread count"""
+    from .archive import hot_since
+    
+    return not notification.is_read and notification.created_at >= hot_since()
+
+
+# ==================== COALESCING ====================
+
+AGGREGATE_WINDOW = timedelta(hours=getattr(settings, 'NOTIFICATION_AGGREGATE_HOURS', 24))
+RECENT_ACTORS = 3
+
+
+def aggregate_title(username, actor_count, verb):
+    """'alice liked your post' / 'alice and 41 others liked your post'"""
+    others = actor_count - 1
+    if others <= 0:
+        return f'{username} {verb}'
+    if others == 1:
+        return f'{username} and 1 other {verb}'
+    return f'{username} and {others} others {verb}'
+
+
+# ==================== GROUP POST FAN-OUT ====================
+
+FANOUT_CHUNK_SIZE = 1000
+GROUP_FANOUT_LIMIT = getattr(settings, 'GROUP_FANOUT_LIMIT', 5000)
+
+
+def fan_out_group_post(post_id):
+    """Background job: notify approved members of a new group post in chunks"""
+    from .models import GroupPost, GroupMembership, Notification
+    
+    post = GroupPost.objects.select_related('group', 'user').filter(id=post_id).first()
+    if post is None:
+        return  # Deleted before the job ran
+    
+    if post.group.approved_member_count > GROUP_FANOUT_LIMIT:
+        return  # Pull-based: see get_group_activity()
+    members = GroupMembership.objects.filter(group_id=post.group_id, status='approved').exclude(user_id=post.user_id)
+    
+    group = post.group
+    title = f'New post in {group.name}'
+    message = f'{post.user.username} posted in {group.name}'
+    link = f'/group/{group.id}/'
+    
+    recipient_ids = list(members.values_list('user_id', flat=True))
+    for start in range(0, len(recipient_ids), FANOUT_CHUNK_SIZE):
+        chunk = recipient_ids[start:start + FANOUT_CHUNK_SIZE]
+        Notification.objects.bulk_create([
+            Notification(
+                recipient_id=user_id,
+                sender_id=post.user_id,
+                notification_type='group_post',
+                title=title,
+                message=message,
+                link=link,
+                related_group_id=group.id,
+                related_group_post_id=post.id
+            )
+            for user_id in chunk
+        ])
+        invalidate_unread(chunk)
+        realtime.publish(chunk, 'notification', {'type': 'group_post', 'title': title, 'link': link})
+
+
+def get_group_activity(user, limit=10):
+    """Recent posts in the user's groups that are too large for per-member notifications"""
+    from .models import GroupPost, GroupMembership
+    
+    large_group_ids = GroupMembership.objects.filter(
+        user=user, status='approved', group__approved_member_count__gt=GROUP_FANOUT_LIMIT
+    ).values_list('group_id', flat=True)
+    
+    return GroupPost.objects.filter(
+        group_id__in=list(large_group_ids)
+    ).exclude(user=user).select_related('group', 'user').order_by('-created_at')[:limit]
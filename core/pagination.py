@@ -0,0 +1,111 @@
+"""
+Keyset (cursor) pagination for feeds.
+
+Pages are ordered by ``(created_at, id)`` descending and the cursor encodes
+the last row of the previous page, so fetching page N costs the same as
+fetching page 1 no matter how old the account is.
+
+``paginate_merged()`` pages through several querysets as one stream (e.g.
+a profile's posts and shares). Each source is read with the same keyset
+filter, so a page costs one bounded query per source; the cursor also
+carries the source kind, because ids of different tables can collide.
+"""
+import base64
+import heapq
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+
+
+PAGE_SIZE = getattr(settings, 'FEED_PAGE_SIZE', 20)
+
+
+def encode_cursor(created_at, pk):
+    raw = f'{created_at.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (created_at, pk) or None if the cursor is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def encode_merged_cursor(created_at, kind, pk):
+    raw = f'{created_at.isoformat()}|{kind}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_merged_cursor(cursor):
+    """Return (created_at, kind, pk) or None if the cursor is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, kind, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), kind, int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def paginate(queryset, cursor=None, page_size=PAGE_SIZE, date_field='created_at', id_field='id'):
+    """
+    Return (items, next_cursor) for one page of `queryset`.
+    
+    `next_cursor` is None on the last page.
+    """
+    queryset = queryset.order_by(f'-{date_field}', f'-{id_field}')
+    
+    position = decode_cursor(cursor)
+    if position:
+        created_at, pk = position
+        queryset = queryset.filter(
+            Q(**{f'{date_field}__lt': created_at}) |
+            Q(**{date_field: created_at, f'{id_field}__lt': pk})
+        )
+    
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, date_field), getattr(last, id_field))
+    return items, next_cursor
+
+
+def paginate_merged(sources, cursor=None, page_size=PAGE_SIZE):
+    """
+    Return (items, next_cursor) for one page of several querysets merged
+    into one stream, newest first.
+    
+    `sources` maps a kind name to a queryset with ``created_at`` and ``id``;
+    items are ``(kind, obj)`` pairs ordered by ``(created_at, kind, id)``
+    descending. `next_cursor` is None on the last page.
+    """
+    position = decode_merged_cursor(cursor)
+    pages = []
+    for kind, queryset in sources.items():
+        queryset = queryset.order_by('-created_at', '-id')
+        if position:
+            created_at, after_kind, pk = position
+            older = Q(created_at__lt=created_at)
+            if kind < after_kind:
+                older |= Q(created_at=created_at)
+            elif kind == after_kind:
+                older |= Q(created_at=created_at, id__lt=pk)
+            queryset = queryset.filter(older)
+        pages.append([((obj.created_at, kind, obj.id), obj) for obj in queryset[:page_size + 1]])
+    
+    merged = list(heapq.merge(*pages, key=lambda entry: entry[0], reverse=True))
+    next_cursor = None
+    if len(merged) > page_size:
+        merged = merged[:page_size]
+        next_cursor = encode_merged_cursor(*merged[-1][0])
+    return [(kind, obj) for (_, kind, _), obj in merged], next_cursor
@@ -0,0 +1,186 @@
+"""
+Online presence backed by the cache.
+
+Heartbeats (``touch()``) go to the cache, keyed per user, and status reads
+(``last_seen()``) are answered from there, so polling a contact's status
+no longer loads or writes a ``User`` row. ``User.last_active`` is still
+kept for the cold-cache case, but it is written behind: heartbeats are
+buffered per process and flushed with one bulk UPDATE per batch at most
+every ``PRESENCE_FLUSH_SECONDS``. A timer flushes a buffer that no later
+heartbeat comes along to flush, and whatever is left is written when the
+process exits.
+
+Heartbeats come from ``PresenceMiddleware`` (any authenticated request),
+login, sending a message and the open SSE connection.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import jobs
+
+
+logger = logging.getLogger(__name__)
+
+ONLINE_WINDOW = timedelta(minutes=2)
+HEARTBEAT_SECONDS = getattr(settings, 'PRESENCE_HEARTBEAT_SECONDS', 30)
+FLUSH_SECONDS = getattr(settings, 'PRESENCE_FLUSH_SECONDS', 60)
+FLUSH_BATCH_SIZE = 500
+PRESENCE_TTL = 60 * 60 * 24 * 7
+
+_lock = threading.Lock()
+_pending = {}  # user_id -> last heartbeat not yet written to the database
+_last_touch = {}  # user_id -> monotonic time of the last cache write from this process
+_last_flush = time.monotonic()
+_flush_scheduled = False
+_timer = None  # Flushes the buffer FLUSH_SECONDS after it stops being empty
+
+
+def _presence_key(user_id):
+    return f'presence:{user_id}'
+
+
+def touch(user_id, force=False):
+    """Record a heartbeat; cheap enough to call on every request"""
+    global _flush_scheduled, _timer
+
+    now = time.monotonic()
+    with _lock:
+        if not force and now - _last_touch.get(user_id, 0) < HEARTBEAT_SECONDS:
+            return
+        _last_touch[user_id] = now
+        seen = timezone.now()
+        _pending[user_id] = seen
+        due = not _flush_scheduled and (
+            now - _last_flush >= FLUSH_SECONDS or len(_pending) >= FLUSH_BATCH_SIZE
+        )
+        if due:
+            _flush_scheduled = True
+        elif _timer is None:
+            _timer = threading.Timer(FLUSH_SECONDS, _flush_later)
+            _timer.daemon = True
+            _timer.start()
+
+    cache.set(_presence_key(user_id), seen, PRESENCE_TTL)
+    if due:
+        jobs.enqueue(flush)
+
+
+def _flush_later():
+    global _timer
+
+    with _lock:
+        _timer = None
+    jobs.enqueue(flush)
+
+
+def flush():
+    """Write buffered heartbeats to User.last_active in bulk"""
+    from .models import User
+    global _pending, _last_flush, _flush_scheduled, _timer
+
+    with _lock:
+        pending, _pending = _pending, {}
+        _last_flush = time.monotonic()
+        _flush_scheduled = False
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+        # Drop throttle entries that can no longer suppress a heartbeat
+        for user_id, touched in list(_last_touch.items()):
+            if _last_flush - touched >= HEARTBEAT_SECONDS:
+                del _last_touch[user_id]
+
+    if pending:
+        User.objects.bulk_update(
+            [User(id=user_id, last_active=seen) for user_id, seen in pending.items()],
+            ['last_active'],
+            batch_size=FLUSH_BATCH_SIZE
+        )
+    return len(pending)
+
+
+@atexit.register
+def _flush_at_exit():
+    if not _pending:
+        return
+    try:
+        flush()
+    except Exception:
+        logger.exception('Could not write buffered presence heartbeats at exit')
+
+
+def last_seen(user_id, default=None):
+    """Last heartbeat for a user; falls back to the stored last_active"""
+    seen = cache.get(_presence_key(user_id))
+    if seen is None:
+        if default is None:
+            from .models import User
+            default = User.objects.filter(id=user_id).values_list('last_active', flat=True).first()
+        seen = default
+        if seen is not None:
+            cache.add(_presence_key(user_id), seen, PRESENCE_TTL)
+    return seen
+
+
+def last_seen_many(user_ids):
+    """{user_id: last heartbeat} from one cache multi-get and at most one query"""
+    keys = {_presence_key(user_id): user_id for user_id in set(user_ids)}
+    seen = {keys[key]: value for key, value in cache.get_many(keys).items()}
+
+    missing = [user_id for user_id in keys.values() if user_id not in seen]
+    if missing:
+        from .models import User
+        stored = dict(User.objects.filter(id__in=missing).values_list('id', 'last_active'))
+        for user_id, last_active in stored.items():
+            cache.add(_presence_key(user_id), last_active, PRESENCE_TTL)
+        seen.update(stored)
+    return seen
+
+
+def is_online(seen):
+    if not seen:
+        return False
+    return timezone.now() - seen < ONLINE_WINDOW
+
+
+def display(seen):
+    """Human-readable status for a last-seen timestamp"""
+    if is_online(seen):
+        return 'Active now'
+
+    if not seen:
+        return 'Offline'
+
+    diff = timezone.now() - seen
+
+    if diff.days > 0:
+        return f'Active {diff.days}d ago'
+    elif diff.seconds >= 3600:
+        hours = diff.seconds // 3600
+        return f'Active {hours}h ago'
+    elif diff.seconds >= 60:
+        minutes = diff.seconds // 60
+        return f'Active {minutes}m ago'
+    else:
+        return 'Active just now'
+
+
+def status(user_id, default=None):
+    """(is_online, display text) for one user"""
+    seen = last_seen(user_id, default)
+    return is_online(seen), display(seen)
+
+
+def statuses(user_ids):
+    """{user_id: {'is_online', 'status'}} for many users at once"""
+    return {
+        user_id: {'is_online': is_online(seen), 'status': display(seen)}
+        for user_id, seen in last_seen_many(user_ids).items()
+    }
@@ -0,0 +1,203 @@
+"""
+Server-push channel for new messages, notifications and presence changes.
+
+Clients hold one Server-Sent Events connection (``/events/``) served by an
+async view under ASGI. Sync code anywhere in the app calls ``publish()``;
+the configured broker delivers the event to every connection of the target
+user. ``InProcessBroker`` only reaches connections on the same worker;
+``RedisBroker`` relays events through Redis pub/sub so several workers can
+share them. Select one with the ``REALTIME_BROKER`` setting. If Redis goes
+away its listener reconnects with exponential backoff; events published in
+the gap are lost, and clients catch up on their next fetch.
+
+Django 4.2 never tells a streaming response that its client went away, and
+uvicorn silently drops writes to a closed connection, so ``stream()`` watches
+the connection's ASGI ``receive`` channel for ``http.disconnect`` itself
+(``KeepReceiveMiddleware`` in ``asgi.py`` leaves it in the scope). As a
+backstop, a stream also ends after ``MAX_STREAM_SECONDS`` and the browser
+reconnects after the ``retry:`` delay.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+from asgiref.sync import sync_to_async
+
+from . import presence
+
+
+HEARTBEAT_SECONDS = getattr(settings, 'REALTIME_HEARTBEAT_SECONDS', 20)
+MAX_STREAM_SECONDS = getattr(settings, 'REALTIME_MAX_STREAM_SECONDS', 300)
+RECEIVE_SCOPE_KEY = 'social_connect.receive'
+RECONNECT_MAX_SECONDS = 30
+
+# Events buffered per connection before the slowest ones start being dropped
+QUEUE_SIZE = 100
+
+logger = logging.getLogger(__name__)
+
+
+def _deliver(queue, event):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        pass  # Client is not keeping up; it resyncs on its next fetch anyway
+
+
+class InProcessBroker:
+    """Fan events out to subscribers connected to this worker process"""
+    
+    def __init__(self):
+        self._subscribers = {}  # user_id -> set of (event loop, queue)
+        self._lock = threading.Lock()
+    
+    def subscribe(self, user_id):
+        subscription = (asyncio.get_running_loop(), asyncio.Queue(maxsize=QUEUE_SIZE))
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+    
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(user_id)
+            if subscriptions:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[user_id]
+    
+    def publish(self, user_id, event):
+        self.deliver_local(user_id, event)
+    
+    def deliver_local(self, user_id, event):
+        with self._lock:
+            subscriptions = list(self._subscribers.get(user_id, ()))
+        for loop, queue in subscriptions:
+            loop.call_soon_threadsafe(_deliver, queue, event)
+
+
+class RedisBroker(InProcessBroker):
+    """Relay events between workers through a Redis pub/sub channel"""
+    
+    CHANNEL = 'social_connect:realtime'
+    
+    def __init__(self):
+        super().__init__()
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('RedisBroker requires the "redis" package')
+        
+        self._redis = redis.Redis.from_url(settings.REALTIME_REDIS_URL)
+        self._listener = threading.Thread(target=self._listen, name='realtime-redis', daemon=True)
+        self._listener.start()
+    
+    def publish(self, user_id, event):
+        self._redis.publish(self.CHANNEL, json.dumps({'user_id': user_id, 'event': event}))
+    
+    def _listen(self):
+        delay = 1
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.CHANNEL)
+                delay = 1
+                for message in pubsub.listen():
+                    try:
+                        payload = json.loads(message['data'])
+                        self.deliver_local(payload['user_id'], payload['event'])
+                    except (ValueError, KeyError, TypeError):
+                        logger.warning('Ignoring malformed realtime event: %r', message['data'])
+                logger.warning('Realtime Redis subscription ended; reconnecting in %ss', delay)
+            except Exception:
+                logger.exception('Realtime Redis listener failed; reconnecting in %ss', delay)
+            finally:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+            time.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'REALTIME_BROKER', 'core.realtime.InProcessBroker'))()
+    return _broker
+
+
+def publish(user_ids, event_type, data):
+    """Push an event to every connection of the given user(s) once the transaction commits"""
+    if isinstance(user_ids, int):
+        user_ids = [user_ids]
+    event = {'type': event_type, 'data': data}
+    
+    def send():
+        broker = get_broker()
+        for user_id in user_ids:
+            broker.publish(user_id, event)
+    
+    transaction.on_commit(send)
+
+
+def format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+class KeepReceiveMiddleware:
+    """ASGI wrapper putting each HTTP connection's receive channel in its scope, for stream()"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            scope = {**scope, RECEIVE_SCOPE_KEY: receive}
+        return await self.app(scope, receive, send)
+
+
+async def _disconnected(receive):
+    """Wait for the client to close the connection (the request body has already been read)"""
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def stream(user_id, receive=None):
+    """Async generator of SSE frames for one client connection; `receive` is its ASGI receive channel"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + MAX_STREAM_SECONDS
+    broker = get_broker()
+    subscription = broker.subscribe(user_id)
+    _, queue = subscription
+    disconnect = asyncio.ensure_future(_disconnected(receive)) if receive else None
+    try:
+        yield 'retry: 5000\n\n'
+        while loop.time() < deadline:
+            getter = asyncio.ensure_future(queue.get())
+            waiting = {getter, disconnect} if disconnect else {getter}
+            done, _ = await asyncio.wait(waiting, timeout=HEARTBEAT_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+            if getter not in done:
+                getter.cancel()
+            if disconnect in done:
+                return
+            if getter in done:
+                yield format_event(getter.result())
+                continue
+            await sync_to_async(presence.touch)(user_id)  # An open stream counts as online
+            yield ': ping\n\n'  # Keeps proxies from closing an idle connection
+    finally:
+        if disconnect:
+            disconnect.cancel()
+        broker.unsubscribe(user_id, subscription)
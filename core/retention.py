@@ -0,0 +1,113 @@
+"""
+How long notifications are kept.
+
+Each notification type has a time to live (``TTL_DAYS``, falling back to
+``DEFAULT_TTL_DAYS``), and nobody keeps more than ``MAX_PER_USER`` of them;
+``prune()`` deletes whatever is past either limit. It is run by the
+``prune_notifications`` command, meant to be scheduled (e.g. hourly).
+The same command drops the ``NotificationActor`` rows of notifications past
+the coalescing window, which no event can be folded into any more.
+
+Deletes go through ``delete_in_batches()``: the rows are walked in primary
+key order and removed ``BATCH_SIZE`` at a time, each range in its own short
+transaction, so a large delete never holds locks on the table for long.
+"Clear all" uses the same path as a background job; until it finishes, the
+cleared rows are hidden by a cursor kept in the cache
+(``notifications.hide_through``).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from . import jobs, notifications
+from .models import Notification, NotificationActor
+
+
+TTL_DAYS = getattr(settings, 'NOTIFICATION_TTL_DAYS', {
+    'message': 30,
+    'post_like': 60,
+    'group_like': 60,
+    'post_share': 60,
+    'group_post': 30,
+})
+DEFAULT_TTL_DAYS = getattr(settings, 'NOTIFICATION_DEFAULT_TTL_DAYS', 180)
+MAX_PER_USER = getattr(settings, 'NOTIFICATION_MAX_PER_USER', 1000)
+BATCH_SIZE = 1000
+
+
+def delete_in_batches(queryset, batch_size=BATCH_SIZE):
+    """Delete the notifications in `queryset` by primary key ranges of at most `batch_size` rows; returns rows deleted"""
+    queryset = queryset.order_by()
+    deleted = 0
+    low = 0
+    while True:
+        remaining = queryset.filter(id__gt=low)
+        edge = list(remaining.order_by('id').values_list('id', flat=True)[batch_size - 1:batch_size])
+        batch = remaining.filter(id__lte=edge[0]) if edge else remaining
+        with transaction.atomic():
+            notifications.invalidate_unread_for(batch)
+            count, _ = batch.delete()
+        deleted += count
+        if not edge:
+            return deleted
+        low = edge[0]
+
+
+def expired(now=None):
+    """Notifications older than the TTL of their type"""
+    now = now or timezone.now()
+    condition = Q(
+        created_at__lt=now - timedelta(days=DEFAULT_TTL_DAYS)
+    ) & ~Q(notification_type__in=list(TTL_DAYS))
+    for notification_type, days in TTL_DAYS.items():
+        condition |= Q(notification_type=notification_type, created_at__lt=now - timedelta(days=days))
+    return Notification.objects.filter(condition)
+
+
+def over_limit():
+    """For each user with more than MAX_PER_USER notifications, a queryset of the ones past their newest MAX_PER_USER"""
+    user_ids = Notification.objects.values('recipient_id').annotate(
+        total=Count('id')
+    ).filter(total__gt=MAX_PER_USER).values_list('recipient_id', flat=True)
+    for user_id in list(user_ids):
+        newest = Notification.objects.filter(recipient_id=user_id).order_by('-id').values_list('id', flat=True)
+        oldest_kept = newest[MAX_PER_USER - 1]
+        yield Notification.objects.filter(recipient_id=user_id, id__lt=oldest_kept)
+
+
+def prune(now=None, batch_size=BATCH_SIZE):
+    """Delete expired notifications, then everyone's beyond MAX_PER_USER; returns rows deleted per rule"""
+    deleted = {'expired': delete_in_batches(expired(now), batch_size)}
+    deleted['over_limit'] = sum(delete_in_batches(queryset, batch_size) for queryset in over_limit())
+    return deleted
+
+
+def prune_actors(now=None, batch_size=BATCH_SIZE):
+    """Delete the actor rows of notifications older than the coalescing window; returns rows deleted"""
+    now = now or timezone.now()
+    still_open = Notification.objects.filter(created_at__gte=now - notifications.AGGREGATE_WINDOW).values('id')
+    stale = NotificationActor.objects.exclude(notification_id__in=still_open)
+    deleted = 0
+    while True:
+        ids = list(stale.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += NotificationActor.objects.filter(id__in=ids).delete()[0]
+
+
+def clear_all(user_id):
+    """Hide all of a user's notifications now and delete them in the background"""
+    through = Notification.objects.filter(recipient_id=user_id).aggregate(Max('id'))['id__max']
+    if through is None:
+        return
+    notifications.hide_through(user_id, through)
+    notifications.reset_unread(user_id)
+    jobs.enqueue(_clear, user_id, through)
+
+
+def _clear(user_id, through):
+    delete_in_batches(Notification.objects.filter(recipient_id=user_id, id__lte=through))
+    notifications.unhide(user_id, through)
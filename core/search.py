@@ -0,0 +1,173 @@
+"""
+Full-text search over posts, group posts, comments and groups.
+
+Every searchable object has one ``SearchDocument`` row holding its text,
+author and (for group content) the group whose privacy applies. The views
+call ``index_object()`` when something is created or edited; deletes are
+handled by the ``ON DELETE CASCADE`` foreign keys. The inverted index on
+``SearchDocument.text`` depends on the database:
+
+* SQLite: an external-content FTS5 table, ``core_searchdocument_fts``,
+  kept in sync by triggers and ranked with bm25.
+* Postgres: a GIN index on ``to_tsvector('english', text)``, ranked with
+  ``ts_rank``.
+
+Both are created in migration 0014. Every query term is matched as a
+prefix, and terms are ANDed. Results skip anything by or about a blocked
+user (their posts, comments on their posts, their groups and what is in
+them) and content of private groups the viewer doesn't belong to. Pages are
+keyset-paginated on ``(rank, id)``.
+"""
+import base64
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from . import graph
+from .models import Post, GroupPost, Comment, Group, GroupMembership, SearchDocument
+
+
+PAGE_SIZE = getattr(settings, 'SEARCH_PAGE_SIZE', 20)
+MAX_TERMS = 8
+BATCH_SIZE = 1000
+
+
+def _document(obj):
+    """(lookup, fields) describing the SearchDocument for a model instance"""
+    if isinstance(obj, Post):
+        return {'post': obj}, {'text': obj.content, 'author_id': obj.user_id, 'scope_group': None, 'created_at': obj.created_at}
+    if isinstance(obj, GroupPost):
+        return {'group_post': obj}, {'text': obj.content, 'author_id': obj.user_id, 'scope_group_id': obj.group_id, 'created_at': obj.created_at}
+    if isinstance(obj, Comment):
+        return {'comment': obj}, {'text': obj.content, 'author_id': obj.user_id, 'scope_group': None, 'created_at': obj.created_at}
+    if isinstance(obj, Group):
+        text = f'{obj.name}\n{obj.description}'.strip()
+        return {'group': obj}, {'text': text, 'author_id': obj.creator_id, 'scope_group_id': obj.id, 'created_at': obj.created_at}
+    raise TypeError(f'{type(obj).__name__} is not searchable')
+
+
+def index_object(obj):
+    """Add or refresh an object's search document"""
+    lookup, fields = _document(obj)
+    SearchDocument.objects.update_or_create(**lookup, defaults=fields)
+
+
+def remove_object(obj):
+    """Drop an object's search document (deleting the object does this already)"""
+    lookup, _ = _document(obj)
+    SearchDocument.objects.filter(**lookup).delete()
+
+
+def rebuild_index():
+    """Recreate every search document; returns the number indexed"""
+    SearchDocument.objects.all().delete()
+    total = 0
+    for queryset in (Post.objects.all(), GroupPost.objects.all(), Comment.objects.all(), Group.objects.all()):
+        batch = []
+        for obj in queryset.iterator(chunk_size=BATCH_SIZE):
+            lookup, fields = _document(obj)
+            batch.append(SearchDocument(**lookup, **fields))
+            if len(batch) >= BATCH_SIZE:
+                SearchDocument.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        SearchDocument.objects.bulk_create(batch)
+        total += len(batch)
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO core_searchdocument_fts(core_searchdocument_fts) VALUES ('rebuild')")
+    return total
+
+
+def encode_cursor(rank, pk):
+    raw = f'{rank!r}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (rank, pk) or None if the cursor is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        rank, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return float(rank), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _terms(query):
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def _match(queryset, terms):
+    """
+    Restrict to documents containing every term (as a prefix). Returns the
+    queryset, the SQL of the rank, its params and whether higher ranks are
+    better.
+    """
+    if connection.vendor == 'sqlite':
+        queryset = queryset.extra(
+            tables=['core_searchdocument_fts'],
+            where=['core_searchdocument_fts.rowid = core_searchdocument.id', 'core_searchdocument_fts MATCH %s'],
+            params=[' '.join(f'"{term}"*' for term in terms)]
+        )
+        return queryset, 'bm25(core_searchdocument_fts)', [], False
+    if connection.vendor == 'postgresql':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        queryset = queryset.extra(
+            where=["to_tsvector('english', core_searchdocument.text) @@ to_tsquery('english', %s)"],
+            params=[tsquery]
+        )
+        # float8 so the rank survives the round trip through the cursor exactly
+        rank = "ts_rank(to_tsvector('english', core_searchdocument.text), to_tsquery('english', %s))::float8"
+        return queryset, rank, [tsquery], True
+    # No full-text index on other backends: substring scan, newest first
+    for term in terms:
+        queryset = queryset.filter(text__icontains=term)
+    return queryset, '0', [], False
+
+
+def search(viewer, query, cursor=None, page_size=PAGE_SIZE):
+    """
+    Return (documents, next_cursor) for one page of results visible to
+    `viewer`, best matches first. `next_cursor` is None on the last page.
+    """
+    terms = _terms(query)
+    if not terms:
+        return [], None
+
+    documents = SearchDocument.objects.select_related(
+        'author', 'post', 'group_post__group', 'comment__post__user', 'group'
+    )
+
+    blocked_ids = graph.get_graph(viewer.id).blocked_ids
+    if blocked_ids:
+        documents = documents.exclude(
+            Q(author_id__in=blocked_ids) |
+            Q(comment__post__user_id__in=blocked_ids) |
+            Q(scope_group__creator_id__in=blocked_ids)
+        )
+    member_group_ids = GroupMembership.objects.filter(user=viewer, status='approved').values('group_id')
+    documents = documents.filter(
+        Q(scope_group__isnull=True) | Q(scope_group__is_private=False) | Q(scope_group_id__in=member_group_ids)
+    )
+
+    documents, rank_sql, rank_params, descending = _match(documents, terms)
+    after = decode_cursor(cursor)
+    if after:
+        rank, pk = after
+        later = '<' if descending else '>'
+        documents = documents.extra(
+            where=[f'({rank_sql} {later} %s OR ({rank_sql} = %s AND core_searchdocument.id < %s))'],
+            params=[*rank_params, rank, *rank_params, rank, pk]
+        )
+    documents = documents.extra(select={'rank': rank_sql}, select_params=rank_params)
+    page = list(documents.order_by('-rank' if descending else 'rank', '-id')[:page_size + 1])
+    next_cursor = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        next_cursor = encode_cursor(page[-1].rank, page[-1].pk)
+    return page, next_cursor
@@ -0,0 +1,77 @@
+"""
+Model signal handlers that keep media reference counts and caches current.
+
+Connected in ``CoreConfig.ready()`` for every model with a file field, so
+deleting a post, message, group or user (directly or by cascade) releases
+its files, and so does replacing a file with a new upload. Deleting a user
+also drops them from every process's autocomplete index.
+
+Saving or deleting a friendship, friend request or block, from a view, the
+admin or a cascade, drops the cached social graphs of both users
+(``graph.invalidate``) right away and again once the transaction commits.
+"""
+from django.contrib.auth import get_user_model
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from . import autocomplete, graph, storage
+
+
+# The two users each relation in the social graph links
+GRAPH_EDGES = {
+    'Friendship': ('user_id', 'friend_id'),
+    'FriendRequest': ('from_user_id', 'to_user_id'),
+    'Block': ('blocker_id', 'blocked_id'),
+}
+
+
+def file_fields(model):
+    return [field.name for field in model._meta.get_fields() if isinstance(field, models.FileField)]
+
+
+def release_replaced_files(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Release files that this save replaces or clears"""
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    fields = [name for name in file_fields(sender) if update_fields is None or name in update_fields]
+    if not fields:
+        return
+    old = sender.objects.filter(pk=instance.pk).values(*fields).first()
+    if old is None:
+        return
+    for name in fields:
+        old_name = old[name]
+        if old_name and old_name != getattr(instance, name).name:
+            transaction.on_commit(lambda old_name=old_name: storage.release(old_name))
+
+
+def release_deleted_files(sender, instance, **kwargs):
+    """Release the files of a deleted row"""
+    for name in file_fields(sender):
+        field_file = getattr(instance, name)
+        if field_file:
+            transaction.on_commit(lambda stored=field_file.name: storage.release(stored))
+
+
+def forget_deleted_user(sender, instance, **kwargs):
+    user_id = instance.pk  # Cleared once the delete finishes
+    transaction.on_commit(lambda: autocomplete.user_removed(user_id))
+
+
+def invalidate_graphs(sender, instance, **kwargs):
+    """A friendship, friend request or block changed: both users' cached graphs are stale"""
+    user_ids = [getattr(instance, field) for field in GRAPH_EDGES[sender.__name__]]
+    graph.invalidate(*user_ids)
+    transaction.on_commit(lambda: graph.invalidate(*user_ids))  # Again, in case it was rebuilt before the commit
+
+
+def connect(app_config):
+    for model in app_config.get_models():
+        if file_fields(model):
+            pre_save.connect(release_replaced_files, sender=model, dispatch_uid=f'release_replaced_{model._meta.label}')
+            post_delete.connect(release_deleted_files, sender=model, dispatch_uid=f'release_deleted_{model._meta.label}')
+    post_delete.connect(forget_deleted_user, sender=get_user_model(), dispatch_uid='forget_deleted_user')
+    for model_name in GRAPH_EDGES:
+        model = app_config.get_model(model_name)
+        post_save.connect(invalidate_graphs, sender=model, dispatch_uid=f'invalidate_graphs_save_{model_name}')
+        post_delete.connect(invalidate_graphs, sender=model, dispatch_uid=f'invalidate_graphs_delete_{model_name}')
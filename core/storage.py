@@ -0,0 +1,124 @@
+"""
+Content-addressed media storage.
+
+Uploads are hashed (SHA-256) while they are streamed to disk and stored
+under their field's ``upload_to`` prefix by digest
+(``posts/3f/a9/3fa9...e1.jpg``), so identical bytes are stored once
+however many posts, messages or profiles use them. The original filename
+is not kept in the stored name.
+
+``StoredBlob`` counts the file fields referencing each stored object: a
+save adds a reference, and the signal handlers in ``core/signals.py``
+call ``release()`` when a row is deleted (including cascades) or its file
+is replaced. An object nobody references any more is deleted, together
+with its image derivatives, by a background job; ``collect_media`` sweeps
+up anything a job missed and can recount references from scratch.
+
+Names under ``derivatives/`` and ``defaults/`` are stored as-is, and files
+uploaded before this backend existed are never collected.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+from django.db.models import F
+
+from . import images, jobs
+
+
+PASSTHROUGH_PREFIXES = ('derivatives/', 'defaults/')
+
+
+def is_addressed(name):
+    return bool(name) and not name.startswith(PASSTHROUGH_PREFIXES)
+
+
+def addressed_name(name, digest):
+    """Stored name for content with `digest` uploaded as `name`"""
+    directory = posixpath.dirname(name)
+    ext = os.path.splitext(name)[1].lower()[:10]
+    return posixpath.join(directory, digest[:2], digest[2:4], f'{digest}{ext}')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that stores each distinct content once, named by its hash"""
+
+    @property
+    def temp_dir(self):
+        # Inside the media root, so moving a finished upload into place is an atomic rename
+        return getattr(settings, 'MEDIA_TEMP_DIR', None) or os.path.join(self.location, '.incoming')
+
+    def get_available_name(self, name, max_length=None):
+        if is_addressed(name):
+            return name  # The final name is chosen from the content in _save()
+        return super().get_available_name(name, max_length)
+
+    def _save(self, name, content):
+        if not is_addressed(name):
+            return super()._save(name, content)
+
+        os.makedirs(self.temp_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.temp_dir)
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                for chunk in content.chunks():
+                    hasher.update(chunk)
+                    temp.write(chunk)
+                    size += len(chunk)
+            name = addressed_name(name, hasher.hexdigest())
+            self._store(name, temp_path, size)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return name
+
+    def _store(self, name, temp_path, size):
+        """Move the hashed temp file into place unless the content is stored already; add a reference"""
+        from .models import StoredBlob
+
+        with transaction.atomic():
+            blob, _ = StoredBlob.objects.select_for_update().get_or_create(name=name, defaults={'size': size})
+            full_path = self.path(name)
+            if not os.path.exists(full_path):
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                os.replace(temp_path, full_path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+            StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+
+
+def release(name):
+    """Drop one reference to a stored object, queueing its collection when none are left"""
+    from .models import StoredBlob
+
+    if not is_addressed(name):
+        return
+    blobs = StoredBlob.objects.filter(name=name)
+    if blobs.filter(ref_count__gt=0).update(ref_count=F('ref_count') - 1) and blobs.filter(ref_count=0).exists():
+        jobs.enqueue(collect, name)
+
+
+def _delete_files(name):
+    for size in sorted({size for sizes in images.PRESETS.values() for size in sizes}):
+        default_storage.delete(images.derivative_name(name, size))
+    default_storage.delete(name)
+    images.forget(name)
+
+
+def collect(name):
+    """Delete a stored object and its derivatives if it is still unreferenced; returns whether it was"""
+    from .models import StoredBlob
+
+    with transaction.atomic():
+        blob = StoredBlob.objects.select_for_update().filter(name=name, ref_count=0).first()
+        if blob is None:
+            return False  # Referenced again in the meantime
+        _delete_files(name)
+        blob.delete()
+    return True
@@ -0,0 +1,90 @@
+"""
+Friend-of-friend "People you may know".
+
+``compute_suggestions()`` is a batch job (run it periodically with the
+``compute_friend_suggestions`` command): it loads the friendship adjacency
+once, counts mutual friends for every friend-of-friend and stores the top
+``SUGGESTIONS_PER_USER`` candidates per user in ``FriendSuggestion``.
+Requests then read a handful of rows from the ``(user, mutual_count)``
+index. Suggestions made stale by newer friendships, requests or blocks are
+filtered out at read time using the social graph cache.
+"""
+import heapq
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import graph
+from .models import User, Friendship, FriendRequest, Block, FriendSuggestion
+
+
+SUGGESTIONS_PER_USER = getattr(settings, 'FRIEND_SUGGESTIONS_PER_USER', 20)
+BATCH_SIZE = 1000
+
+
+def _pairs(queryset, *fields):
+    return queryset.values_list(*fields).iterator(chunk_size=10000)
+
+
+def compute_suggestions(top_k=SUGGESTIONS_PER_USER):
+    """Recompute every user's suggestions; returns (users, rows) written"""
+    adjacency = defaultdict(set)
+    for user_id, friend_id in _pairs(Friendship.objects.all(), 'user_id', 'friend_id'):
+        adjacency[user_id].add(friend_id)
+    
+    # Pending requests and blocks in either direction are never suggested
+    excluded = defaultdict(set)
+    for a, b in _pairs(FriendRequest.objects.all(), 'from_user_id', 'to_user_id'):
+        excluded[a].add(b)
+        excluded[b].add(a)
+    for a, b in _pairs(Block.objects.all(), 'blocker_id', 'blocked_id'):
+        excluded[a].add(b)
+        excluded[b].add(a)
+    
+    now = timezone.now()
+    users = rows = 0
+    batch = []
+    with transaction.atomic():
+        FriendSuggestion.objects.all().delete()
+        for user_id, friends in adjacency.items():
+            mutuals = Counter()
+            for friend_id in friends:
+                mutuals.update(adjacency[friend_id])
+            skip = friends | excluded[user_id] | {user_id}
+            best = heapq.nlargest(top_k, (
+                (count, candidate_id) for candidate_id, count in mutuals.items() if candidate_id not in skip
+            ))
+            if not best:
+                continue
+            users += 1
+            batch.extend(
+                FriendSuggestion(user_id=user_id, candidate_id=candidate_id, mutual_count=count, computed_at=now)
+                for count, candidate_id in best
+            )
+            if len(batch) >= BATCH_SIZE:
+                FriendSuggestion.objects.bulk_create(batch)
+                rows += len(batch)
+                batch = []
+        if batch:
+            FriendSuggestion.objects.bulk_create(batch)
+            rows += len(batch)
+    return users, rows
+
+
+def get_suggestions(user, limit=5):
+    """[{'user', 'mutual_count'}] for the sidebar; topped up with other users for new accounts"""
+    skip = graph.get_graph(user.id).excluded_from_suggestions()
+    skip.add(user.id)
+    
+    suggestions = []
+    for suggestion in FriendSuggestion.objects.filter(user=user).select_related('candidate')[:limit * 2]:
+        if suggestion.candidate_id not in skip and len(suggestions) < limit:
+            suggestions.append({'user': suggestion.candidate, 'mutual_count': suggestion.mutual_count})
+            skip.add(suggestion.candidate_id)
+    
+    if len(suggestions) < limit:
+        for candidate in User.objects.exclude(id__in=skip)[:limit - len(suggestions)]:
+            suggestions.append({'user': candidate, 'mutual_count': 0})
+    return suggestions
@@ -0,0 +1,30 @@
+from django import template
+
+from core.images import PRESETS
+
+
+register = template.Library()
+
+
+@register.filter
+def avatar(user, size=80):
+    """{{ user|avatar:40 }} - profile photo resized for display at `size` px"""
+    return user.get_profile_photo_url(size=int(size))
+
+
+@register.filter
+def cover(obj, size=1280):
+    """{{ group|cover:1280 }} - cover photo of a user or group"""
+    return obj.get_cover_photo_url(size=int(size))
+
+
+@register.filter
+def feed_image(post, size=640):
+    """{{ post|feed_image:640 }} - post or group post image"""
+    return post.get_image_url(size=int(size))
+
+
+@register.filter
+def feed_srcset(post):
+    """srcset listing every feed size of a post image"""
+    return ', '.join(f'{post.get_image_url(size=size)} {size}w' for size in PRESETS['feed'])
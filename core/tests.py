@@ -1,3 +1,766 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import time
+from io import BytesIO
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from PIL import Image
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import archive, graph, images, inbox, messaging, notifications, presence, realtime, retention, search, storage, uploads
+from .pagination import paginate_merged
+from .middleware import PresenceMiddleware
+from .models import (
+    Block, Comment, Conversation, Friendship, Group, InboxEntry, Message, Notification, NotificationActor, Post,
+    SharedPost, StoredBlob, UploadSession, User
+)
+
+
+class SocialTestCase(TestCase):
+    """Two users and a conversation between them, with an empty cache and presence buffer"""
+
+    def setUp(self):
+        cache.clear()
+        for name, value in (('_pending', {}), ('_last_touch', {}), ('_last_flush', time.monotonic()), ('_timer', None)):
+            patcher = mock.patch.object(presence, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.alice = User.objects.create_user('alice', 'alice@example.com')
+        self.bob = User.objects.create_user('bob', 'bob@example.com')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.alice, self.bob)
+
+    def message(self, content='hi', sender=None, created_at=None):
+        return Message.objects.create(
+            conversation=self.conversation,
+            sender=sender or self.alice,
+            content=content,
+            created_at=created_at or timezone.now()
+        )
+
+
+class MediaTestCase(SocialTestCase):
+    """Media stored in a temporary directory, background jobs run inline"""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media_settings = self.settings(MEDIA_ROOT=self.media_root, JOBS_ALWAYS_EAGER=True)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+
+# ==================== SOCIAL GRAPH ====================
+
+class GraphInvalidationTests(SocialTestCase):
+    def test_blocks_saved_outside_the_views_invalidate_both_graphs(self):
+        self.assertFalse(graph.get_graph(self.alice.id).is_blocked(self.bob.id))
+        self.assertFalse(graph.get_graph(self.bob.id).is_blocked(self.alice.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            Block.objects.create(blocker=self.alice, blocked=self.bob)  # e.g. from the admin
+        self.assertTrue(graph.get_graph(self.alice.id).has_blocked(self.bob.id))
+        self.assertTrue(graph.get_graph(self.bob.id).is_blocked_by(self.alice.id))
+
+    def test_cascading_deletes_invalidate_the_other_side(self):
+        Friendship.objects.create(user=self.alice, friend=self.bob)
+        Friendship.objects.create(user=self.bob, friend=self.alice)
+        self.assertTrue(graph.get_graph(self.alice.id).is_friend(self.bob.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bob.delete()
+        self.assertEqual(list(graph.get_graph(self.alice.id).friends), [])
+
+    def test_sending_checks_blocks_in_the_database(self):
+        graph.get_graph(self.alice.id)  # Cached before the block, and never invalidated here
+        Block.objects.create(blocker=self.bob, blocked=self.alice)
+        self.client.force_login(self.alice)
+        response = self.client.post(
+            f'/conversation/{self.conversation.id}/', {'content': 'hello'},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest', secure=True
+        )
+        self.assertFalse(response.json()['success'])
+        self.assertFalse(Message.objects.exists())
+
+
+# ==================== MESSAGING ====================
+
+class InboxReadCursorTests(SocialTestCase):
+    def setUp(self):
+        super().setUp()
+        inbox.refresh(self.conversation)
+
+    def send(self, sender, content='hi'):
+        return messaging.send_message(sender, self.conversation, content)
+
+    def entry(self, user):
+        return InboxEntry.objects.get(user=user, conversation=self.conversation)
+
+    def test_unread_counts_the_other_participants_messages_after_the_cursor(self):
+        sent = [self.send(self.bob, f'm{i}') for i in range(3)]
+        self.send(self.alice, 'reply')
+        self.assertEqual(self.entry(self.alice).unread_count, 3)
+        self.assertEqual(self.entry(self.bob).unread_count, 1)
+
+        inbox.mark_read(self.alice.id, self.conversation.id, sent[1].id)
+        entry = self.entry(self.alice)
+        self.assertEqual((entry.last_read_message_id, entry.unread_count), (sent[1].id, 1))
+        self.assertEqual(entry.last_message, 'reply')
+
+    def test_the_cursor_never_moves_back(self):
+        sent = [self.send(self.bob) for _ in range(2)]
+        inbox.mark_read(self.alice.id, self.conversation.id, sent[1].id)
+        with CaptureQueriesContext(connection) as queries:
+            inbox.mark_read(self.alice.id, self.conversation.id, sent[0].id)
+        self.assertEqual(len(queries), 1)  # One UPDATE that matches nothing
+        entry = self.entry(self.alice)
+        self.assertEqual((entry.last_read_message_id, entry.unread_count), (sent[1].id, 0))
+
+    def test_refresh_keeps_the_cursor_after_a_delete(self):
+        sent = [self.send(self.bob, f'm{i}') for i in range(3)]
+        inbox.mark_read(self.alice.id, self.conversation.id, sent[0].id)
+        sent[2].delete()
+        inbox.refresh(self.conversation)
+        entry = self.entry(self.alice)
+        self.assertEqual((entry.last_read_message_id, entry.unread_count, entry.last_message), (sent[0].id, 1, 'm1'))
+
+    def test_fetching_new_messages_marks_them_read(self):
+        first = self.send(self.bob)
+        self.client.force_login(self.alice)
+        self.client.get(f'/conversation/{self.conversation.id}/messages/', {'after': 0}, secure=True)
+        self.assertEqual(self.entry(self.alice).unread_count, 0)
+        self.send(self.bob)
+        self.client.get(f'/conversation/{self.conversation.id}/messages/', {'after': first.id}, secure=True)
+        self.assertEqual(self.entry(self.alice).unread_count, 0)
+
+
+class MessageSyncTests(SocialTestCase):
+    def setUp(self):
+        super().setUp()
+        inbox.refresh(self.conversation)
+        self.client.force_login(self.alice)
+
+    def sync(self, **params):
+        return self.client.get(f'/conversation/{self.conversation.id}/messages/', params, secure=True).json()
+
+    def delete(self, message):
+        self.client.force_login(message.sender)
+        response = self.client.post(f'/message/{message.id}/delete/', secure=True)
+        self.client.force_login(self.alice)
+        return response
+
+    def test_polling_returns_new_messages_and_deletions_since_the_cursor(self):
+        kept, doomed = self.message('kept', self.bob), self.message('doomed', self.bob)
+        cursor = self.sync()['cursor']
+        self.assertEqual(cursor, {'after': doomed.id, 'deleted_after': 0})
+
+        self.delete(doomed)
+        new = self.message('new', self.bob)
+        data = self.sync(**cursor)
+        self.assertEqual([m['content'] for m in data['messages']], ['new'])
+        self.assertEqual(data['deleted'], [doomed.id])
+        self.assertEqual(data['cursor']['after'], new.id)
+
+        data = self.sync(**data['cursor'])
+        self.assertEqual((data['messages'], data['deleted']), ([], []))
+        self.assertEqual(list(self.conversation.messages.values_list('id', flat=True)), [kept.id, new.id])
+
+    def test_a_full_load_hands_out_the_tombstone_position_without_replaying_it(self):
+        self.delete(self.message('gone', self.bob))
+        data = self.sync()
+        self.assertEqual((data['messages'], data['deleted']), ([], []))
+        self.assertEqual(data['cursor']['deleted_after'], self.conversation.tombstones.get().id)
+
+    def test_only_the_sender_can_delete(self):
+        message = self.message('mine', self.bob)
+        response = self.client.post(f'/message/{message.id}/delete/', secure=True)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(self.conversation.tombstones.exists())
+
+    def test_the_tombstone_and_the_delete_land_together(self):
+        message = self.message('stays', self.bob)
+        self.client.force_login(self.bob)
+        with mock.patch.object(inbox, 'refresh', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self.client.post(f'/message/{message.id}/delete/', secure=True)
+        self.assertTrue(Message.objects.filter(pk=message.pk).exists())
+        self.assertFalse(self.conversation.tombstones.exists())
+
+
+# ==================== NOTIFICATIONS ====================
+
+class CoalescingTests(SocialTestCase):
+    def setUp(self):
+        super().setUp()
+        self.post = Post.objects.create(user=self.alice, content='post')
+        self.others = [User.objects.create_user(f'user{i}', f'user{i}@example.com') for i in range(4)]
+
+    def like(self, user):
+        return Notification.create_aggregated_notification(
+            self.alice, user, 'post_like', 'liked your post', related_post=self.post
+        )
+
+    def test_events_on_a_post_fold_into_one_notification(self):
+        for user in self.others:
+            notification = self.like(user)
+        notification.refresh_from_db()
+        self.assertEqual(Notification.objects.count(), 1)
+        self.assertEqual(notification.actor_count, 4)
+        self.assertEqual(notification.recent_actor_ids, [u.id for u in reversed(self.others)][:notifications.RECENT_ACTORS])
+        self.assertEqual(notification.title, 'user3 and 3 others liked your post')
+
+    def test_acting_again_is_not_counted_twice(self):
+        first, second = self.others[:2]
+        self.like(first)
+        self.like(second)
+        notification = self.like(first)  # e.g. liked again after an unlike
+        notification.refresh_from_db()
+        self.assertEqual(notification.actor_count, 2)
+        self.assertEqual(notification.recent_actor_ids, [first.id, second.id])
+
+    def test_an_actor_who_left_the_recent_sample_is_still_counted_once(self):
+        for user in self.others:
+            self.like(user)
+        notification = self.like(self.others[0])
+        notification.refresh_from_db()
+        self.assertEqual(notification.actor_count, 4)
+        self.assertEqual(notification.recent_actor_ids[0], self.others[0].id)
+
+    def test_event_cost_does_not_grow_with_actors(self):
+        self.like(self.others[0])
+        with CaptureQueriesContext(connection) as early:
+            self.like(self.others[1])
+        for i in range(20):
+            self.like(User.objects.create_user(f'fan{i}', f'fan{i}@example.com'))
+        with CaptureQueriesContext(connection) as late:
+            self.like(self.others[2])
+        self.assertEqual(len(late), len(early))
+
+    def test_own_actions_are_not_notified(self):
+        self.assertIsNone(self.like(self.alice))
+        self.assertFalse(Notification.objects.exists())
+
+    def test_an_old_notification_is_not_reused(self):
+        old = self.like(self.others[0])
+        Notification.objects.filter(pk=old.pk).update(created_at=timezone.now() - notifications.AGGREGATE_WINDOW * 2)
+        new = self.like(self.others[0])
+        self.assertNotEqual(new.pk, old.pk)
+        self.assertEqual(new.actor_count, 1)
+
+    def test_unread_count_moves_only_when_the_event_commits(self):
+        self.assertEqual(notifications.get_unread_count(self.alice), 0)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.like(self.others[0])
+            raise RuntimeError('rolled back')
+        self.assertEqual(notifications.get_unread_count(self.alice), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.like(self.others[0])
+            self.assertEqual(cache.get(notifications._unread_key(self.alice.id)), 0)
+        self.assertEqual(notifications.get_unread_count(self.alice), 1)
+
+    def test_reopening_a_read_notification_counts_it_again(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            notification = self.like(self.others[0])
+        Notification.objects.filter(pk=notification.pk).update(is_read=True)
+        notifications.invalidate_unread([self.alice.id])
+        self.assertEqual(notifications.get_unread_count(self.alice), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.like(self.others[1])
+        self.assertEqual(notifications.get_unread_count(self.alice), 1)
+
+    def test_prune_drops_actors_of_closed_notifications(self):
+        old = self.like(self.others[0])
+        Notification.objects.filter(pk=old.pk).update(created_at=timezone.now() - notifications.AGGREGATE_WINDOW * 2)
+        current = self.like(self.others[1])
+        self.assertEqual(retention.prune_actors(), 1)
+        self.assertEqual(list(NotificationActor.objects.values_list('notification_id', flat=True)), [current.pk])
+
+
+# ==================== MEDIA STORAGE ====================
+
+class BlobStorageTests(MediaTestCase):
+    def post(self, data, name='photo.jpg'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(user=self.alice, content='photo', image=ContentFile(data, name=name))
+
+    def blob(self, name):
+        return StoredBlob.objects.filter(name=name).first()
+
+    def test_identical_uploads_are_stored_once(self):
+        first = self.post(b'same bytes', 'a.jpg')
+        second = self.post(b'same bytes', 'b.JPG')
+        other = self.post(b'other bytes')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.startswith('posts/'))
+        self.assertNotEqual(first.image.name, other.image.name)
+        self.assertEqual(self.blob(first.image.name).ref_count, 2)
+        self.assertEqual(self.blob(other.image.name).ref_count, 1)
+
+    def test_the_last_release_collects_the_file(self):
+        first = self.post(b'shared')
+        second = self.post(b'shared')
+        name = first.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.blob(name).ref_count, 1)
+        self.assertTrue(default_storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertIsNone(self.blob(name))
+        self.assertFalse(default_storage.exists(name))
+
+    def test_cascading_deletes_release_files(self):
+        name = self.post(b'mine').image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.delete()
+        self.assertIsNone(self.blob(name))
+        self.assertFalse(default_storage.exists(name))
+
+    def test_replacing_a_file_releases_the_old_one(self):
+        post = self.post(b'before')
+        old_name = post.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            post.image = ContentFile(b'after', name='after.jpg')
+            post.save()
+        self.assertIsNone(self.blob(old_name))
+        self.assertEqual(self.blob(post.image.name).ref_count, 1)
+
+    def test_collect_spares_a_file_referenced_again(self):
+        name = self.post(b'reused').image.name
+        StoredBlob.objects.filter(name=name).update(ref_count=0)  # As if released while a new upload was landing
+        self.post(b'reused')
+        self.assertFalse(storage.collect(name))
+        self.assertTrue(default_storage.exists(name))
+
+
+class DerivativeTests(MediaTestCase):
+    def photo_post(self):
+        buffer = BytesIO()
+        Image.new('RGB', (1600, 900), 'teal').save(buffer, 'JPEG')
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(user=self.alice, content='photo', image=ContentFile(buffer.getvalue(), name='p.jpg'))
+            images.process_uploads(post, 'image')
+        return post
+
+    def test_derivatives_are_generated_and_served_without_stats(self):
+        post = self.photo_post()
+        for size in images.PRESETS['feed']:
+            with default_storage.open(images.derivative_name(post.image.name, size)) as f:
+                self.assertEqual(Image.open(f).width, size)
+        with mock.patch.object(default_storage, 'exists') as exists:
+            self.assertEqual(post.get_image_url(640), default_storage.url(images.derivative_name(post.image.name, 640)))
+        exists.assert_not_called()
+
+    def test_missing_sizes_fall_back_to_the_original(self):
+        with mock.patch.object(images, 'process_uploads'):
+            post = self.photo_post()
+        self.assertEqual(post.get_image_url(640), post.image.url)
+        self.assertEqual(images.generated_sizes(post.image, 'feed'), ())
+
+    def test_collecting_an_image_deletes_its_derivatives(self):
+        post = self.photo_post()
+        name = post.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        for size in images.PRESETS['feed']:
+            self.assertFalse(default_storage.exists(images.derivative_name(name, size)))
+        self.assertIsNone(cache.get(images._sizes_key(name, 'feed')))
+
+
+class ChunkedUploadTests(MediaTestCase):
+    PNG = b'\x89PNG\r\n\x1a\n' + bytes(range(10))  # 18 bytes: parts of 8, 8 and 2
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(uploads, 'CHUNK_SIZE', 8)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_login(self.alice)
+
+    def start(self, size=len(PNG), filename='picture.bin'):
+        return self.client.post(
+            f'/conversation/{self.conversation.id}/uploads/', {'filename': filename, 'size': size}, secure=True
+        ).json()
+
+    def send_part(self, upload_id, index, data):
+        return self.client.post(
+            f'/upload/{upload_id}/part/{index}/', data, content_type='application/octet-stream', secure=True
+        )
+
+    def complete(self, upload_id):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f'/upload/{upload_id}/complete/', {'content': 'look'}, secure=True)
+
+    def test_parts_in_any_order_assemble_into_a_message(self):
+        upload = self.start()
+        self.assertEqual(upload['part_count'], 3)
+        for index in (2, 0, 1):
+            response = self.send_part(upload['upload_id'], index, self.PNG[index * 8:index * 8 + 8])
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['received_parts'], [0, 1, 2])
+
+        response = self.complete(upload['upload_id'])
+        message = Message.objects.get(pk=response.json()['message_id'])
+        self.assertEqual(message.content, 'look')
+        self.assertEqual(message.attachment_name, 'picture.png')  # Named after the sniffed type
+        with message.attachment.open('rb') as f:
+            self.assertEqual(f.read(), self.PNG)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_a_resent_part_is_recorded_once(self):
+        upload = self.start()
+        self.send_part(upload['upload_id'], 1, self.PNG[8:16])
+        response = self.send_part(upload['upload_id'], 1, self.PNG[8:16])
+        self.assertEqual(response.json()['received_parts'], [1])
+        status = self.client.get(f'/upload/{upload["upload_id"]}/', secure=True).json()
+        self.assertEqual(status['received_parts'], [1])
+
+    def test_completing_with_missing_parts_is_refused(self):
+        upload = self.start()
+        self.send_part(upload['upload_id'], 0, self.PNG[:8])
+        response = self.complete(upload['upload_id'])
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Message.objects.exists())
+
+    def test_parts_of_the_wrong_size_are_refused(self):
+        upload = self.start()
+        self.assertEqual(self.send_part(upload['upload_id'], 1, self.PNG[8:15]).status_code, 400)
+        self.assertEqual(self.send_part(upload['upload_id'], 2, self.PNG[16:] + b'x').status_code, 400)
+        self.assertEqual(self.send_part(upload['upload_id'], 3, b'x').status_code, 400)
+
+    def test_a_disallowed_file_type_ends_the_upload(self):
+        upload = self.start()
+        response = self.send_part(upload['upload_id'], 0, b'#!/bin/sh')
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_another_users_upload_is_not_found(self):
+        upload = self.start()
+        self.client.force_login(self.bob)
+        self.assertEqual(self.send_part(upload['upload_id'], 0, self.PNG[:8]).status_code, 404)
+
+
+class MediaServingTests(MediaTestCase):
+    DATA = bytes(range(100))
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.name = Post.objects.create(user=self.alice, content='photo', image=ContentFile(self.DATA, name='p.jpg')).image.name
+        self.url = f'/media/{self.name}'
+
+    def get(self, **headers):
+        return self.client.get(self.url, secure=True, headers=headers)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_content_addressed_files_are_immutable_with_a_digest_etag(self):
+        response = self.get()
+        self.assertEqual(self.body(response), self.DATA)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn(response['ETag'].strip('"'), self.name)
+        self.assertEqual(self.get(if_none_match=response['ETag']).status_code, 304)
+
+    def test_single_ranges(self):
+        response = self.get(range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(self.body(response), self.DATA[10:20])
+        self.assertEqual(self.body(self.get(range='bytes=-5')), self.DATA[-5:])
+        self.assertEqual(self.body(self.get(range='bytes=95-500')), self.DATA[95:])
+
+    def test_unsatisfiable_invalid_and_stale_ranges(self):
+        response = self.get(range='bytes=100-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */100'))
+        self.assertEqual(self.get(range='bytes=20-10').status_code, 200)  # Invalid, so ignored
+        self.assertEqual(self.get(range='bytes=0-1,5-6').status_code, 200)
+        self.assertEqual(self.get(range='bytes=0-9', if_range='"stale"').status_code, 200)
+
+    def test_ranges_stream_under_asgi(self):
+        async def fetch():
+            response = await self.async_client.get(self.url, secure=True, headers={'Range': 'bytes=0-3'})
+            return response, b''.join([chunk async for chunk in response.streaming_content])
+
+        response, body = async_to_sync(fetch)()
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response.is_async)
+        self.assertEqual(body, self.DATA[:4])
+
+    def test_hidden_and_private_paths_are_not_served(self):
+        self.assertEqual(self.client.get('/media/.incoming/x', secure=True).status_code, 404)
+        self.assertEqual(self.client.get('/media/message_attachments/x.png', secure=True).status_code, 404)
+
+
+# ==================== PROFILE ====================
+
+class ProfileStreamTests(SocialTestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        self.posts = [Post.objects.create(user=self.bob, content=f'post {i}', created_at=now - timedelta(hours=i)) for i in range(4)]
+        originals = [Post.objects.create(user=self.alice, content=f'original {i}', created_at=now - timedelta(days=10)) for i in range(3)]
+        # One share at the same instant as a post, the others interleaved and older than every post
+        self.shares = [
+            SharedPost.objects.create(user=self.bob, original_post=originals[0], created_at=self.posts[1].created_at),
+            SharedPost.objects.create(user=self.bob, original_post=originals[1], created_at=now - timedelta(hours=10)),
+            SharedPost.objects.create(user=self.bob, original_post=originals[2], created_at=now - timedelta(hours=11)),
+        ]
+
+    def sources(self):
+        return {
+            'post': Post.objects.filter(user=self.bob),
+            'share': SharedPost.objects.filter(user=self.bob),
+        }
+
+    def test_posts_and_shares_page_as_one_stream(self):
+        seen, cursor = [], None
+        while True:
+            page, cursor = paginate_merged(self.sources(), cursor, page_size=2)
+            seen.extend((kind, item.pk) for kind, item in page)
+            if not cursor:
+                break
+        self.assertEqual(seen, [
+            ('post', self.posts[0].pk),
+            ('share', self.shares[0].pk),  # Same instant as posts[1]: the larger kind goes first
+            ('post', self.posts[1].pk),
+            ('post', self.posts[2].pk),
+            ('post', self.posts[3].pk),
+            ('share', self.shares[1].pk),
+            ('share', self.shares[2].pk),
+        ])
+
+    def test_a_malformed_cursor_starts_from_the_top(self):
+        page, _ = paginate_merged(self.sources(), 'not a cursor', page_size=1)
+        self.assertEqual(page, [('post', self.posts[0])])
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_profile_lists_shares_alongside_posts(self):
+        self.client.force_login(self.alice)
+        response = self.client.get('/profile/bob/', secure=True)
+        self.assertEqual([kind for kind, _ in response.context['stream']], ['post', 'share', 'post', 'post', 'post', 'share', 'share'])
+        self.assertContains(response, 'original 2')
+
+
+# ==================== SEARCH ====================
+
+class SearchTests(SocialTestCase):
+    def index(self, obj):
+        search.index_object(obj)
+        return obj
+
+    def found(self, viewer, query):
+        results, _ = search.search(viewer, query)
+        return {(document.kind, document.text) for document in results}
+
+    def test_content_about_a_blocked_user_is_hidden(self):
+        post = self.index(Post.objects.create(user=self.bob, content='gardening tips'))
+        self.index(Comment.objects.create(post=post, user=self.alice, content='gardening is great'))
+        self.index(Group.objects.create(name='Gardening club', creator=self.bob))
+        carol = User.objects.create_user('carol', 'carol@example.com')
+        self.index(Post.objects.create(user=carol, content='gardening at dawn'))
+        self.assertEqual(len(self.found(self.alice, 'garden')), 4)
+
+        Block.objects.create(blocker=self.alice, blocked=self.bob)
+        graph.invalidate(self.alice.id)
+        self.assertEqual(self.found(self.alice, 'garden'), {('post', 'gardening at dawn')})
+
+    def test_cursor_pages_through_every_result_once(self):
+        for i in range(7):
+            self.index(Post.objects.create(user=self.bob, content='tea ' * (i % 3 + 1) + f'note {i}'))
+        self.index(Post.objects.create(user=self.bob, content='coffee'))
+
+        seen, cursor = [], None
+        while True:
+            page, cursor = search.search(self.alice, 'tea', cursor=cursor, page_size=3)
+            seen.extend(document.pk for document in page)
+            if not cursor:
+                break
+        everything, _ = search.search(self.alice, 'tea', page_size=100)
+        self.assertEqual(seen, [document.pk for document in everything])
+        self.assertEqual(len(seen), 7)
+
+    def test_a_malformed_cursor_starts_from_the_top(self):
+        self.index(Post.objects.create(user=self.bob, content='tea'))
+        results, cursor = search.search(self.alice, 'tea', cursor='not a cursor')
+        self.assertEqual(len(results), 1)
+        self.assertIsNone(cursor)
+
+
+# ==================== REALTIME & PRESENCE ====================
+
+class StopListening(BaseException):
+    pass
+
+
+class FakePubSub:
+    def __init__(self, messages):
+        self.messages = messages
+
+    def subscribe(self, channel):
+        if isinstance(self.messages, Exception):
+            raise self.messages
+
+    def listen(self):
+        for message in self.messages:
+            if isinstance(message, BaseException):
+                raise message
+            yield {'data': message}
+
+    def close(self):
+        pass
+
+
+class RedisBrokerTests(TestCase):
+    def test_listener_reconnects_with_backoff(self):
+        broker = realtime.RedisBroker.__new__(realtime.RedisBroker)
+        realtime.InProcessBroker.__init__(broker)
+        broker._redis = mock.Mock()
+        broker._redis.pubsub.side_effect = [
+            FakePubSub(ConnectionError('down')),
+            FakePubSub(ConnectionError('still down')),
+            FakePubSub(['not json', '{"user_id": 1, "event": {"type": "ping"}}', ConnectionError('dropped')]),
+            FakePubSub([StopListening()]),
+        ]
+        delivered = []
+        broker.deliver_local = lambda user_id, event: delivered.append((user_id, event))
+
+        with mock.patch.object(realtime.time, 'sleep') as sleep, self.assertLogs('core.realtime', 'WARNING'):
+            with self.assertRaises(StopListening):
+                broker._listen()
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [1, 2, 1])
+        self.assertEqual(delivered, [(1, {'type': 'ping'})])
+
+
+class PresenceMiddlewareTests(SocialTestCase):
+    def test_heartbeat_under_an_async_stack(self):
+        async def view(request):
+            return HttpResponse()
+
+        middleware = PresenceMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get('/')
+        request.user = self.alice
+        async_to_sync(middleware)(request)
+        self.assertTrue(presence.is_online(presence.last_seen(self.alice.id)))
+
+
+class PresenceFlushTests(SocialTestCase):
+    def last_active(self):
+        return User.objects.values_list('last_active', flat=True).get(pk=self.alice.pk)
+
+    @override_settings(JOBS_ALWAYS_EAGER=True)
+    def test_a_lone_heartbeat_is_flushed_by_the_timer(self):
+        before = self.last_active()
+        with mock.patch.object(presence.threading, 'Timer') as timer:
+            presence.touch(self.alice.id)
+            presence.touch(self.bob.id)
+        timer.assert_called_once_with(presence.FLUSH_SECONDS, presence._flush_later)
+        self.assertEqual(self.last_active(), before)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            presence._flush_later()
+        self.assertGreater(self.last_active(), before)
+        self.assertEqual(presence._pending, {})
+
+    def test_pending_heartbeats_are_written_at_exit(self):
+        with mock.patch.object(presence.threading, 'Timer'):
+            presence.touch(self.alice.id)
+        seen = presence._pending[self.alice.id]
+        presence._flush_at_exit()
+        self.assertEqual(self.last_active(), seen)
+
+
+# ==================== ARCHIVE ====================
+
+class ArchiveTests(SocialTestCase):
+    def setUp(self):
+        super().setUp()
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir)
+        patcher = mock.patch.object(archive, 'ARCHIVE_DIR', self.archive_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.month = archive.add_months(timezone.now(), -24)
+
+    def test_archive_and_restore_month(self):
+        old = [self.message(f'old {i}', created_at=self.month + timedelta(days=i)) for i in range(3)]
+        recent = self.message('recent')
+
+        self.assertEqual(archive.archive_month('message', self.month), 3)
+        self.assertEqual(list(Message.objects.values_list('id', flat=True)), [recent.id])
+        self.assertEqual(len(archive.archived_files('core_message', self.month)), 1)
+
+        self.assertEqual(archive.restore_month('message', self.month), (3, 0))
+        restored = Message.objects.filter(created_at__lt=archive.add_months(self.month, 1)).order_by('id')
+        self.assertEqual([(m.id, m.content, m.created_at) for m in restored], [(m.id, m.content, m.created_at) for m in old])
+
+    def test_restore_is_idempotent(self):
+        self.message('old', created_at=self.month)
+        archive.archive_month('message', self.month)
+        archive.restore_month('message', self.month)
+        archive.restore_month('message', self.month)
+        self.assertEqual(Message.objects.count(), 1)
+
+    def test_archiving_a_month_again_keeps_the_earlier_file(self):
+        self.message('first', created_at=self.month)
+        archive.archive_month('message', self.month)
+        self.message('second', created_at=self.month + timedelta(days=1))
+        archive.archive_month('message', self.month)
+
+        self.assertEqual(len(archive.archived_files('core_message', self.month)), 2)
+        self.assertEqual(archive.restore_month('message', self.month), (2, 0))
+
+    def test_restore_skips_rows_whose_conversation_is_gone(self):
+        self.message('old', created_at=self.month)
+        archive.archive_month('message', self.month)
+        self.conversation.delete()
+        self.assertEqual(archive.restore_month('message', self.month), (0, 1))
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite rotates rows into twin tables')
+    def test_rotate_moves_rows_out_of_the_hot_window(self):
+        self.message('old', created_at=self.month)
+        recent = self.message('recent')
+
+        self.assertEqual(archive.rotate()['message'], 1)
+        self.assertEqual(list(Message.objects.values_list('id', flat=True)), [recent.id])
+        # Rotated rows are still archived with the month
+        self.assertEqual(archive.archive_month('message', self.month), 1)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Partitioning needs Postgres')
+    def test_partition_maintain_archive_restore_and_unpartition(self):
+        old = self.message('old', created_at=self.month)
+        self.assertEqual(archive.partition_tables(), ['core_message', 'core_notification'])
+        with connection.cursor() as cursor:
+            self.assertTrue(archive.is_partitioned(cursor, 'core_message'))
+        self.assertEqual(Message.objects.get(pk=old.pk).content, 'old')
+
+        # New rows keep taking ids from the sequence; a month without a partition lands in the default one
+        later = archive.add_months(timezone.now(), archive.MONTHS_AHEAD + 3)
+        stray = self.message('far ahead', created_at=later)
+        self.assertGreater(stray.id, old.id)
+        self.assertIn(archive.partition_name('core_message', later), archive.ensure_partitions())
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM core_message_default')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+        self.assertEqual(archive.archive_month('message', self.month), 1)
+        with connection.cursor() as cursor:
+            self.assertFalse(archive._partition_exists(cursor, archive.partition_name('core_message', self.month)))
+        self.assertEqual(archive.restore_month('message', self.month), (1, 0))
+        self.assertEqual(Message.objects.get(pk=old.pk).content, 'old')
+
+        self.assertEqual(archive.unpartition_tables(), ['core_message', 'core_notification'])
+        self.assertEqual(Message.objects.count(), 2)
+        self.assertGreater(self.message('after').id, stray.id)
@@ -0,0 +1,74 @@
+"""
+Fan-out-on-write home timeline.
+
+Every post is copied into the ``TimelineEntry`` table of its author and of
+each of the author's friends when it is created, so reading the home feed
+is a single index range scan on ``(owner, created_at)`` regardless of how
+many friends a user has. Friendship and block changes add or trim entries.
+"""
+from django.conf import settings
+from django.db.models import Q
+
+from . import graph
+from .models import Post, Friendship, TimelineEntry
+
+
+# How many of a new friend's most recent posts to copy into the timeline
+BACKFILL_LIMIT = getattr(settings, 'TIMELINE_BACKFILL_LIMIT', 200)
+
+# Rows per INSERT when fanning out to large friend lists
+BATCH_SIZE = 1000
+
+
+def _entries_for(post, owner_ids):
+    return [
+        TimelineEntry(owner_id=owner_id, post_id=post.id, author_id=post.user_id, created_at=post.created_at)
+        for owner_id in owner_ids
+    ]
+
+
+def fan_out_post(post):
+    """Add a newly created post to its author's and friends' timelines"""
+    owner_ids = [post.user_id]
+    owner_ids.extend(graph.get_graph(post.user_id).friends)
+    TimelineEntry.objects.bulk_create(_entries_for(post, owner_ids), batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def add_friend_posts(user, friend):
+    """Backfill `user`'s timeline with `friend`'s most recent posts"""
+    posts = Post.objects.filter(user=friend).order_by('-created_at').only('id', 'user_id', 'created_at')[:BACKFILL_LIMIT]
+    entries = []
+    for post in posts:
+        entries.extend(_entries_for(post, [user.id]))
+    TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def connect(user1, user2):
+    """Called when a friendship is formed"""
+    add_friend_posts(user1, user2)
+    add_friend_posts(user2, user1)
+
+
+def disconnect(user1, user2):
+    """Called on unfriend or block: drop each user's posts from the other's timeline"""
+    TimelineEntry.objects.filter(
+        Q(owner=user1, author=user2) | Q(owner=user2, author=user1)
+    ).delete()
+
+
+def get_timeline(user):
+    """Entries of the user's home feed, newest first"""
+    return TimelineEntry.objects.filter(owner=user).select_related('post', 'post__user')
+
+
+def rebuild_timeline(user):
+    """Recompute a user's timeline from scratch (own posts plus friends' recent posts)"""
+    TimelineEntry.objects.filter(owner=user).delete()
+    author_ids = [user.id]
+    author_ids.extend(Friendship.objects.filter(user=user).values_list('friend_id', flat=True))
+    entries = []
+    for author_id in author_ids:
+        posts = Post.objects.filter(user_id=author_id).order_by('-created_at').only('id', 'user_id', 'created_at')[:BACKFILL_LIMIT]
+        for post in posts:
+            entries.extend(_entries_for(post, [user.id]))
+    TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
@@ -0,0 +1,163 @@
+"""
+Resumable, chunked uploads for message attachments.
+
+A client initiates an upload with the file's name and size, then sends
+the parts (``CHUNK_SIZE`` bytes each, the last one shorter) as raw request
+bodies in any order. Each part is streamed straight into its place in a
+sparse file under the media temp directory, so no request handles more
+than one part and a worker is never held for a whole slow transfer. An
+interrupted upload resumes by asking which parts arrived and sending the
+rest. Finalizing moves the file into media storage (where it is hashed
+and deduplicated) and sends it as a new message.
+
+The file type comes from the first part's magic bytes, not from the name
+or the client's Content-Type; anything not in ``SIGNATURES`` is refused.
+Sessions left unfinished for ``SESSION_TTL`` are purged by ``collect_media``.
+"""
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from . import messaging
+from .models import UploadPart, UploadSession
+
+
+CHUNK_SIZE = getattr(settings, 'UPLOAD_CHUNK_SIZE', 1024 * 1024)
+MAX_SIZE = getattr(settings, 'MESSAGE_ATTACHMENT_MAX_SIZE', 100 * 1024 * 1024)
+MAX_PENDING = 10  # Unfinished sessions per user
+SESSION_TTL = timedelta(hours=24)
+READ_SIZE = 64 * 1024
+
+# (offset, magic bytes, content type, extension)
+SIGNATURES = [
+    (0, b'\xff\xd8\xff', 'image/jpeg', '.jpg'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png', '.png'),
+    (0, b'GIF87a', 'image/gif', '.gif'),
+    (0, b'GIF89a', 'image/gif', '.gif'),
+    (8, b'WEBP', 'image/webp', '.webp'),
+    (4, b'ftypqt', 'video/quicktime', '.mov'),
+    (4, b'ftyp', 'video/mp4', '.mp4'),
+    (0, b'\x1a\x45\xdf\xa3', 'video/webm', '.webm'),
+    (0, b'%PDF-', 'application/pdf', '.pdf'),
+    (0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/msword', '.doc'),
+    (0, b'PK\x03\x04', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document', '.docx'),
+]
+SNIFF_SIZE = 16
+
+
+class UploadError(Exception):
+    """An upload request that can't be accepted; `status` is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def sniff(head):
+    """(content type, extension) for a file starting with `head`, or None if it isn't allowed"""
+    for offset, magic, content_type, extension in SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            return content_type, extension
+    return None
+
+
+def attachment_filename(filename, extension):
+    """The client's filename with the extension of its detected type"""
+    base = os.path.splitext(os.path.basename(filename))[0] or 'attachment'
+    return f'{base[:200]}{extension}'
+
+
+def _part_path(session):
+    return os.path.join(default_storage.temp_dir, 'uploads', f'{session.id}.part')
+
+
+def initiate(user, conversation, filename, size):
+    """Open an upload session for a file of `size` bytes"""
+    if not filename:
+        raise UploadError('A filename is required.')
+    if size <= 0:
+        raise UploadError('The file is empty.')
+    if size > MAX_SIZE:
+        raise UploadError(f'Attachments can be at most {MAX_SIZE // (1024 * 1024)} MB.', status=413)
+    if UploadSession.objects.filter(user=user).count() >= MAX_PENDING:
+        raise UploadError('Too many uploads in progress.', status=429)
+
+    session = UploadSession.objects.create(
+        user=user,
+        conversation=conversation,
+        filename=filename[:255],
+        size=size,
+        chunk_size=CHUNK_SIZE
+    )
+    path = _part_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.truncate(size)  # Sparse; parts are written into place
+    return session
+
+
+def write_part(session, index, stream):
+    """Stream one part from `stream` (the request) into the session's file"""
+    if not 0 <= index < session.part_count:
+        raise UploadError('No such part.')
+    expected = session.part_size(index)
+
+    written = 0
+    with open(_part_path(session), 'r+b') as f:
+        f.seek(index * session.chunk_size)
+        while True:
+            data = stream.read(min(READ_SIZE, expected + 1 - written))
+            if not data:
+                break
+            if index == 0 and written == 0:
+                detected = sniff(data[:SNIFF_SIZE])
+                if detected is None:
+                    discard(session)
+                    raise UploadError('This file type is not allowed.', status=415)
+            written += len(data)
+            if written > expected:
+                raise UploadError('Part is larger than expected.')
+            f.write(data)
+    if written != expected:
+        raise UploadError('Part is incomplete.')
+
+    if index == 0:
+        session.content_type = detected[0]
+        UploadSession.objects.filter(pk=session.pk).update(content_type=session.content_type)
+    UploadPart.objects.bulk_create([UploadPart(session=session, index=index)], ignore_conflicts=True)
+    return session
+
+
+def finalize(session, content=''):
+    """Send the finished file as a message from the session's user; closes the session"""
+    if not session.is_complete():
+        raise UploadError('Some parts are missing.', status=409)
+    extension = next(ext for _, _, content_type, ext in SIGNATURES if content_type == session.content_type)
+    name = attachment_filename(session.filename, extension)
+    with open(_part_path(session), 'rb') as f:
+        message = messaging.send_message(session.user, session.conversation, content, attachment=File(f), attachment_name=name)
+    discard(session)
+    return message
+
+
+def discard(session):
+    """Delete a session and its partial file"""
+    try:
+        os.remove(_part_path(session))
+    except FileNotFoundError:
+        pass
+    session.delete()
+
+
+def purge_expired():
+    """Discard sessions nobody finished in time; returns how many"""
+    expired = UploadSession.objects.filter(created_at__lt=timezone.now() - SESSION_TTL)
+    count = 0
+    for session in expired.iterator():
+        discard(session)
+        count += 1
+    return count
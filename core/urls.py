@@ -3,6 +3,7 @@ from . import views
 
 urlpatterns = [
     path('', views.home_view, name='home'),
+    path('feed/', views.home_feed_json, name='home_feed_json'),
     path('signup/', views.signup_view, name='signup'),
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
@@ -12,7 +13,14 @@ urlpatterns = [
     path('conversation/<int:conversation_id>/', views.conversation_view, name='conversation'),
     path('conversation/<int:conversation_id>/messages/', views.get_messages_json, name='get_messages_json'),
     path('message/<int:message_id>/delete/', views.delete_message, name='delete_message'),
+    path('message/<int:message_id>/attachment/', views.message_attachment, name='message_attachment'),
+    path('conversation/<int:conversation_id>/uploads/', views.start_upload, name='start_upload'),
+    path('upload/<uuid:upload_id>/', views.upload_status, name='upload_status'),
+    path('upload/<uuid:upload_id>/part/<int:index>/', views.upload_part, name='upload_part'),
+    path('upload/<uuid:upload_id>/complete/', views.complete_upload, name='complete_upload'),
+    path('users/status/', views.get_users_status, name='get_users_status'),
     path('user/<int:user_id>/status/', views.get_user_status, name='get_user_status'),
+    path('events/', views.event_stream, name='event_stream'),
     path('post/<int:post_id>/like/', views.like_post, name='like_post'),
     path('post/<int:post_id>/comment/', views.add_comment, name='add_comment'),
     path('post/<int:post_id>/comments/', views.get_comments, name='get_comments'),
@@ -24,12 +32,15 @@ urlpatterns = [
     path('unfriend/<str:username>/', views.unfriend, name='unfriend'),
     path('conversation/start/<str:username>/', views.start_conversation, name='start_conversation'),
     path('find-friends/', views.find_friends_view, name='find_friends'),
+    path('users/autocomplete/', views.autocomplete_users, name='autocomplete_users'),
+    path('search/', views.search_view, name='search'),
     path('friends/', views.all_friends_view, name='all_friends'),
     path('friends/<str:username>/', views.all_friends_view, name='all_friends'),
     
     # Notification URLs
     path('notifications/', views.notifications_view, name='notifications'),
     path('notifications/json/', views.get_notifications_json, name='get_notifications_json'),
+    path('notifications/count/', views.get_notification_count, name='get_notification_count'),
     path('notification/<int:notification_id>/read/', views.mark_notification_read, name='mark_notification_read'),
     path('notifications/mark-all-read/', views.mark_all_notifications_read, name='mark_all_notifications_read'),
     path('notification/<int:notification_id>/delete/', views.delete_notification, name='delete_notification'),
@@ -1,15 +1,21 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth import login, authenticate, logout
+from django.contrib.auth import login, authenticate, logout, get_user
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse, Http404
+from django.template.loader import render_to_string
+from asgiref.sync import sync_to_async
 from .models import (
     User, Post, Comment, Like, Friendship, FriendRequest, 
     Conversation, Message, Group, GroupMembership, GroupPost, 
-    GroupComment, GroupLike, Notification, SharedPost, Block
+    GroupComment, GroupLike, Notification, SharedPost, Block, MessageTombstone, UploadSession
 )
+from . import timeline, realtime, notifications, jobs, presence, graph, suggestions, directory, autocomplete, search, images, uploads, media, inbox, messaging, retention
+from .pagination import paginate, paginate_merged
+from .feeds import hydrate_posts, hydrate_group_posts
 
 
 def signup_view(request):
@@ -37,6 +43,8 @@ def signup_view(request):
         if 'profile_photo' in request.FILES:
             user.profile_photo = request.FILES['profile_photo']
             user.save()
+            images.process_uploads(user, 'profile_photo')
+        autocomplete.user_changed(user.id)
         
         login(request, user)
         messages.success(request, 'Account created successfully!')
@@ -53,8 +61,12 @@ def login_view(request):
         user = authenticate(request, username=username, password=password)
         if user is not None:
             login(request, user)
-            user.last_active = timezone.now()
-            user.save(update_fields=['last_active'])
+            presence.touch(user.id, force=True)
+            realtime.publish(
+                list(graph.get_graph(user.id).friends),
+                'presence',
+                {'user_id': user.id, 'is_online': True, 'status': user.get_last_active_display()}
+            )
             return redirect('home')
         else:
             messages.error(request, 'Invalid username or password')
@@ -78,51 +90,48 @@ def home_view(request):
             if image:
                 post.image = image
                 post.save()
+                images.process_uploads(post, 'image')
+            timeline.fan_out_post(post)
+            search.index_object(post)
             messages.success(request, 'Post created successfully!')
             return redirect('home')
     
-    # Get blocked user IDs
-    blocked_ids = Block.get_blocked_user_ids(request.user)
-    
-    # Get posts from user and friends (excluding blocked users)
-    friend_ids = Friendship.objects.filter(user=request.user).values_list('friend_id', flat=True)
-    posts = Post.objects.filter(
-        Q(user=request.user) | Q(user_id__in=friend_ids)
-    ).exclude(user_id__in=blocked_ids)
-    
-    # Get IDs of users who sent requests to current user
-    incoming_request_ids = FriendRequest.objects.filter(to_user=request.user).values_list('from_user_id', flat=True)
-    
-    # Get suggested users (exclude friends, users who sent requests, and blocked users)
-    suggested_users_query = User.objects.exclude(
-        id=request.user.id
-    ).exclude(
-        id__in=friend_ids
-    ).exclude(
-        id__in=incoming_request_ids
-    ).exclude(
-        id__in=blocked_ids
-    )[:5]
-    
-    # Get pending request IDs (requests sent by current user)
-    pending_request_ids = FriendRequest.objects.filter(from_user=request.user).values_list('to_user_id', flat=True)
-    
-    # Prepare suggested users with status
-    suggested_users = []
-    for user in suggested_users_query:
-        suggested_users.append({
-            'user': user,
-            'has_pending_request': user.id in pending_request_ids
-        })
+    # Get posts from user and friends (materialized timeline, already trimmed of blocked users)
+    entries, next_cursor = paginate(timeline.get_timeline(request.user), request.GET.get('cursor'), id_field='post_id')
+    posts = hydrate_posts([entry.post for entry in entries], request.user, with_comments=True)
+    
+    user_graph = graph.get_graph(request.user.id)
+    
+    # Get suggested users (friends of friends ranked by mutual friends, precomputed)
+    suggested_users = suggestions.get_suggestions(request.user, limit=5)
+    for item in suggested_users:
+        item['has_pending_request'] = user_graph.has_outgoing_request(item['user'].id)
     
     context = {
         'posts': posts,
+        'next_cursor': next_cursor,
         'user': request.user,
         'suggested_users': suggested_users
     }
     return render(request, 'index.html', context)
 
 
+@login_required
+def home_feed_json(request):
+    """Next page of the home feed for infinite scroll"""
+    entries, next_cursor = paginate(timeline.get_timeline(request.user), request.GET.get('cursor'), id_field='post_id')
+    posts = hydrate_posts([entry.post for entry in entries], request.user, with_comments=True)
+    
+    html = ''.join(
+        render_to_string('includes/post_card.html', {'post': post, 'user': request.user}, request=request)
+        for post in posts
+    )
+    return JsonResponse({
+        'html': html,
+        'next_cursor': next_cursor
+    })
+
+
 @login_required
 def profile_view(request, username=None):
     if username:
@@ -131,9 +140,10 @@ def profile_view(request, username=None):
         profile_user = request.user
     
     # Check if blocked
-    is_blocked = Block.is_blocked(request.user, profile_user)
-    has_blocked_user = Block.objects.filter(blocker=request.user, blocked=profile_user).exists()
-    is_blocked_by_user = Block.objects.filter(blocker=profile_user, blocked=request.user).exists()
+    user_graph = graph.get_graph(request.user.id)
+    is_blocked = user_graph.is_blocked(profile_user.id)
+    has_blocked_user = user_graph.has_blocked(profile_user.id)
+    is_blocked_by_user = user_graph.is_blocked_by(profile_user.id)
     
     if request.method == 'POST' and profile_user == request.user:
         # Update profile
@@ -150,30 +160,40 @@ def profile_view(request, username=None):
             profile_user.cover_photo = request.FILES['cover_photo']
         
         profile_user.save()
+        uploaded = [name for name in ('profile_photo', 'cover_photo') if name in request.FILES]
+        if uploaded:
+            images.process_uploads(profile_user, *uploaded)
+        autocomplete.user_changed(profile_user.id)
         messages.success(request, 'Profile updated successfully!')
         return redirect('profile', username=profile_user.username)
     
-    # Get posts and shared posts for profile
-    own_posts = Post.objects.filter(user=profile_user)
-    shared_posts = SharedPost.objects.filter(user=profile_user).select_related('original_post', 'original_post__user')
+    # Posts and shares for the profile, as one stream paged by (created_at, kind, id)
+    stream, next_cursor = paginate_merged({
+        'post': Post.objects.filter(user=profile_user).select_related('user'),
+        'share': SharedPost.objects.filter(user=profile_user).select_related('user', 'original_post', 'original_post__user'),
+    }, request.GET.get('cursor'))
+    hydrate_posts([item for kind, item in stream if kind == 'post'], request.user)
     
     # Get user's friends
-    friend_ids = Friendship.objects.filter(user=profile_user).values_list('friend_id', flat=True)
-    friends = User.objects.filter(id__in=friend_ids)[:6]  # Show first 6 friends
+    friend_ids = graph.get_graph(profile_user.id).friends
+    friends = User.objects.filter(id__in=friend_ids[:6])  # Show first 6 friends
     
     # Check friendship status
-    is_friend = Friendship.objects.filter(user=request.user, friend=profile_user).exists()
-    has_sent_request = FriendRequest.objects.filter(from_user=request.user, to_user=profile_user).exists()
-    received_request = FriendRequest.objects.filter(from_user=profile_user, to_user=request.user).first()
+    is_friend = user_graph.is_friend(profile_user.id)
+    has_sent_request = user_graph.has_outgoing_request(profile_user.id)
+    received_request = None
+    if user_graph.has_incoming_request(profile_user.id):
+        received_request = FriendRequest.objects.filter(from_user=profile_user, to_user=request.user).first()
     has_received_request = received_request is not None
     
     context = {
         'user': request.user,  # Explicitly add logged-in user for navbar
         'profile_user': profile_user,
-        'posts': own_posts,
-        'shared_posts': shared_posts,
+        'stream': stream,
+        'next_cursor': next_cursor,
         'friends': friends,
-        'friends_count': Friendship.objects.filter(user=profile_user).count(),
+        'friends_count': len(friend_ids),
+        'posts_count': Post.objects.filter(user=profile_user).count(),
         'is_own_profile': profile_user == request.user,
         'is_friend': is_friend,
         'has_sent_request': has_sent_request,
@@ -188,15 +208,14 @@ def profile_view(request, username=None):
 
 @login_required
 def messages_view(request):
-    # Get all conversations for current user
-    conversations = request.user.conversations.all().order_by('-updated_at')
+    # The whole conversation list comes from the user's inbox rows
+    inbox_entries = request.user.inbox.exclude(other_user=request.user).select_related('other_user').order_by('-updated_at')
     
     # Get user's friends
-    friend_ids = Friendship.objects.filter(user=request.user).values_list('friend_id', flat=True)
-    friends = User.objects.filter(id__in=friend_ids)
+    friends = User.objects.filter(id__in=graph.get_graph(request.user.id).friends)
     
     context = {
-        'conversations': conversations,
+        'inbox_entries': inbox_entries,
         'friends': friends,
         'user': request.user
     }
@@ -208,12 +227,12 @@ def conversation_view(request, conversation_id):
     conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
     
     # Get the other participant and check if blocked
-    other_user = conversation.participants.exclude(id=request.user.id).first()
-    is_blocked = Block.is_blocked(request.user, other_user) if other_user else False
+    other_user_id = messaging.other_participant_id(conversation, request.user.id)
+    is_blocked = graph.get_graph(request.user.id).is_blocked(other_user_id) if other_user_id else False
     
     if request.method == 'POST':
-        # Check if blocked before allowing message
-        if is_blocked:
+        # Check if blocked before allowing message (against the database: writes never trust a cached graph)
+        if other_user_id and Block.is_blocked(request.user.id, other_user_id):
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({'success': False, 'error': 'Cannot send messages to this user.'})
             messages.error(request, 'Cannot send messages to this user.')
@@ -222,63 +241,95 @@ def conversation_view(request, conversation_id):
         content = request.POST.get('content', '')
         attachment = request.FILES.get('attachment')
         
+        if attachment:
+            error = None
+            detected = uploads.sniff(attachment.read(uploads.SNIFF_SIZE))
+            attachment.seek(0)
+            if attachment.size > uploads.MAX_SIZE:
+                error = f'Attachments can be at most {uploads.MAX_SIZE // (1024 * 1024)} MB.'
+            elif detected is None:
+                error = 'This file type is not allowed.'
+            if error:
+                if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                    return JsonResponse({'success': False, 'error': error})
+                messages.error(request, error)
+                return redirect('conversation', conversation_id=conversation_id)
+        
         if content or attachment:
-            message = Message.objects.create(
-                conversation=conversation, 
-                sender=request.user, 
-                content=content
-            )
             if attachment:
-                message.attachment = attachment
-                message.save()
-            
-            # Update sender's last_active
-            request.user.last_active = timezone.now()
-            request.user.save(update_fields=['last_active'])
-            
-            conversation.updated_at = timezone.now()
-            conversation.save()
-            
-            # Create notification for the other user
-            if other_user:
-                Notification.create_notification(
-                    recipient=other_user,
-                    sender=request.user,
-                    notification_type='message',
-                    title=f'New message from {request.user.username}',
-                    message=content[:100] + '...' if len(content) > 100 else content,
-                    link=f'/conversation/{conversation.id}/'
+                messaging.send_message(
+                    request.user, conversation, content,
+                    attachment=attachment,
+                    attachment_name=uploads.attachment_filename(attachment.name, detected[1])
                 )
+            else:
+                messaging.send_message(request.user, conversation, content)
             
             # If AJAX request, return success
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or 'X-CSRFToken' in request.headers:
-                from django.http import JsonResponse
                 return JsonResponse({'success': True})
             
             return redirect('conversation', conversation_id=conversation_id)
     
-    messages_list = conversation.messages.all().order_by('created_at')
+    messages_list, has_older = messaging.history(conversation)
     # Mark messages as read
-    messages_list.filter(is_read=False).exclude(sender=request.user).update(is_read=True)
+    if messages_list:
+        inbox.mark_read(request.user.id, conversation.id, messages_list[-1].id)
     
     context = {
         'conversation': conversation,
         'messages': messages_list,
+        'has_older': has_older,
         'user': request.user,
-        'other_user': other_user,
+        'other_user': User.objects.filter(id=other_user_id).first() if other_user_id else None,
         'is_blocked': is_blocked
     }
     return render(request, 'conversation.html', context)
 
 
+def _int_param(request, name):
+    try:
+        return int(request.GET.get(name, ''))
+    except ValueError:
+        return None
+
+
 @login_required
 def get_messages_json(request, conversation_id):
-    from django.http import JsonResponse
+    """
+    Messages of a conversation as JSON.
+    
+    Without parameters the newest page is returned, with `has_older` set when
+    there is more; `before` (oldest message id the client has) returns the page
+    before it. Polling clients pass `after` (last message id they have) and
+    `deleted_after` (last tombstone id they have) to receive only new messages
+    and ids of deleted ones.
+    """
     conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
-    messages_list = conversation.messages.all().order_by('created_at')
+    after = _int_param(request, 'after')
+    deleted_after = _int_param(request, 'deleted_after')
     
-    # Mark messages as read
-    messages_list.filter(is_read=False).exclude(sender=request.user).update(is_read=True)
+    has_older = False
+    if after is not None:
+        messages_list = list(conversation.messages.filter(id__gt=after).select_related('sender').order_by('id'))
+    else:
+        messages_list, has_older = messaging.history(conversation, before=_int_param(request, 'before'))
+    
+    tombstones = conversation.tombstones.order_by('id')
+    if deleted_after is not None:
+        tombstones = list(tombstones.filter(id__gt=deleted_after).values_list('id', 'message_id'))
+        deleted_ids = [message_id for _, message_id in tombstones]
+        last_tombstone_id = tombstones[-1][0] if tombstones else deleted_after
+    else:
+        # Full load already reflects deletions; just hand out the current position
+        deleted_ids = []
+        last_tombstone = tombstones.last()
+        last_tombstone_id = last_tombstone.id if last_tombstone else 0
+    
+    # Mark messages as read, only when this response delivers incoming ones
+    incoming_ids = [msg.id for msg in messages_list if msg.sender_id != request.user.id]
+    if incoming_ids:
+        inbox.mark_read(request.user.id, conversation.id, incoming_ids[-1])
     
     messages_data = []
     for msg in messages_list:
@@ -286,15 +337,24 @@ def get_messages_json(request, conversation_id):
             'id': msg.id,
             'content': msg.content,
             'sender_username': msg.sender.username,
-            'sender_avatar': msg.sender.get_profile_photo_url(),
+            'sender_avatar': msg.sender.get_profile_photo_url(size=80),
             'is_own': msg.sender == request.user,
             'created_at': msg.created_at.strftime('%I:%M %p'),
             'has_attachment': bool(msg.attachment),
             'attachment_url': msg.get_attachment_url(),
+            'attachment_name': msg.get_attachment_name(),
             'is_image': msg.is_image()
         })
     
-    return JsonResponse({'messages': messages_data})
+    return JsonResponse({
+        'messages': messages_data,
+        'has_older': has_older,
+        'deleted': deleted_ids,
+        'cursor': {
+            'after': messages_list[-1].id if messages_list else (after or 0),
+            'deleted_after': last_tombstone_id
+        }
+    })
 
 
 @login_required
@@ -305,18 +365,136 @@ def delete_message(request, message_id):
         return JsonResponse({'error': 'Invalid method'}, status=400)
     
     message = get_object_or_404(Message, id=message_id, sender=request.user)
-    message.delete()
+    participant_ids = list(message.conversation.participants.values_list('id', flat=True))
+    with transaction.atomic():
+        # Syncing clients rely on the tombstone, so it and the delete land together or not at all
+        MessageTombstone.objects.create(conversation_id=message.conversation_id, message_id=message.id)
+        message.delete()
+        inbox.refresh(message.conversation)
+    
+    realtime.publish(participant_ids, 'message', {'conversation_id': message.conversation_id, 'deleted_id': message_id})
     
     return JsonResponse({'success': True})
 
 
+@login_required
+def message_attachment(request, message_id):
+    """A message's attachment, for participants of its conversation only"""
+    message = get_object_or_404(Message, id=message_id, conversation__participants=request.user)
+    if not message.attachment:
+        raise Http404
+    return media.serve_file(request, message.attachment.name, private=True, download_name=message.get_attachment_name())
+
+
+def _upload_json(session):
+    return JsonResponse({
+        'success': True,
+        'upload_id': str(session.id),
+        'chunk_size': session.chunk_size,
+        'part_count': session.part_count,
+        'received_parts': session.received_parts
+    })
+
+
+def _upload_error(error):
+    return JsonResponse({'success': False, 'error': str(error)}, status=error.status)
+
+
+@login_required
+def start_upload(request, conversation_id):
+    """Open a chunked attachment upload (POST filename, size); see core/uploads.py"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid method'}, status=400)
+    
+    conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
+    other_user_id = messaging.other_participant_id(conversation, request.user.id)
+    if other_user_id and Block.is_blocked(request.user.id, other_user_id):
+        return JsonResponse({'success': False, 'error': 'Cannot send messages to this user.'}, status=403)
+    
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid size.'}, status=400)
+    
+    try:
+        session = uploads.initiate(request.user, conversation, request.POST.get('filename', '').strip(), size)
+    except uploads.UploadError as e:
+        return _upload_error(e)
+    return _upload_json(session)
+
+
+@login_required
+def upload_status(request, upload_id):
+    """Which parts of an upload have arrived, for resuming it"""
+    session = get_object_or_404(UploadSession, id=upload_id, user=request.user)
+    return _upload_json(session)
+
+
+@login_required
+def upload_part(request, upload_id, index):
+    """Receive one part as the raw request body"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid method'}, status=400)
+    
+    session = get_object_or_404(UploadSession, id=upload_id, user=request.user)
+    try:
+        session = uploads.write_part(session, index, request)
+    except uploads.UploadError as e:
+        return _upload_error(e)
+    return _upload_json(session)
+
+
+@login_required
+def complete_upload(request, upload_id):
+    """Attach a fully uploaded file to a new message (POST optional content)"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid method'}, status=400)
+    
+    session = get_object_or_404(UploadSession.objects.select_related('conversation', 'user'), id=upload_id, user=request.user)
+    other_user_id = messaging.other_participant_id(session.conversation, request.user.id)
+    if other_user_id and Block.is_blocked(request.user.id, other_user_id):
+        return JsonResponse({'success': False, 'error': 'Cannot send messages to this user.'}, status=403)
+    
+    try:
+        message = uploads.finalize(session, request.POST.get('content', ''))
+    except uploads.UploadError as e:
+        return _upload_error(e)
+    return JsonResponse({'success': True, 'message_id': message.id})
+
+
+async def event_stream(request):
+    """Server-Sent Events stream of messages, notifications and presence (serve under ASGI)"""
+    user = await sync_to_async(get_user)(request)
+    if not user.is_authenticated:
+        return HttpResponse(status=401)
+    
+    receive = getattr(request, 'scope', {}).get(realtime.RECEIVE_SCOPE_KEY)
+    response = StreamingHttpResponse(realtime.stream(user.id, receive), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let nginx hold events back
+    return response
+
+
+@login_required
+def get_users_status(request):
+    """Presence for many users in one request: ?ids=1,2,3, or every conversation partner"""
+    ids = request.GET.get('ids')
+    if ids:
+        user_ids = [int(i) for i in ids.split(',') if i.strip().isdigit()][:500]
+    else:
+        user_ids = request.user.inbox.exclude(other_user=request.user).values_list('other_user_id', flat=True)
+    
+    return JsonResponse({'statuses': presence.statuses(user_ids)})
+
+
 @login_required
 def get_user_status(request, user_id):
-    from django.http import JsonResponse
-    user = get_object_or_404(User, id=user_id)
+    seen = presence.last_seen(user_id)
+    if seen is None:
+        raise Http404
     return JsonResponse({
-        'is_online': user.is_online(),
-        'status': user.get_last_active_display()
+        'is_online': presence.is_online(seen),
+        'status': presence.display(seen)
     })
 
 
@@ -329,22 +507,24 @@ def like_post(request, post_id):
     
     if not created:
         like.delete()
+        post.adjust_count('like_count', -1)
         liked = False
     else:
+        post.adjust_count('like_count', 1)
         liked = True
         # Create notification for post owner
         if post.user != request.user:
-            Notification.create_notification(
+            Notification.create_aggregated_notification(
                 recipient=post.user,
                 sender=request.user,
                 notification_type='post_like',
-                title=f'{request.user.username} liked your post',
+                verb='liked your post',
                 message=f'{request.user.username} liked your post.',
                 link='/',
                 related_post=post
             )
     
-    like_count = post.likes.count()
+    like_count = post.like_count
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.content_type == 'application/json':
         return JsonResponse({
@@ -366,14 +546,16 @@ def add_comment(request, post_id):
         
         if content:
             comment = Comment.objects.create(post=post, user=request.user, content=content)
+            post.adjust_count('comment_count', 1)
+            search.index_object(comment)
             
             # Create notification for post owner
             if post.user != request.user:
-                Notification.create_notification(
+                Notification.create_aggregated_notification(
                     recipient=post.user,
                     sender=request.user,
                     notification_type='post_comment',
-                    title=f'{request.user.username} commented on your post',
+                    verb='commented on your post',
                     message=f'{request.user.username} commented: "{content[:50]}..."' if len(content) > 50 else f'{request.user.username} commented: "{content}"',
                     link='/',
                     related_post=post
@@ -387,10 +569,10 @@ def add_comment(request, post_id):
                         'id': comment.id,
                         'content': comment.content,
                         'user': comment.user.username,
-                        'avatar': comment.user.get_profile_photo_url(),
+                        'avatar': comment.user.get_profile_photo_url(size=80),
                         'created_at': comment.created_at.strftime('%Y-%m-%d %H:%M:%S')
                     },
-                    'comment_count': post.comments.count()
+                    'comment_count': post.comment_count
                 })
     
     return redirect('home')
@@ -409,7 +591,7 @@ def get_comments(request, post_id):
             'id': comment.id,
             'content': comment.content,
             'user': comment.user.username,
-            'avatar': comment.user.get_profile_photo_url(),
+            'avatar': comment.user.get_profile_photo_url(size=80),
             'created_at': comment.created_at.strftime('%Y-%m-%d %H:%M:%S')
         })
     
@@ -424,7 +606,7 @@ def send_friend_request(request, username):
     to_user = get_object_or_404(User, username=username)
     
     # Check if blocked
-    if Block.is_blocked(request.user, to_user):
+    if Block.is_blocked(request.user.id, to_user.id):
         messages.error(request, 'Cannot send friend request to this user.')
         return redirect('profile', username=username)
     
@@ -467,6 +649,7 @@ def accept_friend_request(request, request_id):
     # Create friendship both ways
     Friendship.objects.create(user=request.user, friend=friend_request.from_user)
     Friendship.objects.create(user=friend_request.from_user, friend=request.user)
+    timeline.connect(request.user, friend_request.from_user)
     
     # Notify the sender that request was accepted
     Notification.create_notification(
@@ -513,6 +696,7 @@ def unfriend(request, username):
     # Delete friendship both ways
     Friendship.objects.filter(user=request.user, friend=friend_user).delete()
     Friendship.objects.filter(user=friend_user, friend=request.user).delete()
+    timeline.disconnect(request.user, friend_user)
     
     messages.success(request, f'You are no longer friends with {friend_user.username}')
     
@@ -527,57 +711,60 @@ def unfriend(request, username):
 def start_conversation(request, username):
     other_user = get_object_or_404(User, username=username)
     
-    # Check if conversation already exists
-    conversation = Conversation.objects.filter(participants=request.user).filter(participants=other_user).first()
-    
-    if not conversation:
-        conversation = Conversation.objects.create()
-        conversation.participants.add(request.user, other_user)
-    
+    conversation = Conversation.get_or_create_direct(request.user, other_user)
     return redirect('conversation', conversation_id=conversation.id)
 
 
 @login_required
 def find_friends_view(request):
-    # Get list of friend IDs
-    friend_ids = Friendship.objects.filter(user=request.user).values_list('friend_id', flat=True)
-    
-    # Get blocked user IDs
-    blocked_ids = Block.get_blocked_user_ids(request.user)
-    
-    # Get IDs of users who sent requests to current user
-    incoming_request_ids = FriendRequest.objects.filter(to_user=request.user).values_list('from_user_id', flat=True)
-    
-    # Get all users except current user, friends, users who sent requests, and blocked users
-    all_users = User.objects.exclude(
-        id=request.user.id
-    ).exclude(
-        id__in=friend_ids
-    ).exclude(
-        id__in=incoming_request_ids
-    ).exclude(
-        id__in=blocked_ids
-    )
+    user_graph = graph.get_graph(request.user.id)
+    query = request.GET.get('q', '').strip()
     
-    # Get list of users who have pending requests (sent by current user)
-    pending_request_ids = FriendRequest.objects.filter(from_user=request.user).values_list('to_user_id', flat=True)
+    # Browsing hides friends, users who sent requests, and blocked users; searching only hides the last two
+    if query:
+        exclude_ids = user_graph.blocked_ids | set(user_graph.incoming)
+    else:
+        exclude_ids = user_graph.excluded_from_suggestions()
+    page, next_cursor = directory.search_users(request.user, query, request.GET.get('cursor'), exclude_ids=exclude_ids)
     
     # Annotate users with friendship status
     users_list = []
-    for user in all_users:
-        has_pending_request = user.id in pending_request_ids
+    for user in page:
         users_list.append({
             'user': user,
-            'is_friend': False,  # Already excluded friends
-            'has_pending_request': has_pending_request
+            'is_friend': user_graph.is_friend(user.id),
+            'has_pending_request': user_graph.has_outgoing_request(user.id)
         })
     
     context = {
-        'users': users_list
+        'users': users_list,
+        'query': query,
+        'next_cursor': next_cursor
     }
     return render(request, 'find_friends.html', context)
 
 
+@login_required
+def autocomplete_users(request):
+    """Typeahead for the navbar search box"""
+    return JsonResponse({'results': autocomplete.complete(request.user, request.GET.get('q', ''))})
+
+
+@login_required
+def search_view(request):
+    """Full-text search over posts, group posts, comments and groups"""
+    query = request.GET.get('q', '').strip()
+    results, next_cursor = search.search(request.user, query, cursor=request.GET.get('cursor'))
+    
+    context = {
+        'user': request.user,
+        'query': query,
+        'results': results,
+        'next_cursor': next_cursor
+    }
+    return render(request, 'search.html', context)
+
+
 @login_required
 def all_friends_view(request, username=None):
     if username:
@@ -586,8 +773,7 @@ def all_friends_view(request, username=None):
         profile_user = request.user
     
     # Get all friends
-    friend_ids = Friendship.objects.filter(user=profile_user).values_list('friend_id', flat=True)
-    friends = User.objects.filter(id__in=friend_ids).order_by('username')
+    friends = User.objects.filter(id__in=graph.get_graph(profile_user.id).friends).order_by('username')
     
     context = {
         'profile_user': profile_user,
@@ -606,6 +792,7 @@ def delete_post(request, post_id):
         
         # Check if user owns the post
         if post.user == request.user:
+            notifications.invalidate_unread_for(Notification.objects.filter(related_post=post))
             post.delete()
             return JsonResponse({'success': True, 'message': 'Post deleted successfully'})
         else:
@@ -619,11 +806,12 @@ def delete_post(request, post_id):
 @login_required
 def notifications_view(request):
     """View all notifications"""
-    notifications = request.user.notifications.all()[:50]
-    unread_count = request.user.notifications.filter(is_read=False).count()
+    notification_list = notifications.visible(request.user).select_related('sender')[:50]
+    unread_count = notifications.get_unread_count(request.user)
     
     context = {
-        'notifications': notifications,
+        'notifications': notification_list,
+        'group_activity': notifications.get_group_activity(request.user),
         'unread_count': unread_count,
         'user': request.user
     }
@@ -633,11 +821,11 @@ def notifications_view(request):
 @login_required
 def get_notifications_json(request):
     """API endpoint to get notifications as JSON"""
-    notifications = request.user.notifications.all()[:20]
-    unread_count = request.user.notifications.filter(is_read=False).count()
+    notification_list = notifications.visible(request.user).select_related('sender')[:20]
+    unread_count = notifications.get_unread_count(request.user)
     
     notifications_data = []
-    for notif in notifications:
+    for notif in notification_list:
         notifications_data.append({
             'id': notif.id,
             'type': notif.notification_type,
@@ -645,18 +833,38 @@ def get_notifications_json(request):
             'message': notif.message,
             'link': notif.link,
             'is_read': notif.is_read,
+            'actor_count': notif.actor_count,
             'sender_username': notif.sender.username if notif.sender else None,
-            'sender_avatar': notif.sender.get_profile_photo_url() if notif.sender else None,
+            'sender_avatar': notif.sender.get_profile_photo_url(size=80) if notif.sender else None,
             'created_at': notif.created_at.strftime('%Y-%m-%d %H:%M:%S'),
             'time_ago': get_time_ago(notif.created_at)
         })
     
+    group_activity_data = []
+    for post in notifications.get_group_activity(request.user):
+        group_activity_data.append({
+            'id': post.id,
+            'group_name': post.group.name,
+            'sender_username': post.user.username,
+            'sender_avatar': post.user.get_profile_photo_url(size=80),
+            'link': f'/group/{post.group_id}/',
+            'created_at': post.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'time_ago': get_time_ago(post.created_at)
+        })
+    
     return JsonResponse({
         'notifications': notifications_data,
+        'group_activity': group_activity_data,
         'unread_count': unread_count
     })
 
 
+@login_required
+def get_notification_count(request):
+    """Cheap badge endpoint: served from the cached counter"""
+    return JsonResponse({'unread_count': notifications.get_unread_count(request.user)})
+
+
 def get_time_ago(dt):
     """Helper function to get human-readable time ago"""
     diff = timezone.now() - dt
@@ -674,8 +882,12 @@ def get_time_ago(dt):
 def mark_notification_read(request, notification_id):
     """Mark a single notification as read"""
     notification = get_object_or_404(Notification, id=notification_id, recipient=request.user)
-    notification.is_read = True
-    notification.save()
+    if not notification.is_read:
+        counted = notifications.counts_as_unread(notification)
+        notification.is_read = True
+        notification.save(update_fields=['is_read'])
+        if counted:
+            notifications.adjust_unread(request.user.id, -1)
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({'success': True})
@@ -688,7 +900,8 @@ def mark_notification_read(request, notification_id):
 @login_required
 def mark_all_notifications_read(request):
     """Mark all notifications as read"""
-    request.user.notifications.filter(is_read=False).update(is_read=True)
+    notifications.visible(request.user).filter(is_read=False).update(is_read=True)
+    notifications.reset_unread(request.user.id)
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({'success': True})
@@ -700,6 +913,8 @@ def delete_notification(request, notification_id):
     """Delete a notification"""
     notification = get_object_or_404(Notification, id=notification_id, recipient=request.user)
     notification.delete()
+    if notifications.counts_as_unread(notification):
+        notifications.adjust_unread(request.user.id, -1)
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({'success': True})
@@ -708,8 +923,8 @@ def delete_notification(request, notification_id):
 
 @login_required
 def clear_all_notifications(request):
-    """Clear all notifications"""
-    request.user.notifications.all().delete()
+    """Clear all notifications (deleted in the background)"""
+    retention.clear_all(request.user.id)
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({'success': True})
@@ -779,6 +994,8 @@ def create_group_view(request):
         if 'cover_photo' in request.FILES:
             group.cover_photo = request.FILES['cover_photo']
             group.save()
+            images.process_uploads(group, 'cover_photo')
+        search.index_object(group)
         
         # Add creator as a member with creator role
         GroupMembership.objects.create(
@@ -787,6 +1004,7 @@ def create_group_view(request):
             role='creator',
             status='approved'
         )
+        group.adjust_count('approved_member_count', 1)
         
         messages.success(request, f'Group "{name}" created successfully!')
         return redirect('group_detail', group_id=group.id)
@@ -806,10 +1024,15 @@ def group_detail_view(request, group_id):
     is_creator = group.creator == request.user
     has_pending_request = membership and membership.status == 'pending'
     
-    # Get posts if member or public group
+    # Get posts if member or public group (pinned posts lead the first page)
     posts = []
+    next_cursor = None
     if is_member or not group.is_private:
-        posts = group.posts.all()
+        cursor = request.GET.get('cursor')
+        posts, next_cursor = paginate(group.posts.filter(is_pinned=False).select_related('user'), cursor)
+        if not cursor:
+            posts = list(group.posts.filter(is_pinned=True).select_related('user')) + posts
+        hydrate_group_posts(posts, request.user, with_comments=True)
     
     # Get members (limit for display)
     members = GroupMembership.objects.filter(group=group, status='approved').select_related('user')[:12]
@@ -822,6 +1045,7 @@ def group_detail_view(request, group_id):
     context = {
         'group': group,
         'posts': posts,
+        'next_cursor': next_cursor,
         'members': members,
         'pending_requests': pending_requests,
         'is_member': is_member,
@@ -878,6 +1102,7 @@ def join_group(request, group_id):
             role='member',
             status='approved'
         )
+        group.adjust_count('approved_member_count', 1)
         messages.success(request, f'You have joined {group.name}!')
     
     return redirect('group_detail', group_id=group_id)
@@ -894,6 +1119,8 @@ def leave_group(request, group_id):
         return redirect('group_detail', group_id=group_id)
     
     membership.delete()
+    if membership.status == 'approved':
+        group.adjust_count('approved_member_count', -1)
     messages.success(request, f'You have left {group.name}')
     return redirect('groups')
 
@@ -905,6 +1132,7 @@ def delete_group(request, group_id):
     
     if request.method == 'POST':
         group_name = group.name
+        notifications.invalidate_unread_for(Notification.objects.filter(related_group=group))
         group.delete()
         messages.success(request, f'Group "{group_name}" has been deleted')
         return redirect('groups')
@@ -930,6 +1158,9 @@ def edit_group(request, group_id):
             group.cover_photo = request.FILES['cover_photo']
         
         group.save()
+        if 'cover_photo' in request.FILES:
+            images.process_uploads(group, 'cover_photo')
+        search.index_object(group)
         messages.success(request, 'Group updated successfully!')
         return redirect('group_detail', group_id=group_id)
     
@@ -954,6 +1185,7 @@ def approve_join_request(request, group_id, user_id):
     membership = get_object_or_404(GroupMembership, group=group, user_id=user_id, status='pending')
     membership.status = 'approved'
     membership.save()
+    group.adjust_count('approved_member_count', 1)
     
     # Notify the user
     Notification.create_notification(
@@ -1021,6 +1253,8 @@ def remove_member(request, group_id, user_id):
     
     user = membership.user
     membership.delete()
+    if membership.status == 'approved':
+        group.adjust_count('approved_member_count', -1)
     
     # Notify the user
     Notification.create_notification(
@@ -1152,19 +1386,12 @@ def create_group_post(request, group_id):
             if 'image' in request.FILES:
                 post.image = request.FILES['image']
                 post.save()
+                images.process_uploads(post, 'image')
             
-            # Notify group members (except the poster)
-            for membership in group.memberships.filter(status='approved').exclude(user=request.user):
-                Notification.create_notification(
-                    recipient=membership.user,
-                    sender=request.user,
-                    notification_type='group_post',
-                    title=f'New post in {group.name}',
-                    message=f'{request.user.username} posted in {group.name}',
-                    link=f'/group/{group.id}/',
-                    related_group=group,
-                    related_group_post=post
-                )
+            search.index_object(post)
+            
+            # Notify group members (except the poster) in the background
+            jobs.enqueue(notifications.fan_out_group_post, post.id)
             
             messages.success(request, 'Post created successfully!')
     
@@ -1184,6 +1411,7 @@ def delete_group_post(request, group_id, post_id):
         messages.error(request, 'You do not have permission to delete this post')
         return redirect('group_detail', group_id=group_id)
     
+    notifications.invalidate_unread_for(Notification.objects.filter(related_group_post=post))
     post.delete()
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -1224,16 +1452,18 @@ def like_group_post(request, group_id, post_id):
     
     if not created:
         like.delete()
+        post.adjust_count('like_count', -1)
         liked = False
     else:
+        post.adjust_count('like_count', 1)
         liked = True
         # Notify post owner
         if post.user != request.user:
-            Notification.create_notification(
+            Notification.create_aggregated_notification(
                 recipient=post.user,
                 sender=request.user,
                 notification_type='group_like',
-                title=f'{request.user.username} liked your post',
+                verb='liked your post',
                 message=f'{request.user.username} liked your post in {group.name}',
                 link=f'/group/{group.id}/',
                 related_group=group,
@@ -1243,7 +1473,7 @@ def like_group_post(request, group_id, post_id):
     return JsonResponse({
         'success': True,
         'liked': liked,
-        'like_count': post.likes.count()
+        'like_count': post.like_count
     })
 
 
@@ -1265,14 +1495,15 @@ def comment_group_post(request, group_id, post_id):
                 user=request.user,
                 content=content
             )
+            post.adjust_count('comment_count', 1)
             
             # Notify post owner
             if post.user != request.user:
-                Notification.create_notification(
+                Notification.create_aggregated_notification(
                     recipient=post.user,
                     sender=request.user,
                     notification_type='group_comment',
-                    title=f'{request.user.username} commented on your post',
+                    verb='commented on your post',
                     message=f'{request.user.username} commented on your post in {group.name}',
                     link=f'/group/{group.id}/',
                     related_group=group,
@@ -1286,10 +1517,10 @@ def comment_group_post(request, group_id, post_id):
                         'id': comment.id,
                         'content': comment.content,
                         'user': comment.user.username,
-                        'avatar': comment.user.get_profile_photo_url(),
+                        'avatar': comment.user.get_profile_photo_url(size=80),
                         'created_at': comment.created_at.strftime('%Y-%m-%d %H:%M:%S')
                     },
-                    'comment_count': post.comments.count()
+                    'comment_count': post.comment_count
                 })
     
     return redirect('group_detail', group_id=group_id)
@@ -1309,7 +1540,7 @@ def get_group_post_comments(request, group_id, post_id):
             'id': comment.id,
             'content': comment.content,
             'user': comment.user.username,
-            'avatar': comment.user.get_profile_photo_url(),
+            'avatar': comment.user.get_profile_photo_url(size=80),
             'created_at': comment.created_at.strftime('%Y-%m-%d %H:%M:%S')
         })
     
@@ -1329,7 +1560,7 @@ def share_post(request, post_id):
         post = get_object_or_404(Post, id=post_id)
         
         # Check if blocked
-        if Block.is_blocked(request.user, post.user):
+        if Block.is_blocked(request.user.id, post.user_id):
             return JsonResponse({'success': False, 'error': 'Cannot share this post.'})
         
         # Check if already shared
@@ -1343,14 +1574,15 @@ def share_post(request, post_id):
             original_post=post,
             caption=caption
         )
+        post.adjust_count('share_count', 1)
         
         # Create notification for original post owner
         if post.user != request.user:
-            Notification.create_notification(
+            Notification.create_aggregated_notification(
                 recipient=post.user,
                 sender=request.user,
                 notification_type='post_share',
-                title=f'{request.user.username} shared your post',
+                verb='shared your post',
                 message=caption[:100] if caption else 'Shared your post to their profile.',
                 link=f'/profile/{request.user.username}/',
                 related_post=post
@@ -1359,7 +1591,7 @@ def share_post(request, post_id):
         return JsonResponse({
             'success': True, 
             'message': 'Post shared to your profile!',
-            'share_count': post.shares.count()
+            'share_count': post.share_count
         })
     
     return JsonResponse({'success': False, 'error': 'Invalid request'})
@@ -1377,7 +1609,7 @@ def unshare_post(request, post_id):
             return JsonResponse({
                 'success': True, 
                 'message': 'Post removed from your profile.',
-                'share_count': post.shares.count()
+                'share_count': post.adjust_count('share_count', -1)
             })
         
         return JsonResponse({'success': False, 'error': 'Post not found in your shares.'})
@@ -1389,7 +1621,7 @@ def unshare_post(request, post_id):
 def get_share_count(request, post_id):
     """Get share count for a post"""
     post = get_object_or_404(Post, id=post_id)
-    return JsonResponse({'share_count': post.shares.count()})
+    return JsonResponse({'share_count': post.share_count})
 
 
 # ==================== BLOCK VIEWS ====================
@@ -1415,6 +1647,7 @@ def block_user(request, username):
             Q(user=request.user, friend=user_to_block) | 
             Q(user=user_to_block, friend=request.user)
         ).delete()
+        timeline.disconnect(request.user, user_to_block)
         
         # Remove any pending friend requests (both directions)
         FriendRequest.objects.filter(
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 import os
+import warnings
 from pathlib import Path
 import dj_database_url
 
@@ -52,6 +53,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.PresenceMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -142,9 +144,68 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads are stored once per distinct content and reference-counted (core/storage.py)
+DEFAULT_FILE_STORAGE = 'core.storage.ContentAddressedStorage'
+
+# Let the front proxy send media files: 'nginx' (X-Accel-Redirect) or 'sendfile' (X-Sendfile)
+MEDIA_ACCEL = os.environ.get('MEDIA_ACCEL') or None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Messages and notifications are kept by month (core/archive.py): archived months are
+# written here as .jsonl.gz, and on SQLite rows older than ARCHIVE_HOT_MONTHS are
+# rotated out of the live tables
+ARCHIVE_DIR = BASE_DIR / 'archives'
+ARCHIVE_HOT_MONTHS = 12
+
 # Custom user model
 AUTH_USER_MODEL = 'core.User'
 
+# Redis (optional): shared cache and real-time event relay between workers
+REDIS_URL = os.environ.get('REDIS_URL')
+
+# Cache (per-process memory locally, Redis when REDIS_URL is set)
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Social graphs (core/graph.py), presence and other invalidated state live in the cache,
+# which worker processes should share: gunicorn runs WEB_CONCURRENCY workers, and with
+# more than one and no REDIS_URL each keeps its own copy, which can lag for up to an hour
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+if WEB_CONCURRENCY > 1 and not REDIS_URL:
+    warnings.warn(
+        'WEB_CONCURRENCY > 1 without REDIS_URL: each worker caches social graphs and presence separately'
+    )
+
+# Real-time push (Server-Sent Events, served by the ASGI app)
+# Without REDIS_URL events only reach clients connected to the same worker process
+REALTIME_REDIS_URL = REDIS_URL
+REALTIME_BROKER = 'core.realtime.RedisBroker' if REDIS_URL else 'core.realtime.InProcessBroker'
+
+# In-process background jobs (core.jobs); notification fan-out for group posts
+JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', 2))
+GROUP_FANOUT_LIMIT = int(os.environ.get('GROUP_FANOUT_LIMIT', 5000))
+
+# Notification retention (core/retention.py, run by prune_notifications): days kept per
+# type, NOTIFICATION_DEFAULT_TTL_DAYS for the rest, and at most this many per user
+NOTIFICATION_TTL_DAYS = {'message': 30, 'post_like': 60, 'group_like': 60, 'post_share': 60, 'group_post': 30}
+NOTIFICATION_DEFAULT_TTL_DAYS = 180
+NOTIFICATION_MAX_PER_USER = int(os.environ.get('NOTIFICATION_MAX_PER_USER', 1000))
+
+# Presence heartbeats live in the cache; User.last_active is flushed in batches
+PRESENCE_HEARTBEAT_SECONDS = 30
+PRESENCE_FLUSH_SECONDS = 60
+
 # Login settings
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'home'
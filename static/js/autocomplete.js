@@ -0,0 +1,105 @@
+/* ==========================================================================
+   Autocomplete Module - people typeahead for the navbar search box
+   ========================================================================== */
+
+document.addEventListener('DOMContentLoaded', function() {
+    'use strict';
+
+    const input = document.querySelector('.search-input');
+    const container = document.querySelector('.search-container');
+    if (!input || !container) return;
+
+    const list = document.createElement('div');
+    list.className = 'search-suggestions';
+    list.hidden = true;
+    container.appendChild(list);
+
+    let debounceTimer = null;
+    let lastQuery = '';
+    let activeIndex = -1;
+
+    function escapeHtml(text) {
+        const div = document.createElement('div');
+        div.textContent = text;
+        return div.innerHTML;
+    }
+
+    function hide() {
+        list.hidden = true;
+        activeIndex = -1;
+    }
+
+    function render(results) {
+        if (!results.length) {
+            hide();
+            return;
+        }
+        list.innerHTML = results.map(person => {
+            let detail = person.name;
+            if (person.is_friend) {
+                detail = detail ? `${detail} · Friend` : 'Friend';
+            } else if (person.mutual_count) {
+                const mutual = `${person.mutual_count} mutual friend${person.mutual_count === 1 ? '' : 's'}`;
+                detail = detail ? `${detail} · ${mutual}` : mutual;
+            }
+            return `
+                <a class="search-suggestion" href="/profile/${encodeURIComponent(person.username)}/">
+                    <img src="${escapeHtml(person.avatar)}" alt="${escapeHtml(person.username)}">
+                    <span>
+                        <strong>${escapeHtml(person.username)}</strong>
+                        ${detail ? `<small>${escapeHtml(detail)}</small>` : ''}
+                    </span>
+                </a>`;
+        }).join('');
+        activeIndex = -1;
+        list.hidden = false;
+    }
+
+    function lookup(query) {
+        fetch(`/users/autocomplete/?q=${encodeURIComponent(query)}`)
+            .then(response => response.json())
+            .then(data => {
+                if (query === lastQuery) render(data.results);
+            })
+            .catch(error => console.error('Error fetching suggestions:', error));
+    }
+
+    input.addEventListener('input', function() {
+        clearTimeout(debounceTimer);
+        lastQuery = this.value.trim();
+        if (!lastQuery) {
+            hide();
+            return;
+        }
+        debounceTimer = setTimeout(() => lookup(lastQuery), 120);
+    });
+
+    input.addEventListener('keydown', function(e) {
+        const items = list.querySelectorAll('.search-suggestion');
+        
+        // Enter without a highlighted person runs a full-text search
+        if (e.key === 'Enter' && activeIndex < 0 && this.value.trim()) {
+            e.preventDefault();
+            window.location.href = `/search/?q=${encodeURIComponent(this.value.trim())}`;
+            return;
+        }
+        if (list.hidden || !items.length) return;
+
+        if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+            e.preventDefault();
+            const step = e.key === 'ArrowDown' ? 1 : -1;
+            activeIndex = (activeIndex + step + items.length) % items.length;
+            items.forEach((item, i) => item.classList.toggle('active', i === activeIndex));
+        } else if (e.key === 'Enter' && activeIndex >= 0) {
+            e.preventDefault();
+            e.stopImmediatePropagation();
+            window.location.href = items[activeIndex].href;
+        } else if (e.key === 'Escape') {
+            hide();
+        }
+    });
+
+    document.addEventListener('click', (e) => {
+        if (!container.contains(e.target)) hide();
+    });
+});
@@ -90,6 +90,26 @@ document.addEventListener('DOMContentLoaded', function() {
             
             if (!content && !file) return;
             
+            // Large files go up in resumable parts instead of with the form
+            if (window.ChunkedUpload && ChunkedUpload.shouldUse(file)) {
+                sendBtn.disabled = true;
+                const conversationId = window.location.pathname.split('/').filter(Boolean).pop();
+                ChunkedUpload.send(conversationId, file, content, progress => {
+                    fileSize.textContent = `Uploading… ${Math.round(progress * 100)}%`;
+                })
+                .then(() => {
+                    messageInput.value = '';
+                    clearFilePreview();
+                    location.reload();
+                })
+                .catch(error => {
+                    console.error('Error:', error);
+                    fileSize.textContent = error.message;
+                    sendBtn.disabled = false;
+                });
+                return;
+            }
+            
             const formData = new FormData(messageForm);
             
             fetch(window.location.href, {
@@ -252,19 +272,104 @@ document.addEventListener('DOMContentLoaded', function() {
         if (typeof otherUserId !== 'undefined') {
             fetch(`/user/${otherUserId}/status/`)
                 .then(response => response.json())
-                .then(data => {
-                    const statusEl = document.getElementById('chat-user-status');
-                    if (statusEl) {
-                        statusEl.textContent = data.status;
-                    }
-                })
+                .then(showUserStatus)
                 .catch(error => console.error('Error fetching status:', error));
         }
     }
 
-    // Update status immediately and every 10 seconds
+    function showUserStatus(data) {
+        const statusEl = document.getElementById('chat-user-status');
+        if (statusEl) {
+            statusEl.textContent = data.status;
+        }
+    }
+
+    document.addEventListener('realtime:presence', (e) => {
+        if (typeof otherUserId !== 'undefined' && String(e.detail.user_id) === String(otherUserId)) {
+            showUserStatus(e.detail);
+        }
+    });
+
+    // Update status immediately and every 10 seconds (every minute while presence is pushed)
     updateUserStatus();
-    setInterval(updateUserStatus, 10000);
+    let statusTicks = 0;
+    setInterval(() => {
+        statusTicks++;
+        if (!window.realtimeConnected || statusTicks % 6 === 0) {
+            updateUserStatus();
+        }
+    }, 10000);
+
+    // --- OLDER MESSAGES ---
+    document.addEventListener('click', function(e) {
+        const loadOlder = e.target.closest('#load-older');
+        if (!loadOlder) return;
+        e.preventDefault();
+        
+        fetch(`/conversation/${conversationId}/messages/?before=${loadOlder.dataset.before}`)
+            .then(response => response.json())
+            .then(data => {
+                // Keep the messages on screen where they are while older ones go in above
+                const fromBottom = messagesArea.scrollHeight - messagesArea.scrollTop;
+                const container = loadOlder.parentElement;
+                const older = document.createDocumentFragment();
+                data.messages.forEach(msg => older.appendChild(createMessageElement(msg)));
+                container.after(older);
+                if (data.has_older && data.messages.length) {
+                    loadOlder.dataset.before = data.messages[0].id;
+                } else {
+                    container.remove();
+                }
+                messagesArea.scrollTop = messagesArea.scrollHeight - fromBottom;
+            })
+            .catch(error => console.error('Error loading older messages:', error));
+    });
+
+    function createMessageElement(msg) {
+        const messageDiv = document.createElement('div');
+        messageDiv.className = `message ${msg.is_own ? 'sent' : 'received'}`;
+        
+        let bubble = '';
+        if (msg.has_attachment) {
+            if (msg.is_image) {
+                bubble += `<img src="${msg.attachment_url}" alt="Attachment" class="message-image" />`;
+            } else {
+                bubble += `<a href="${msg.attachment_url}" class="message-file" target="_blank" download>
+                    <span class="file-icon">📎</span>
+                    <span class="file-name">${escapeHtml(msg.attachment_name)}</span>
+                </a>`;
+            }
+        }
+        if (msg.content) {
+            bubble += `<p>${escapeHtml(msg.content)}</p>`;
+        }
+        
+        if (msg.is_own) {
+            messageDiv.setAttribute('data-message-id', msg.id);
+            messageDiv.innerHTML = `
+                <div class="message-content">
+                    <div class="message-bubble">${bubble}</div>
+                    <div class="message-actions">
+                        <time class="message-time">${msg.created_at}</time>
+                        <button class="message-menu-btn" data-message-id="${msg.id}" type="button">⋯</button>
+                    </div>
+                </div>`;
+        } else {
+            messageDiv.innerHTML = `
+                <img src="${msg.sender_avatar}" alt="${escapeHtml(msg.sender_username)}" class="message-avatar" />
+                <div class="message-content">
+                    <div class="message-bubble">${bubble}</div>
+                    <time class="message-time">${msg.created_at}</time>
+                </div>`;
+        }
+        return messageDiv;
+    }
+
+    function escapeHtml(text) {
+        const div = document.createElement('div');
+        div.textContent = text;
+        return div.innerHTML;
+    }
 
     // --- AUTO-SCROLL TO BOTTOM ---
     if (messagesArea) {
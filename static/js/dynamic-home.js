@@ -454,6 +454,43 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    // --- Infinite Scroll ---
+    setupInfiniteScroll();
+
+    function setupInfiniteScroll() {
+        const sentinel = document.getElementById('feed-sentinel');
+        if (!sentinel || !('IntersectionObserver' in window)) return;
+
+        let loading = false;
+        const observer = new IntersectionObserver((entries) => {
+            const cursor = sentinel.dataset.nextCursor;
+            if (!entries[0].isIntersecting || loading || !cursor) return;
+
+            loading = true;
+            fetch(`/feed/?cursor=${encodeURIComponent(cursor)}`, {
+                headers: { 'X-Requested-With': 'XMLHttpRequest' }
+            })
+            .then(response => response.json())
+            .then(data => {
+                // New cards go above the sentinel so it stays at the end of the feed
+                sentinel.insertAdjacentHTML('beforebegin', data.html);
+                if (data.next_cursor) {
+                    sentinel.dataset.nextCursor = data.next_cursor;
+                    sentinel.querySelector('a').href = `?cursor=${data.next_cursor}`;
+                } else {
+                    observer.disconnect();
+                    sentinel.remove();
+                }
+            })
+            .catch(error => console.error('Error loading more posts:', error))
+            .finally(() => {
+                loading = false;
+            });
+        }, { rootMargin: '600px' });
+
+        observer.observe(sentinel);
+    }
+
     // --- Share Post Functionality ---
     setupShareFeature();
 
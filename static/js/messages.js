@@ -13,7 +13,8 @@ document.addEventListener('DOMContentLoaded', function() {
     // --- State Variables ---
     let activeConversationId = null;
     let activeConversationData = null;
-    let statusUpdateInterval = null;
+    const presenceByUser = {};  // user id -> { is_online, status }
+    let syncCursor = null;  // { after, deleted_after } for the active conversation
 
     // --- Initialize ---
     initMessagesPage();
@@ -24,6 +25,7 @@ document.addEventListener('DOMContentLoaded', function() {
         setupConversationClicks();
         setupMessageInput();
         setupSearch();
+        startPresencePolling();
         
         // Load first conversation if exists
         const firstConv = document.querySelector('.conversation-item');
@@ -32,21 +34,70 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
-    // Update user status
-    function updateUserStatus(userId) {
-        if (!userId) return;
-        
-        fetch(`/user/${userId}/status/`)
+    // --- Presence ---
+    // One request covers every conversation partner; the sidebar dots and the
+    // chat header are both drawn from it.
+    function refreshPresence() {
+        fetch('/users/status/')
             .then(response => response.json())
             .then(data => {
-                const statusElement = document.getElementById('chat-user-status');
-                if (statusElement) {
-                    statusElement.textContent = data.status;
-                    statusElement.style.color = data.is_online ? '#31a24c' : '#65676b';
-                }
+                Object.entries(data.statuses).forEach(([userId, status]) => {
+                    applyPresence(userId, status);
+                });
             })
             .catch(error => console.error('Error fetching status:', error));
     }
+    
+    function applyPresence(userId, status) {
+        presenceByUser[userId] = status;
+        
+        document.querySelectorAll(`.conversation-item[data-user-id="${userId}"] .conversation-avatar`).forEach(avatar => {
+            let dot = avatar.querySelector('.online-indicator');
+            if (status.is_online && !dot) {
+                dot = document.createElement('span');
+                dot.className = 'online-indicator';
+                avatar.appendChild(dot);
+            } else if (!status.is_online && dot) {
+                dot.remove();
+            }
+        });
+        
+        if (activeConversationData && String(activeConversationData.userId) === String(userId)) {
+            showUserStatus(status);
+        }
+    }
+    
+    function startPresencePolling() {
+        refreshPresence();
+        
+        // Every 10 seconds, or every minute while presence is pushed so "Active Xm ago" still ages
+        let statusTicks = 0;
+        setInterval(() => {
+            statusTicks++;
+            if (!window.realtimeConnected || statusTicks % 6 === 0) {
+                refreshPresence();
+            }
+        }, 10000);
+    }
+    
+    function showUserStatus(data) {
+        const statusElement = document.getElementById('chat-user-status');
+        if (statusElement) {
+            statusElement.textContent = data.status;
+            statusElement.style.color = data.is_online ? '#31a24c' : '#65676b';
+        }
+    }
+    
+    // --- Pushed Events ---
+    document.addEventListener('realtime:message', (e) => {
+        if (activeConversationId && String(e.detail.conversation_id) === String(activeConversationId)) {
+            syncMessages(activeConversationId);
+        }
+    });
+    
+    document.addEventListener('realtime:presence', (e) => {
+        applyPresence(e.detail.user_id, e.detail);
+    });
 
     // --- Conversation Handling ---
     function setupConversationClicks() {
@@ -73,8 +124,10 @@ document.addEventListener('DOMContentLoaded', function() {
             item.classList.remove('active');
         });
         
-        // Add to current
+        // Add to current; opening it marks it read
         element.classList.add('active');
+        const badge = element.querySelector('.unread-badge');
+        if (badge) badge.remove();
     }
 
     function loadConversation(convId, userName, userAvatar, userId) {
@@ -105,27 +158,23 @@ document.addEventListener('DOMContentLoaded', function() {
         }
         if (conversationInput) conversationInput.value = convId;
 
-        // Update user status
-        updateUserStatus(userId);
-        
-        // Clear previous status update interval
-        if (statusUpdateInterval) {
-            clearInterval(statusUpdateInterval);
+        // Show the last known status until the next presence refresh
+        if (presenceByUser[userId]) {
+            showUserStatus(presenceByUser[userId]);
         }
-        
-        // Set up new status update interval (every 10 seconds)
-        statusUpdateInterval = setInterval(() => {
-            updateUserStatus(userId);
-        }, 10000);
 
         // Load messages from server
         fetchMessages(convId);
     }
 
     function fetchMessages(convId) {
+        syncCursor = null;
         fetch(`/conversation/${convId}/messages/`)
             .then(response => response.json())
             .then(data => {
+                if (convId !== activeConversationId) return;
+                syncCursor = data.cursor;
+                
                 const messagesList = document.getElementById('messages-list');
                 if (!messagesList) {
                     console.error('messages-list element not found');
@@ -141,6 +190,10 @@ document.addEventListener('DOMContentLoaded', function() {
                 dateDivider.innerHTML = '<span class="date-text">Today</span>';
                 messagesList.appendChild(dateDivider);
                 
+                if (data.has_older && data.messages.length) {
+                    messagesList.insertBefore(createLoadOlder(convId, data.messages[0].id), dateDivider);
+                }
+                
                 // Render each message
                 data.messages.forEach(msg => {
                     const messageDiv = createMessageElement(msg);
@@ -158,9 +211,79 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
     
+    // Link above the oldest loaded message that pages further back
+    function createLoadOlder(convId, beforeId) {
+        const container = document.createElement('div');
+        container.className = 'load-more';
+        container.style.cssText = 'text-align: center; padding: 16px;';
+        container.innerHTML = '<a href="#" style="color: #1877f2; text-decoration: none; font-weight: 600;">Load older messages</a>';
+        container.dataset.before = beforeId;
+        
+        container.querySelector('a').addEventListener('click', function(e) {
+            e.preventDefault();
+            fetch(`/conversation/${convId}/messages/?before=${container.dataset.before}`)
+                .then(response => response.json())
+                .then(data => {
+                    if (convId !== activeConversationId) return;
+                    const messagesArea = document.getElementById('messages-area');
+                    const fromBottom = messagesArea.scrollHeight - messagesArea.scrollTop;
+                    
+                    // The sync cursor stays as it is: these are all older than it
+                    const older = document.createDocumentFragment();
+                    data.messages.forEach(msg => older.appendChild(createMessageElement(msg)));
+                    container.nextSibling.after(older);  // Below the date divider
+                    if (data.has_older && data.messages.length) {
+                        container.dataset.before = data.messages[0].id;
+                    } else {
+                        container.remove();
+                    }
+                    messagesArea.scrollTop = messagesArea.scrollHeight - fromBottom;
+                })
+                .catch(error => console.error('Error loading older messages:', error));
+        });
+        return container;
+    }
+    
+    // Fetch only messages and deletions newer than the cursor and patch the DOM
+    function syncMessages(convId) {
+        if (!syncCursor) return Promise.resolve();
+        
+        const params = new URLSearchParams(syncCursor);
+        return fetch(`/conversation/${convId}/messages/?${params}`)
+            .then(response => response.json())
+            .then(data => {
+                if (convId !== activeConversationId) return;
+                syncCursor = data.cursor;
+                
+                const messagesList = document.getElementById('messages-list');
+                const messagesArea = document.getElementById('messages-area');
+                if (!messagesList || !messagesArea) return;
+                
+                const isAtBottom = messagesArea.scrollHeight - messagesArea.scrollTop <= messagesArea.clientHeight + 50;
+                
+                data.deleted.forEach(messageId => {
+                    const messageEl = messagesList.querySelector(`[data-message-id="${messageId}"]`);
+                    if (messageEl) messageEl.remove();
+                });
+                
+                data.messages.forEach(msg => {
+                    if (!messagesList.querySelector(`[data-message-id="${msg.id}"]`)) {
+                        messagesList.appendChild(createMessageElement(msg));
+                    }
+                });
+                
+                // Only scroll if user was already at bottom or just sent a message
+                if (data.messages.length > 0 && (isAtBottom || data.messages.some(msg => msg.is_own))) {
+                    scrollToBottom();
+                }
+            })
+            .catch(error => console.error('Error syncing messages:', error));
+    }
+    
     function createMessageElement(msg) {
         const messageDiv = document.createElement('div');
         messageDiv.className = `message ${msg.is_own ? 'sent' : 'received'}`;
+        messageDiv.setAttribute('data-message-id', msg.id);
         
         let contentHtml = '';
         
@@ -169,7 +292,7 @@ document.addEventListener('DOMContentLoaded', function() {
             if (msg.is_image) {
                 contentHtml += `<img src="${msg.attachment_url}" alt="Attachment" style="max-width: 300px; border-radius: 8px; margin-bottom: 8px; display: block;" />`;
             } else {
-                const fileName = msg.attachment_url.split('/').pop();
+                const fileName = escapeHtml(msg.attachment_name || msg.attachment_url.split('/').pop());
                 contentHtml += `<a href="${msg.attachment_url}" target="_blank" style="display: block; padding: 8px 12px; background: #f0f2f5; border-radius: 8px; text-decoration: none; color: #050505; margin-bottom: 8px;">📎 ${fileName}</a>`;
             }
         }
@@ -181,7 +304,6 @@ document.addEventListener('DOMContentLoaded', function() {
         
         if (msg.is_own) {
             messageDiv.className = `message sent`;
-            messageDiv.setAttribute('data-message-id', msg.id);
             messageDiv.innerHTML = `
                 <div class="message-content">
                     <div class="message-bubble">
@@ -310,16 +432,16 @@ document.addEventListener('DOMContentLoaded', function() {
         })
         .then(response => response.json())
         .then(data => {
-            // Always refresh messages since deletion likely succeeded
-            if (currentConversationId) {
-                fetchMessages(currentConversationId);
+            // Pick up the tombstone (and anything else that changed)
+            if (activeConversationId) {
+                syncMessages(activeConversationId);
             }
         })
         .catch(error => {
             console.error('Error deleting message:', error);
-            // Still refresh to check if it was deleted
-            if (currentConversationId) {
-                fetchMessages(currentConversationId);
+            // Still sync to check if it was deleted
+            if (activeConversationId) {
+                syncMessages(activeConversationId);
             }
         });
     };
@@ -442,29 +564,40 @@ document.addEventListener('DOMContentLoaded', function() {
             
             const content = messageInput.value.trim();
             const convId = document.getElementById('conversation-id').value;
+            const file = fileInput && fileInput.files[0];
             
-            if (!content || !convId) return;
+            if ((!content && !file) || !convId) return;
 
             // Disable send button to prevent double submit
             sendButton.disabled = true;
 
-            // Send message via AJAX
-            const formData = new FormData(messageForm);
+            let request;
+            if (window.ChunkedUpload && ChunkedUpload.shouldUse(file)) {
+                // Large files go up in resumable parts instead of with the form
+                const fileSize = document.getElementById('file-size');
+                request = ChunkedUpload.send(convId, file, content, progress => {
+                    if (fileSize) fileSize.textContent = `Uploading… ${Math.round(progress * 100)}%`;
+                });
+            } else {
+                // Send message via AJAX
+                const formData = new FormData(messageForm);
+                
+                request = fetch(`/conversation/${convId}/`, {
+                    method: 'POST',
+                    body: formData,
+                    headers: {
+                        'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value
+                    }
+                })
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error('Network response was not ok');
+                    }
+                    return response.text();
+                });
+            }
             
-            fetch(`/conversation/${convId}/`, {
-                method: 'POST',
-                body: formData,
-                headers: {
-                    'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value
-                }
-            })
-            .then(response => {
-                if (!response.ok) {
-                    throw new Error('Network response was not ok');
-                }
-                return response.text();
-            })
-            .then(() => {
+            request.then(() => {
                 // Clear input and file
                 messageInput.value = '';
                 messageInput.style.height = 'auto';
@@ -476,8 +609,8 @@ document.addEventListener('DOMContentLoaded', function() {
                     filePreview.classList.add('hidden');
                 }
                 
-                // Reload messages immediately
-                fetchMessages(convId);
+                // Pull the new message immediately
+                syncMessages(convId);
                 
                 // Update conversation preview
                 updateConversationPreview(convId, content || '📎 Attachment');
@@ -535,22 +668,10 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    // Auto-refresh messages every 3 seconds if a conversation is active
+    // Sync new messages every 3 seconds if a conversation is active and push is down
     setInterval(() => {
-        if (activeConversationId) {
-            const messagesArea = document.getElementById('messages-area');
-            if (!messagesArea) return;
-            
-            const currentScrollHeight = messagesArea.scrollHeight;
-            const currentScrollTop = messagesArea.scrollTop;
-            const isAtBottom = currentScrollHeight - currentScrollTop <= messagesArea.clientHeight + 50;
-            
-            fetchMessages(activeConversationId);
-            
-            // Only scroll if user was already at bottom
-            if (isAtBottom) {
-                setTimeout(scrollToBottom, 100);
-            }
+        if (activeConversationId && !window.realtimeConnected) {
+            syncMessages(activeConversationId);
         }
     }, 3000);
 });
@@ -0,0 +1,29 @@
+/* ==========================================================================
+   Realtime Module - Server-Sent Events push channel
+   ========================================================================== */
+
+// Re-dispatches server events on document as `realtime:<type>` CustomEvents.
+// Pages keep their polling loops as a fallback while window.realtimeConnected is false.
+(function() {
+    'use strict';
+
+    window.realtimeConnected = false;
+    if (!window.EventSource) return;
+
+    const source = new EventSource('/events/');
+
+    source.addEventListener('open', () => {
+        window.realtimeConnected = true;
+    });
+
+    // EventSource reconnects by itself; fall back to polling until it does
+    source.addEventListener('error', () => {
+        window.realtimeConnected = false;
+    });
+
+    ['message', 'notification', 'presence'].forEach(type => {
+        source.addEventListener(type, (e) => {
+            document.dispatchEvent(new CustomEvent(`realtime:${type}`, { detail: JSON.parse(e.data) }));
+        });
+    });
+})();
@@ -0,0 +1,104 @@
+/* ==========================================================================
+   Uploads Module - chunked, resumable message attachments
+   ========================================================================== */
+
+// window.ChunkedUpload.send(conversationId, file, content) uploads a file in
+// parts and posts it as a message. Parts are retried on failure, and an
+// upload id is remembered per file so a reload (or a second attempt) only
+// sends the parts the server doesn't have yet.
+(function() {
+    'use strict';
+
+    const THRESHOLD = 2 * 1024 * 1024;  // Smaller files go with the message form
+    const MAX_RETRIES = 5;
+
+    function csrfToken() {
+        const input = document.querySelector('[name=csrfmiddlewaretoken]');
+        return input ? input.value : '';
+    }
+
+    function storageKey(conversationId, file) {
+        return `upload:${conversationId}:${file.name}:${file.size}:${file.lastModified}`;
+    }
+
+    function postJson(url, body, contentType) {
+        const headers = { 'X-CSRFToken': csrfToken(), 'X-Requested-With': 'XMLHttpRequest' };
+        if (contentType) headers['Content-Type'] = contentType;
+        return fetch(url, { method: 'POST', headers: headers, body: body })
+            .then(response => response.json().then(data => {
+                if (!response.ok || data.success === false) {
+                    const error = new Error(data.error || 'Upload failed');
+                    error.status = response.status;
+                    throw error;
+                }
+                return data;
+            }));
+    }
+
+    function delay(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    // Resume a remembered upload if the server still has it, else start a new one
+    function openSession(conversationId, file) {
+        const key = storageKey(conversationId, file);
+        const uploadId = localStorage.getItem(key);
+        const start = () => {
+            const form = new FormData();
+            form.append('filename', file.name);
+            form.append('size', file.size);
+            return postJson(`/conversation/${conversationId}/uploads/`, form).then(data => {
+                localStorage.setItem(key, data.upload_id);
+                return data;
+            });
+        };
+        if (!uploadId) return start();
+        return fetch(`/upload/${uploadId}/`)
+            .then(response => response.ok ? response.json() : start())
+            .catch(start);
+    }
+
+    function sendPart(session, file, index, attempt) {
+        const begin = index * session.chunk_size;
+        const blob = file.slice(begin, Math.min(begin + session.chunk_size, file.size));
+        return postJson(`/upload/${session.upload_id}/part/${index}/`, blob, 'application/octet-stream')
+            .catch(error => {
+                // Client errors (bad type, too large) won't succeed on retry
+                if ((error.status && error.status < 500) || attempt >= MAX_RETRIES) throw error;
+                return delay(1000 * Math.pow(2, attempt)).then(() => sendPart(session, file, index, attempt + 1));
+            });
+    }
+
+    function send(conversationId, file, content, onProgress) {
+        const key = storageKey(conversationId, file);
+        return openSession(conversationId, file).then(session => {
+            const received = new Set(session.received_parts);
+            let done = received.size;
+            let chain = Promise.resolve();
+            for (let index = 0; index < session.part_count; index++) {
+                if (received.has(index)) continue;
+                chain = chain.then(() => sendPart(session, file, index, 0)).then(() => {
+                    done++;
+                    if (onProgress) onProgress(done / session.part_count);
+                });
+            }
+            return chain.then(() => {
+                const form = new FormData();
+                form.append('content', content || '');
+                return postJson(`/upload/${session.upload_id}/complete/`, form);
+            });
+        }).then(data => {
+            localStorage.removeItem(key);
+            return data;
+        }, error => {
+            if (error.status && error.status < 500) localStorage.removeItem(key);
+            throw error;
+        });
+    }
+
+    window.ChunkedUpload = {
+        THRESHOLD: THRESHOLD,
+        send: send,
+        shouldUse: file => !!file && file.size > THRESHOLD
+    };
+})();